@@ -12,56 +12,163 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 import argparse
-import asyncio
+import cProfile
 import datetime
+import io
 import logging
 import os
+import re
+import sys
+from concurrent.futures import ThreadPoolExecutor
 from datetime import timedelta
+from typing import TextIO
 
 from xdg import xdg_cache_home, xdg_data_home
 
-from .backup import Backup
-from .editor import Editor
-from .googleapi import GoogleApiService
-from .pandoc import markdown_to_task_lists, task_lists_to_markdown
+from .accounts import UserLogFilter, current_user, list_users
+from .logs import setup_logging
+from .ndjson import write_task_list
+from .profiling import profiler
+from .snapshot import ViewSnapshot, snapshot_key
 
 
 def main():
     args = parse_args()
+    users = args.users
 
-    config_dir = f"{xdg_data_home()}/gtasks-md/{args.user}/"
-    os.makedirs(os.path.dirname(config_dir), exist_ok=True)
-    cache_dir = f"{xdg_cache_home()}/gtasks-md/{args.user}/"
-    os.makedirs(os.path.dirname(cache_dir), exist_ok=True)
-
-    logging.basicConfig(
-        filename=f"{xdg_cache_home()}/gtasks-md/log.txt",
-        format="%(asctime)s %(levelname)-8s %(message)s",
-        encoding="utf-8",
-        level=logging.INFO,
-        datefmt="%Y-%m-%d %H:%M:%S",
-    )
-
-    service = GoogleApiService(
-        args.user, args.completed_after, args.completed_before, args.status
-    )
-    match args.subcommand:
-        case "auth":
-            auth(service, args.credentials_file)
-        case "edit":
-            editor = Editor(args.editor)
-            backup = Backup(args.user)
-            edit(service, editor, backup)
-        case "reconcile":
-            backup = Backup(args.user)
-            reconcile(service, args.file_path, backup)
-        case "rollback":
-            backup = Backup(args.user)
-            rollback(service, backup)
-        case "view":
-            view(service)
-        case None:
-            print("Please run one of the subcommands.")
+    for user in users:
+        config_dir = f"{xdg_data_home()}/gtasks-md/{user}/"
+        os.makedirs(os.path.dirname(config_dir), exist_ok=True)
+        cache_dir = f"{xdg_cache_home()}/gtasks-md/{user}/"
+        os.makedirs(os.path.dirname(cache_dir), exist_ok=True)
+
+    log_listener = setup_logging(f"{xdg_cache_home()}/gtasks-md/log.txt")
+    for handler in logging.getLogger().handlers:
+        handler.addFilter(UserLogFilter())
+    try:
+        profile(args, users)
+    finally:
+        log_listener.stop()
+
+
+def profile(args, users: list[str]):
+    if not (args.profile or args.profile_memory or args.profile_output):
+        run_users(args, users)
+        return
+
+    profiler.enable(trace_memory=args.profile_memory)
+    function_profile = None
+    if args.profile_output and not args.profile_output.endswith(".json"):
+        function_profile = cProfile.Profile()
+    try:
+        with profiler.phase("total"):
+            if function_profile:
+                function_profile.runcall(run_users, args, users)
+            else:
+                run_users(args, users)
+    finally:
+        if args.profile or args.profile_memory:
+            print(profiler.summary(), file=sys.stderr)
+        if function_profile:
+            function_profile.dump_stats(args.profile_output)
+        elif args.profile_output:
+            profiler.write_chrome_trace(args.profile_output)
+
+
+def run_users(args, users: list[str]):
+    if len(users) == 1:
+        run(args, users[0])
+        return
+
+    # Every account is handled in its own thread, its output is buffered and
+    # printed once all of them are done.
+    with ThreadPoolExecutor(max_workers=len(users)) as executor:
+        outputs = {user: io.StringIO() for user in users}
+        futures = {
+            user: executor.submit(run, args, user, outputs[user]) for user in users
+        }
+
+    failed = False
+    for user in users:
+        print(f"==> {user} <==")
+        try:
+            futures[user].result()
+            print(outputs[user].getvalue(), end="")
+            if args.subcommand == "reconcile":
+                print("Reconciled.")
+        except Exception as e:
+            logging.exception("Failed to %s account %s", args.subcommand, user)
+            print(f"Failed: {e}")
+            failed = True
+    if failed:
+        sys.exit(1)
+
+
+def run(args, user: str, output: TextIO | None = None):
+    current_user.set(user)
+    if args.subcommand == "view" and (args.offline or args.max_age is not None):
+        if view_snapshot(args, user, output):
+            return
+        if args.offline:
+            print("No snapshot of Tasks with these filters found", file=output)
+            return
+
+    # Imported only now, so that views of a snapshot don't import the API
+    # client and pandoc.
+    from . import commands
+
+    commands.run(args, user, output)
+
+
+def view_snapshot(args, user: str, output: TextIO | None = None) -> bool:
+    """Prints the last fetched Tasks, unless they're older than --max-age."""
+    snapshot = ViewSnapshot(user)
+    key = snapshot_key(
+        args.completed_after, args.completed_before, args.status, args.rolling_window
+    )
+    header = snapshot.read(key)
+    if not header:
+        return False
+
+    age = datetime.datetime.now().astimezone() - header.fetched_at
+    if not args.offline and age > args.max_age:
+        return False
+
+    print(
+        f"Showing Tasks fetched at {header.fetched_at:%Y-%m-%d %H:%M:%S}, "
+        f"{format_duration(age)} ago.",
+        file=sys.stderr,
+    )
+    if args.format == "ndjson":
+        output = output or sys.stdout
+        for task_list in snapshot.read_task_lists(key) or []:
+            write_task_list(task_list, output)
+    else:
+        print(header.markdown, file=output)
+    return True
+
+
+def parse_duration(duration: str) -> timedelta:
+    units = {"s": "seconds", "m": "minutes", "h": "hours", "d": "days"}
+    if duration[-1:] in units:
+        return timedelta(**{units[duration[-1]]: float(duration[:-1])})
+    return timedelta(seconds=float(duration))
+
+
+def parse_regex(pattern: str) -> str:
+    try:
+        re.compile(pattern)
+    except re.error as e:
+        raise argparse.ArgumentTypeError(f"invalid regular expression: {e}")
+    return pattern
+
+
+def format_duration(duration: timedelta) -> str:
+    seconds = int(duration.total_seconds())
+    for unit, length in (("d", 86400), ("h", 3600), ("m", 60)):
+        if seconds >= length:
+            return f"{seconds // length}{unit}"
+    return f"{seconds}s"
 
 
 def parse_args():
@@ -73,7 +180,7 @@ def parse_args():
     parser.add_argument(
         "--completed-after",
         dest="completed_after",
-        default=(datetime.datetime.now() - timedelta(days=7)).astimezone(),
+        default=None,
         help="Only show tasks completed after given date. "
         "The date must be in format YYYY-MM-DD. Defaults to one week ago.",
         type=parse_date,
@@ -86,6 +193,35 @@ def parse_args():
         "The date must be in format YYYY-MM-DD.",
         type=lambda d: parse_date(d) if d else None,
     )
+    parser.add_argument(
+        "--no-cache",
+        dest="no_cache",
+        action="store_true",
+        help="Fetch Tasks of all Task Lists, even the ones that didn't change "
+        "since the last run, and convert them without using cached results.",
+    )
+    parser.add_argument(
+        "--profile",
+        dest="profile",
+        action="store_true",
+        help="Print time spent in every phase, peak memory and counts of API "
+        "requests, bytes transferred and cache hits to stderr.",
+    )
+    parser.add_argument(
+        "--profile-memory",
+        dest="profile_memory",
+        action="store_true",
+        help="Like --profile, and also trace memory allocated by Python to "
+        "report its peak. Tracing slows everything down.",
+    )
+    parser.add_argument(
+        "--profile-output",
+        dest="profile_output",
+        default="",
+        help="Save the profile to given file. A .json file gets phases in "
+        "Chrome trace format, any other a cProfile dump of the main thread.",
+        type=str,
+    )
     parser.add_argument(
         "--status",
         dest="status",
@@ -93,14 +229,30 @@ def parse_args():
         help="Task status. One of: needsAction, completed.",
         type=str.lower,
     )
+    parser.add_argument(
+        "--transport",
+        dest="transport",
+        default="session",
+        # Keys of app.transport.TRANSPORTS, which imports the API client.
+        choices=["session", "httplib2"],
+        help="HTTP transport used to talk to Google Tasks API. "
+        "Defaults to pooled keep-alive sessions.",
+    )
     parser.add_argument(
         "--user",
         dest="user",
         default="default",
         help="Account for which the credentials are sourced. "
-        "Should match desired Google account.",
+        "Should match desired Google account. view and reconcile accept "
+        "a comma-separated list of accounts, handled concurrently.",
         type=str,
     )
+    parser.add_argument(
+        "--all-users",
+        dest="all_users",
+        action="store_true",
+        help="Run view or reconcile for all the accounts with saved credentials.",
+    )
 
     subparsers = parser.add_subparsers(dest="subcommand")
 
@@ -111,6 +263,48 @@ def parse_args():
         type=str,
     )
 
+    clear_parser = subparsers.add_parser(
+        "clear", help="Hide completed Tasks of a Task List in Google's apps."
+    )
+    clear_parser.add_argument(
+        "--list",
+        dest="task_list",
+        required=True,
+        help="Title of the Task List with the Tasks.",
+        type=str,
+    )
+    complete_parser = subparsers.add_parser(
+        "complete", help="Complete matching Tasks of a Task List."
+    )
+    add_bulk_arguments(complete_parser)
+    delete_parser = subparsers.add_parser(
+        "delete", help="Delete matching Tasks of a Task List, with their subtasks."
+    )
+    add_bulk_arguments(delete_parser)
+    move_parser = subparsers.add_parser(
+        "move", help="Move matching Tasks, with their subtasks, to another Task List."
+    )
+    add_bulk_arguments(move_parser)
+    move_parser.add_argument(
+        "--to",
+        dest="to",
+        required=True,
+        help="Title of the destination Task List.",
+        type=str,
+    )
+    rename_parser = subparsers.add_parser(
+        "rename", help="Rename matching Tasks of a Task List."
+    )
+    add_bulk_arguments(rename_parser)
+    rename_parser.add_argument(
+        "--to",
+        dest="to",
+        required=True,
+        help="Replacement of the matched part of titles, may refer to groups "
+        "of the pattern like \\1.",
+        type=str,
+    )
+
     edit_parser = subparsers.add_parser("edit", help="Edit Google Tasks.")
     edit_parser.add_argument(
         "--editor",
@@ -121,61 +315,155 @@ def parse_args():
         type=str,
     )
 
+    import_parser = subparsers.add_parser(
+        "import", help="Create Tasks from a CSV or JSONL file."
+    )
+    import_parser.add_argument(
+        "file_path",
+        help="Location of the source file. With multiple accounts, {user} in "
+        "the path is replaced with the account name. An interrupted import is "
+        "resumed when run again with the same file.",
+        type=str,
+    )
+
     reconcile_parser = subparsers.add_parser(
         "reconcile", help="Patch Task Lists with an offline source."
     )
     reconcile_parser.add_argument(
         "file_path",
-        help="Location of the source file.",
+        help="Location of the source file. With multiple accounts, {user} in "
+        "the path is replaced with the account name.",
         type=str,
     )
+    add_format_argument(reconcile_parser)
 
-    subparsers.add_parser("rollback", help="Rollback last change.")
-    subparsers.add_parser("view", help="View Google Tasks.")
-
-    return parser.parse_args()
+    subparsers.add_parser("history", help="List backups available for rollback.")
 
+    rollback_parser = subparsers.add_parser("rollback", help="Rollback last change.")
+    rollback_parser.add_argument(
+        "--to",
+        dest="to",
+        default=1,
+        help="Number of the backup to roll back to, as listed by history. "
+        "Defaults to the most recent one.",
+        type=int,
+    )
+    search_parser = subparsers.add_parser(
+        "search", help="Search Tasks fetched by the last command, offline."
+    )
+    search_parser.add_argument(
+        "query",
+        help="Words to be found in titles or notes, as prefixes.",
+        type=str,
+    )
+    search_parser.add_argument(
+        "--limit",
+        dest="limit",
+        default=20,
+        help="Maximum number of results. Defaults to 20.",
+        type=int,
+    )
+    sync_parser = subparsers.add_parser(
+        "sync", help="Keep a Markdown file in sync with Google Tasks."
+    )
+    sync_parser.add_argument(
+        "file_path",
+        help="Location of the synced file.",
+        type=str,
+    )
+    sync_parser.add_argument(
+        "--watch",
+        dest="watch",
+        action="store_true",
+        help="Keep running and sync changes made on either side.",
+    )
+    sync_parser.add_argument(
+        "--debounce",
+        dest="debounce",
+        default=None,
+        help="Seconds the file must stay unchanged before it's synced. Defaults to 1.",
+        type=float,
+    )
+    sync_parser.add_argument(
+        "--interval",
+        dest="interval",
+        default=None,
+        help="Seconds between checks for changes on the server. Defaults to 30.",
+        type=float,
+    )
+    view_parser = subparsers.add_parser("view", help="View Google Tasks.")
+    add_format_argument(view_parser)
+    view_parser.add_argument(
+        "--offline",
+        dest="offline",
+        action="store_true",
+        help="Show Tasks fetched by the last command, without connecting to "
+        "the server.",
+    )
+    view_parser.add_argument(
+        "--low-memory",
+        dest="low_memory",
+        action="store_true",
+        help="Hold a single Task List in memory at a time, at the cost of not "
+        "using the cache and not saving a snapshot for --offline.",
+    )
+    view_parser.add_argument(
+        "--max-age",
+        dest="max_age",
+        default=None,
+        help="Show Tasks fetched by the last command if they were fetched at "
+        "most this long ago, like 30s, 5m or 2h.",
+        type=parse_duration,
+    )
 
-def auth(service: GoogleApiService, file: str):
-    with open(file, "r") as src_file:
-        service.save_credentials(src_file.read())
-
-
-def view(service: GoogleApiService):
-    _, text = fetch_task_lists(service)
-    print(text)
-
-
-def edit(service: GoogleApiService, editor: Editor, backup: Backup):
-    old_task_lists, old_text = fetch_task_lists(service)
-    new_text = editor.edit(old_text)
-    new_task_lists = markdown_to_task_lists(new_text)
-    backup.write_backup(old_text)
-    asyncio.run(service.reconcile(old_task_lists, new_task_lists))
-
-
-def reconcile(service: GoogleApiService, file_path: str, backup: Backup | None = None):
-    old_task_lists, old_text = fetch_task_lists(service)
-
-    with open(file_path, "r") as source:
-        new_text = source.read()
-        new_task_lists = markdown_to_task_lists(new_text)
-        if backup:
-            backup.write_backup(old_text)
-        asyncio.run(service.reconcile(old_task_lists, new_task_lists))
+    args = parser.parse_args()
+    # The default window ends now, so it moves with every run.
+    args.rolling_window = args.completed_after is None
+    if args.rolling_window:
+        args.completed_after = (
+            datetime.datetime.now() - timedelta(days=7)
+        ).astimezone()
+    args.users = list_users() if args.all_users else args.user.split(",")
+    if not args.users:
+        parser.error("no accounts with saved credentials")
+    if len(args.users) > 1 and args.subcommand not in ("view", "import", "reconcile"):
+        parser.error("only view, import and reconcile support multiple accounts")
+    if (
+        len(args.users) > 1
+        and args.subcommand in ("import", "reconcile")
+        and "{user}" not in args.file_path
+    ):
+        parser.error("file path must contain {user} with multiple accounts")
+    return args
 
 
-def rollback(service: GoogleApiService, backup: Backup):
-    backup_file = backup.discard_backup()
-    if backup_file:
-        reconcile(service, backup_file, None)
-    else:
-        print("No backup found")
+def add_format_argument(parser: argparse.ArgumentParser):
+    parser.add_argument(
+        "--format",
+        dest="format",
+        default="markdown",
+        choices=["markdown", "ndjson"],
+        help="Format of Task Lists. ndjson has a JSON record per Task List "
+        "and Task, and doesn't need pandoc. Defaults to markdown.",
+    )
 
 
-def fetch_task_lists(service: GoogleApiService):
-    task_lists = service.fetch_task_lists()
-    return task_lists, task_lists_to_markdown(task_lists)
+def add_bulk_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument(
+        "--list",
+        dest="task_list",
+        required=True,
+        help="Title of the Task List with the Tasks.",
+        type=str,
+    )
+    parser.add_argument(
+        "--match",
+        dest="match",
+        required=True,
+        help="Regular expression searched for in titles of Tasks. Only Tasks "
+        "selected by --status and --completed-after/before are considered.",
+        type=parse_regex,
+    )
 
 
 if __name__ == "__main__":
@@ -0,0 +1,87 @@
+# Copyright 2022 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import contextlib
+import contextvars
+import logging
+import os
+import sys
+import threading
+
+try:
+    import fcntl
+except ImportError:  # Not available on Windows.
+    fcntl = None
+
+from xdg import xdg_cache_home, xdg_data_home
+
+CREDENTIALS_FILE = "credentials.json"
+
+# The account the current thread (or asyncio task) works on.
+current_user = contextvars.ContextVar("current_user", default="")
+# Accounts locked by the current thread.
+_locked = threading.local()
+
+
+def list_users() -> list[str]:
+    """Lists all the accounts that have credentials saved with `auth`."""
+    data_dir = f"{xdg_data_home()}/gtasks-md"
+    if not os.path.isdir(data_dir):
+        return []
+
+    return sorted(
+        user
+        for user in os.listdir(data_dir)
+        if os.path.isfile(f"{data_dir}/{user}/{CREDENTIALS_FILE}")
+    )
+
+
+@contextlib.contextmanager
+def account_lock(user: str):
+    """
+    Holds an exclusive lock on the cache directory of an account.
+
+    Caches, backups and the token of an account are not safe to be modified by
+    more than one process at a time, so other processes wait until the lock is
+    released. The lock is held only while these change, so it's nested within
+    a thread. Without fcntl (on Windows) nothing is locked.
+    """
+    locked = vars(_locked).setdefault("users", set())
+    if not fcntl or user in locked:
+        yield
+        return
+
+    with open(f"{xdg_cache_home()}/gtasks-md/{user}/lock", "a") as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            print(
+                f"Waiting for another process using account {user}...",
+                file=sys.stderr,
+            )
+            logging.info("Waiting for another process using account %s", user)
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        locked.add(user)
+        try:
+            yield
+        finally:
+            locked.discard(user)
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+class UserLogFilter(logging.Filter):
+    """Tags log records with the account they were logged for."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.user = current_user.get() or "-"
+        return True
@@ -0,0 +1,168 @@
+# Copyright 2022 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import json
+import sqlite3
+from dataclasses import dataclass
+from datetime import UTC, datetime
+
+from xdg import xdg_cache_home
+
+from . import database
+from .cache import FetchQuery, strip_task
+from .tasks import TaskStatus
+
+SCHEMA_VERSION = 1
+
+SCHEMA = """
+CREATE TABLE task_lists (
+    id TEXT PRIMARY KEY,
+    covered_min TEXT NOT NULL,
+    synced TEXT NOT NULL
+);
+CREATE TABLE tasks (
+    task_list_id TEXT NOT NULL,
+    id TEXT NOT NULL,
+    completed TEXT NOT NULL,
+    item TEXT NOT NULL,
+    PRIMARY KEY (task_list_id, id)
+) WITHOUT ROWID;
+CREATE INDEX tasks_by_completed ON tasks (task_list_id, completed);
+"""
+
+
+@dataclass
+class ArchivedTaskList:
+    """Describes which completed Tasks of a Task List are archived"""
+
+    # Tasks completed since this time are archived, all of them if empty.
+    covered_min: str
+    # The `updated` timestamp of the Task List when it was last synced.
+    synced: str
+
+    def covers(self, query: FetchQuery) -> bool:
+        return not self.covered_min or bool(
+            query.completed_min and _utc(query.completed_min) >= _utc(self.covered_min)
+        )
+
+
+class CompletedArchive:
+    """
+    Stores completed Tasks of every Task List as they are fetched.
+
+    Completed Tasks rarely change, so once a Task List is archived only the
+    Tasks updated since its last sync are fetched, with `updatedMin`. Tasks
+    completed within any window that starts after the archived one are read
+    from the archive, only the ones in the window are loaded.
+    """
+
+    def __init__(self, user: str):
+        self.path = f"{xdg_cache_home()}/gtasks-md/{user}/archive.sqlite"
+
+    def task_lists(self) -> dict[str, ArchivedTaskList]:
+        with self._connect() as conn:
+            return {
+                id: ArchivedTaskList(covered_min, synced)
+                for id, covered_min, synced in conn.execute(
+                    "SELECT id, covered_min, synced FROM task_lists"
+                )
+            }
+
+    def replace(
+        self, task_list_id: str, items: list[dict], covered_min: str, synced: str
+    ):
+        """Archives all the completed Tasks, as returned by the API."""
+        with self._connect() as conn:
+            conn.execute("DELETE FROM tasks WHERE task_list_id = ?", (task_list_id,))
+            _upsert(conn, task_list_id, items)
+            conn.execute(
+                "INSERT OR REPLACE INTO task_lists VALUES (?, ?, ?)",
+                (task_list_id, covered_min, synced),
+            )
+
+    def update(self, task_list_id: str, items: list[dict], synced: str):
+        """
+        Applies Tasks updated since the last sync, as returned by the API.
+
+        Tasks that were deleted or are no longer completed are removed.
+        """
+        with self._connect() as conn:
+            removed = [
+                (task_list_id, item["id"])
+                for item in items
+                if item.get("deleted")
+                or item.get("status") != TaskStatus.COMPLETED.value
+            ]
+            conn.executemany(
+                "DELETE FROM tasks WHERE task_list_id = ? AND id = ?", removed
+            )
+            _upsert(conn, task_list_id, items)
+            conn.execute(
+                "UPDATE task_lists SET synced = ? WHERE id = ?", (synced, task_list_id)
+            )
+
+    def read(self, task_list_id: str, query: FetchQuery) -> list[dict]:
+        """Returns archived Tasks completed within the window of the query."""
+        clauses = ["task_list_id = ?"]
+        params = [task_list_id]
+        if query.completed_min:
+            clauses.append("completed >= ?")
+            params.append(_utc(query.completed_min))
+        if query.completed_max:
+            clauses.append("completed <= ?")
+            params.append(_utc(query.completed_max))
+
+        with self._connect() as conn:
+            return [
+                json.loads(item)
+                for (item,) in conn.execute(
+                    f"SELECT item FROM tasks WHERE {' AND '.join(clauses)}", params
+                )
+            ]
+
+    def prune(self, task_list_ids: set[str]):
+        """Drops Task Lists other than the given ones."""
+        with self._connect() as conn:
+            database.prune_task_lists(conn, task_list_ids, _delete_task_list)
+
+    def _connect(self):
+        return database.connect(self.path, SCHEMA, SCHEMA_VERSION)
+
+
+def _delete_task_list(conn: sqlite3.Connection, task_list_id: str):
+    conn.execute("DELETE FROM tasks WHERE task_list_id = ?", (task_list_id,))
+    conn.execute("DELETE FROM task_lists WHERE id = ?", (task_list_id,))
+
+
+def _upsert(conn: sqlite3.Connection, task_list_id: str, items: list[dict]):
+    conn.executemany(
+        "INSERT OR REPLACE INTO tasks VALUES (?, ?, ?, ?)",
+        [
+            (
+                task_list_id,
+                item["id"],
+                _utc(item["completed"]) if item.get("completed") else "",
+                json.dumps(strip_task(item), separators=(",", ":")),
+            )
+            for item in items
+            if not item.get("deleted")
+            and item.get("status") == TaskStatus.COMPLETED.value
+        ],
+    )
+
+
+def _utc(value: str) -> str:
+    # Timestamps are compared as strings, so they must share a time zone.
+    return (
+        datetime.fromisoformat(value).astimezone(UTC).isoformat(timespec="microseconds")
+    )
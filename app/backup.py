@@ -11,46 +11,330 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
+import difflib
+import hashlib
+import json
+import logging
+import os
+import threading
+import zlib
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from datetime import datetime
 from pathlib import Path
 
 from xdg import xdg_cache_home
 
+from .tasks import Task, TaskList, TaskStatus
+
+MAX_ENTRIES = 500
+# Every that many snapshots one is stored in full, so restoring a snapshot
+# never applies more deltas than that.
+MAX_DELTA_CHAIN = 20
+LEGACY_SLOTS = 10
+
+
+@dataclass
+class BackupEntry:
+    """A single snapshot in the backup history"""
+
+    hash: str
+    time: str
+    size: int
+    # Hash of the Task Lists the Markdown was rendered from, with their IDs.
+    snapshot: str = ""
+
 
 class Backup:
     """
     Handles all backup-related functionality.
+
+    Snapshots are stored content-addressed under backups/objects, each as a
+    zlib-compressed line delta against the previous snapshot, or in full once
+    the chain of deltas gets MAX_DELTA_CHAIN long. backups/history.json lists
+    up to MAX_ENTRIES snapshots, the most recent last. Every file is written
+    atomically.
+
+    Along with the Markdown a snapshot may hold the Task Lists it was rendered
+    from, stored the same way as JSON with one Task per line, so these can be
+    restored by ID without parsing the Markdown.
+
+    Snapshots are written by a background thread, call close to wait for them.
     """
 
     def __init__(self, user):
         self.user = user
+        self.cache_dir = f"{xdg_cache_home()}/gtasks-md/{user}"
+        self.backup_dir = f"{self.cache_dir}/backups"
+        self._lock = threading.Lock()
+        self._executor = None
+        self._writes: list[Future] = []
 
-    def write_backup(self, text: str):
-        cache_dir = f"{xdg_cache_home()}/gtasks-md/{self.user}"
-        marker_file_path = Path(f"{cache_dir}/marker")
+    def write_backup(self, text: str, task_lists: list[TaskList] | None = None):
+        """Schedules storing text and task_lists as the most recent snapshot."""
+        # Serialized right away, as the Task Lists may change once this returns.
+        snapshot = _task_lists_to_json(task_lists) if task_lists is not None else ""
+        with self._lock:
+            if not self._executor:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=1, thread_name_prefix="backup"
+                )
+            self._writes.append(
+                self._executor.submit(self._write_backup, text, snapshot)
+            )
 
-        marker_file_path.touch()
-        with marker_file_path.open("r+") as marker_file:
-            marker = marker_file.read()
-            file_no = (int(marker) + 1 if marker else 0) % 10
-            marker_file.seek(0)
-            marker_file.write(str(file_no))
-            marker_file.truncate()
+    def history(self) -> list[BackupEntry]:
+        """Returns the stored snapshots, the most recent first."""
+        self.flush()
+        return list(reversed(self._read_history()))
 
-            with open(f"{cache_dir}/{file_no}.bak.md", "w") as backup_file:
-                backup_file.write(text)
+    def read_backup(self, n: int = 1) -> str | None:
+        """Returns the n-th most recent snapshot."""
+        entries = self.history()
+        if not 1 <= n <= len(entries):
+            return None
+        return self._read_object(entries[n - 1].hash)
+
+    def read_snapshot(self, n: int = 1) -> list[TaskList] | None:
+        """Returns Task Lists of the n-th most recent snapshot, if stored."""
+        entries = self.history()
+        if not 1 <= n <= len(entries) or not entries[n - 1].snapshot:
+            return None
+        return _task_lists_from_json(self._read_object(entries[n - 1].snapshot))
 
-    def discard_backup(self):
-        cache_dir = f"{xdg_cache_home()}/gtasks-md/{self.user}"
-        marker_file_path = Path(f"{cache_dir}/marker")
+    def discard_backup(self, n: int = 1) -> str | None:
+        """
+        Removes the n most recent snapshots from history.
 
-        if not marker_file_path.is_file():
+        Returns the path of a file holding the last removed snapshot, so it can
+        be reconciled with.
+        """
+        text = self.read_backup(n)
+        if text is None:
             return None
 
-        with marker_file_path.open("r+") as marker_file:
-            marker = marker_file.read()
-            file_no = ((int(marker) if marker else 0)) % 10
-            marker_file.seek(0)
-            marker_file.write(str(file_no - 1))
-            marker_file.truncate()
+        path = f"{self.backup_dir}/rollback.md"
+        _write_atomically(path, text.encode("utf-8"))
+        self.truncate_history(n)
+        return path
+
+    def write_recovery(self, text: str) -> str:
+        """Saves text that couldn't be reconciled, returns the path of its file."""
+        os.makedirs(self.backup_dir, exist_ok=True)
+        path = f"{self.backup_dir}/recovered.md"
+        _write_atomically(path, text.encode("utf-8"))
+        return path
+
+    def truncate_history(self, n: int = 1):
+        """Removes the n most recent snapshots from history."""
+        self.flush()
+        entries = self._read_history()[:-n]
+        self._write_history(entries)
+        self._collect_garbage(entries)
+
+    def flush(self):
+        """Waits for the scheduled snapshots to be stored."""
+        with self._lock:
+            writes, self._writes = self._writes, []
+        for write in writes:
+            write.result()
+
+    def close(self):
+        self.flush()
+        with self._lock:
+            if self._executor:
+                self._executor.shutdown()
+                self._executor = None
+
+    def _write_backup(self, text: str, snapshot: str = ""):
+        os.makedirs(f"{self.backup_dir}/objects", exist_ok=True)
+        entries = self._read_history()
+        previous = entries[-1] if entries else None
+
+        entries.append(
+            BackupEntry(
+                self._write_object(text, previous.hash if previous else ""),
+                datetime.now().astimezone().isoformat(timespec="seconds"),
+                len(text.encode("utf-8")),
+                self._write_object(snapshot, previous.snapshot if previous else "")
+                if snapshot
+                else "",
+            )
+        )
+        self._write_history(entries[-MAX_ENTRIES:])
+        if len(entries) > MAX_ENTRIES:
+            self._collect_garbage(entries[-MAX_ENTRIES:])
+
+    def _read_history(self) -> list[BackupEntry]:
+        self._migrate_legacy_backups()
+        try:
+            with open(f"{self.backup_dir}/history.json", "r") as history_file:
+                return [BackupEntry(**entry) for entry in json.load(history_file)]
+        except (OSError, ValueError, TypeError):
+            return []
+
+    def _write_history(self, entries: list[BackupEntry]):
+        os.makedirs(self.backup_dir, exist_ok=True)
+        _write_atomically(
+            f"{self.backup_dir}/history.json",
+            json.dumps([asdict(entry) for entry in entries]).encode(),
+        )
+
+    def _write_object(self, text: str, base_hash: str) -> str:
+        text_hash = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        if os.path.exists(self._object_path(text_hash)):
+            return text_hash
+
+        obj = {"text": text, "depth": 0}
+        if base_hash:
+            base = self._read_object_data(base_hash)
+            if base["depth"] + 1 < MAX_DELTA_CHAIN:
+                obj = {
+                    "base": base_hash,
+                    "depth": base["depth"] + 1,
+                    "delta": _diff(self._read_object(base_hash), text),
+                }
+        _write_atomically(
+            self._object_path(text_hash), zlib.compress(json.dumps(obj).encode())
+        )
+        return text_hash
+
+    def _read_object(self, object_hash: str) -> str:
+        # Collect the chain of deltas down to a full snapshot and replay it.
+        chain = []
+        obj = self._read_object_data(object_hash)
+        while "text" not in obj:
+            chain.append(obj["delta"])
+            obj = self._read_object_data(obj["base"])
+
+        text = obj["text"]
+        for delta in reversed(chain):
+            text = _patch(text, delta)
+        return text
+
+    def _read_object_data(self, object_hash: str) -> dict:
+        with open(self._object_path(object_hash), "rb") as object_file:
+            return json.loads(zlib.decompress(object_file.read()))
+
+    def _object_path(self, object_hash: str) -> str:
+        return f"{self.backup_dir}/objects/{object_hash}"
+
+    def _collect_garbage(self, entries: list[BackupEntry]):
+        reachable = set()
+        for entry in entries:
+            for object_hash in (entry.hash, entry.snapshot):
+                while object_hash and object_hash not in reachable:
+                    reachable.add(object_hash)
+                    object_hash = self._read_object_data(object_hash).get("base")
+
+        for path in Path(f"{self.backup_dir}/objects").iterdir():
+            if path.name not in reachable:
+                path.unlink(missing_ok=True)
+
+    def _migrate_legacy_backups(self):
+        """Moves backups kept in the ring of numbered files into the history."""
+        marker_path = Path(f"{self.cache_dir}/marker")
+        if not marker_path.is_file():
+            return
+
+        # The marker points at the most recent backup, the ones written later
+        # have been rolled back already.
+        marker = marker_path.read_text()
+        newest = Path(f"{self.cache_dir}/{int(marker or 0) % LEGACY_SLOTS}.bak.md")
+        paths = [
+            Path(f"{self.cache_dir}/{file_no}.bak.md")
+            for file_no in range(LEGACY_SLOTS)
+        ]
+        paths = [path for path in paths if path.is_file()]
+        if newest.is_file():
+            paths = [
+                path for path in paths if path.stat().st_mtime <= newest.stat().st_mtime
+            ]
+        else:
+            paths = []
+        paths.sort(key=lambda path: path.stat().st_mtime)
+
+        logging.info("Migrating %d backups to %s", len(paths), self.backup_dir)
+        marker_path.unlink()
+        for path in paths:
+            self._write_backup(path.read_text())
+        for file_no in range(LEGACY_SLOTS):
+            Path(f"{self.cache_dir}/{file_no}.bak.md").unlink(missing_ok=True)
+
+
+def _task_lists_to_json(task_lists: list[TaskList]) -> str:
+    def task_to_lines(task: Task, depth: int):
+        fields = asdict(task)
+        del fields["subtasks"]
+        fields["depth"] = depth
+        lines.append(json.dumps(fields, ensure_ascii=False))
+        for subtask in task.subtasks:
+            task_to_lines(subtask, depth + 1)
+
+    lines = []
+    for task_list in task_lists:
+        lines.append(
+            json.dumps(
+                {"id": task_list.id, "title": task_list.title}, ensure_ascii=False
+            )
+        )
+        for task in task_list.tasks:
+            task_to_lines(task, 0)
+    return "".join(f"{line}\n" for line in lines)
+
+
+def _task_lists_from_json(text: str) -> list[TaskList]:
+    task_lists = []
+    # Subtask lists of the most recent Task on every depth.
+    parents = []
+    for line in text.splitlines():
+        fields = json.loads(line)
+        if "depth" not in fields:
+            task_lists.append(TaskList(fields["id"], fields["title"], []))
+            parents = [task_lists[-1].tasks]
+            continue
+
+        depth = fields.pop("depth")
+        task = Task(**fields, subtasks=[])
+        task.status = TaskStatus(task.status)
+        parents[depth].append(task)
+        parents[depth + 1 :] = [task.subtasks]
+    return task_lists
+
+
+def _diff(old: str, new: str) -> list:
+    """
+    Returns a line delta turning old into new.
+
+    The delta is a list of [start, end] ranges of old lines to copy and lists of
+    new lines to insert.
+    """
+    old_lines = old.splitlines(keepends=True)
+    new_lines = new.splitlines(keepends=True)
+    delta = []
+    matcher = difflib.SequenceMatcher(None, old_lines, new_lines)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            delta.append([i1, i2])
+        elif j1 < j2:
+            delta.append(new_lines[j1:j2])
+    return delta
+
+
+def _patch(old: str, delta: list) -> str:
+    old_lines = old.splitlines(keepends=True)
+    new_lines = []
+    for op in delta:
+        match op:
+            case [int(start), int(end)]:
+                new_lines += old_lines[start:end]
+            case [*lines]:
+                new_lines += lines
+    return "".join(new_lines)
+
 
-            return f"{cache_dir}/{file_no}.bak.md"
+def _write_atomically(path: str, content: bytes):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as tmp_file:
+        tmp_file.write(content)
+    os.replace(tmp_path, path)
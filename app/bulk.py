@@ -0,0 +1,143 @@
+# Copyright 2022 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Operations on a set of Tasks of a single Task List.
+
+Unlike edit and reconcile, these fetch only the affected Task List and never
+render or parse Markdown. Tasks are selected by a regular expression searched
+for in their titles, and changed with batched requests.
+"""
+
+import logging
+import re
+import time
+from enum import Enum
+
+from .googleapi import GoogleApiService, is_conflict
+from .logs import log_op
+from .tasks import TaskStatus
+
+
+class BulkOp(Enum):
+    COMPLETE = "complete"
+    DELETE = "delete"
+    MOVE = "move"
+    RENAME = "rename"
+
+
+def bulk_update(
+    service: GoogleApiService,
+    task_list_title: str,
+    pattern: str,
+    op: BulkOp,
+    to: str = "",
+) -> tuple[int, int]:
+    """
+    Applies the operation to Tasks whose titles match the pattern.
+
+    `to` is the title of the destination Task List for MOVE, and the
+    replacement (which may refer to groups of the pattern) for RENAME.
+    Returns numbers of changed and failed Tasks.
+    """
+    regex = re.compile(pattern)
+    task_list_id = service.find_task_list(task_list_title)
+    destination_id = service.find_task_list(to) if op == BulkOp.MOVE else ""
+    if destination_id == task_list_id:
+        return 0, 0
+
+    all_items = service.fetch_task_items(task_list_id)
+    items = [item for item in all_items if regex.search(item.get("title", ""))]
+    if op in (BulkOp.DELETE, BulkOp.MOVE):
+        # Subtasks are deleted and moved along with their parents.
+        items = _drop_descendants(all_items, items)
+
+    def create_request(item):
+        tasks = service.tasks()
+        match op:
+            case BulkOp.COMPLETE:
+                if item.get("status") == TaskStatus.COMPLETED.value:
+                    return None
+                body = {"status": TaskStatus.COMPLETED.value}
+                return tasks.patch(tasklist=task_list_id, task=item["id"], body=body)
+            case BulkOp.DELETE:
+                return tasks.delete(tasklist=task_list_id, task=item["id"])
+            case BulkOp.MOVE:
+                return tasks.move(
+                    tasklist=task_list_id,
+                    task=item["id"],
+                    destinationTasklist=destination_id,
+                )
+            case BulkOp.RENAME:
+                title = regex.sub(to, item["title"])
+                if title == item["title"]:
+                    return None
+                body = {"title": title}
+                return tasks.patch(tasklist=task_list_id, task=item["id"], body=body)
+
+    changed = failed = 0
+
+    def create_callback(item):
+        def callback(request_id, response, exception):
+            nonlocal changed, failed
+            del request_id, response
+            if is_conflict(exception):
+                failed += 1
+                level, msg = logging.WARNING, "Kept Task %s as it changed on the server"
+            elif exception:
+                failed += 1
+                level, msg = logging.ERROR, "Failed to change Task %s: %s"
+            else:
+                changed += 1
+                level, msg = logging.INFO, "Changed Task %s"
+            args = (exception,) if exception and not is_conflict(exception) else ()
+            log_op(
+                level,
+                f"task.{op.value}",
+                msg,
+                item["title"],
+                *args,
+                task_id=item["id"],
+                started=started,
+            )
+
+        return callback
+
+    requests = []
+    for item in items:
+        request = create_request(item)
+        if request is None:
+            continue
+        # Like in reconcile, only patches and deletes are conditional.
+        if item.get("etag") and op != BulkOp.MOVE:
+            request.headers["If-Match"] = item["etag"]
+        requests.append((request, create_callback(item)))
+
+    started = time.perf_counter()
+    service.execute_in_batches(requests)
+    return changed, failed
+
+
+def _drop_descendants(all_items: list[dict], items: list[dict]) -> list[dict]:
+    id_to_parent = {item["id"]: item.get("parent", "") for item in all_items}
+    selected_ids = {item["id"] for item in items}
+
+    def has_selected_ancestor(item):
+        parent_id = id_to_parent.get(item["id"], "")
+        while parent_id:
+            if parent_id in selected_ids:
+                return True
+            parent_id = id_to_parent.get(parent_id, "")
+        return False
+
+    return [item for item in items if not has_selected_ancestor(item)]
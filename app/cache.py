@@ -0,0 +1,161 @@
+# Copyright 2022 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from __future__ import annotations
+
+import json
+import os
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+
+from xdg import xdg_cache_home
+
+# Only these fields of a fetched Task are needed to rebuild the Task tree.
+TASK_FIELDS = (
+    "id",
+    "etag",
+    "title",
+    "notes",
+    "position",
+    "status",
+    "parent",
+    "completed",
+)
+
+
+@dataclass
+class FetchQuery:
+    """Describes which Tasks of a Task List were requested from the server"""
+
+    pending: bool
+    completed: bool
+    completed_min: str = ""
+    completed_max: str = ""
+
+    def covers(self, other: FetchQuery) -> bool:
+        """Checks whether Tasks fetched with this query satisfy the other one."""
+        if other.pending and not self.pending:
+            return False
+        if not other.completed:
+            return True
+        if not self.completed:
+            return False
+        if self.completed_min and (
+            not other.completed_min
+            or _parse_time(other.completed_min) < _parse_time(self.completed_min)
+        ):
+            return False
+        return not (
+            self.completed_max
+            and (
+                not other.completed_max
+                or _parse_time(other.completed_max) > _parse_time(self.completed_max)
+            )
+        )
+
+    def statuses(self) -> list[bool]:
+        """Lists which Tasks are requested, False for pending, True for completed."""
+        return [
+            completed
+            for completed, requested in ((False, self.pending), (True, self.completed))
+            if requested
+        ]
+
+    def matches_completed(self, item: dict) -> bool:
+        """Checks whether a completed Task falls into the requested window."""
+        completed = item.get("completed", "")
+        if not completed:
+            return not self.completed_min and not self.completed_max
+
+        completed_at = _parse_time(completed)
+        if self.completed_min and completed_at < _parse_time(self.completed_min):
+            return False
+        return not (
+            self.completed_max and completed_at > _parse_time(self.completed_max)
+        )
+
+
+@dataclass
+class CachedTaskList:
+    """Tasks of a Task List as they were fetched at its `updated` time"""
+
+    title: str
+    updated: str
+    query: FetchQuery
+    pending: list[dict] = field(default_factory=list)
+    completed: list[dict] = field(default_factory=list)
+
+    def items(self, query: FetchQuery) -> list[dict]:
+        """Returns the stored Tasks that the given query would fetch."""
+        items = list(self.pending) if query.pending else []
+        if query.completed:
+            items += [i for i in self.completed if query.matches_completed(i)]
+        return items
+
+
+class TaskListCache:
+    """
+    Stores the last fetched Tasks of every Task List.
+
+    Every Task List carries an `updated` timestamp. As long as it doesn't
+    change, the Tasks stored for that Task List can be used instead of fetching
+    them again.
+    """
+
+    def __init__(self, user):
+        self.user = user
+
+    def read(self) -> dict[str, CachedTaskList]:
+        try:
+            with open(self._path(), "r") as cache_file:
+                entries = json.load(cache_file)
+        except (OSError, ValueError):
+            return {}
+
+        cached_task_lists = {}
+        for task_list_id, entry in entries.items():
+            try:
+                cached_task_lists[task_list_id] = CachedTaskList(
+                    entry["title"],
+                    entry["updated"],
+                    FetchQuery(**entry["query"]),
+                    entry["pending"],
+                    entry["completed"],
+                )
+            except (KeyError, TypeError):
+                continue
+        return cached_task_lists
+
+    def write(self, cached_task_lists: dict[str, CachedTaskList]):
+        path = self._path()
+        entries = {
+            task_list_id: asdict(cached_task_list)
+            for task_list_id, cached_task_list in cached_task_lists.items()
+        }
+
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as cache_file:
+            json.dump(entries, cache_file)
+        os.replace(tmp_path, path)
+
+    def _path(self):
+        return f"{xdg_cache_home()}/gtasks-md/{self.user}/task_lists.json"
+
+
+def strip_task(item: dict) -> dict:
+    """Drops fields of a fetched Task that aren't needed to rebuild it."""
+    return {key: item[key] for key in TASK_FIELDS if key in item}
+
+
+def _parse_time(value: str) -> datetime:
+    return datetime.fromisoformat(value)
@@ -0,0 +1,437 @@
+# Copyright 2022 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Subcommands, which need the API client and pandoc."""
+
+import asyncio
+import contextlib
+import functools
+import io
+import logging
+import re
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from typing import TextIO
+
+from .accounts import account_lock, current_user
+from .archive import CompletedArchive
+from .backup import Backup
+from .bulk import BulkOp, bulk_update
+from .cache import TaskListCache
+from .editor import Editor
+from .fragments import FragmentCache
+from .googleapi import GoogleApiService
+from .importer import Importer
+from .merge import merge_task_lists
+from .ndjson import read_task_lists, write_task_list
+from .pandoc import (
+    header_to_markdown,
+    join_markdown,
+    markdown_to_task_lists,
+    task_list_to_markdown,
+    task_lists_to_markdown,
+)
+from .profiling import profiler
+from .search import SearchIndex
+from .snapshot import ViewSnapshot, snapshot_key
+from .sync import DEFAULT_DEBOUNCE, DEFAULT_REMOTE_INTERVAL, FileSync
+from .transport import TRANSPORTS
+
+# Subcommands that change Tasks on the server, so the view snapshot is stale.
+WRITING_SUBCOMMANDS = {
+    "clear",
+    "complete",
+    "delete",
+    "edit",
+    "import",
+    "move",
+    "reconcile",
+    "rename",
+    "rollback",
+    "sync",
+}
+
+
+# Subcommands that only read local state, and long running ones which lock the
+# account only while they change it.
+UNLOCKED_SUBCOMMANDS = {"edit", "history", "search", "sync"}
+
+
+@contextlib.contextmanager
+def writing(user: str):
+    """Locks the account while Tasks change, the view snapshot is then stale."""
+    with account_lock(user):
+        try:
+            yield
+        finally:
+            ViewSnapshot(user).delete()
+
+
+def run(args, user: str, output: TextIO | None = None):
+    current_user.set(user)
+    index = SearchIndex(user)
+    service = GoogleApiService(
+        user,
+        args.completed_after,
+        args.completed_before,
+        args.status,
+        None if args.no_cache else TaskListCache(user),
+        TRANSPORTS[args.transport],
+        index,
+        None if args.no_cache else CompletedArchive(user),
+    )
+    fragments = None if args.no_cache else FragmentCache(user)
+    backup = Backup(user)
+    if args.subcommand in UNLOCKED_SUBCOMMANDS:
+        lock = contextlib.nullcontext()
+    else:
+        lock = account_lock(user)
+    with lock:
+        if args.subcommand in WRITING_SUBCOMMANDS:
+            # Only view writes a snapshot, which it can't do while the lock
+            # is held, so it's dropped once before the Tasks change.
+            ViewSnapshot(user).delete()
+        try:
+            match args.subcommand:
+                case "auth":
+                    auth(service, args.credentials_file)
+                case "clear":
+                    clear(service, args.task_list, output)
+                case "complete" | "delete" | "move" | "rename":
+                    bulk(service, args, output)
+                case "edit":
+                    editor = Editor(args.editor)
+                    edit(service, editor, backup, fragments, output)
+                case "history":
+                    history(backup, output)
+                case "import":
+                    file_path = args.file_path.replace("{user}", user)
+                    import_file(service, file_path, output)
+                case "reconcile":
+                    file_path = args.file_path.replace("{user}", user)
+                    reconcile(service, file_path, backup, fragments, args.format)
+                case "rollback":
+                    rollback(service, backup, fragments, args.to, output)
+                case "search":
+                    search(index, args.query, args.limit, output)
+                case "sync":
+                    sync(service, args, backup, fragments, output)
+                case "view":
+                    key = snapshot_key(
+                        args.completed_after,
+                        args.completed_before,
+                        args.status,
+                        args.rolling_window,
+                    )
+                    view(
+                        service,
+                        fragments,
+                        output,
+                        args.format,
+                        args.low_memory,
+                        key,
+                    )
+                case None:
+                    print("Please run one of the subcommands.", file=output)
+        finally:
+            backup.close()
+            if fragments:
+                fragments.close()
+
+
+def auth(service: GoogleApiService, file: str):
+    with open(file, "r") as src_file:
+        service.save_credentials(src_file.read())
+
+
+def view(
+    service: GoogleApiService,
+    fragments: FragmentCache | None = None,
+    output: TextIO | None = None,
+    format: str = "markdown",
+    low_memory: bool = False,
+    key: str = "",
+):
+    if format == "ndjson":
+        # Every task list is written as soon as it's fetched.
+        output = output or sys.stdout
+        service.fetch_task_lists(
+            lambda task_list: write_task_list(task_list, output), low_memory
+        )
+        return
+
+    if low_memory:
+        view_low_memory(service, fragments, output or sys.stdout)
+        return
+
+    task_lists, text = fetch_task_lists(service, fragments)
+    ViewSnapshot(service.user).write(key, task_lists, text)
+    print(text, file=output)
+
+
+def view_low_memory(
+    service: GoogleApiService, fragments: FragmentCache | None, output: TextIO
+):
+    # Task lists are rendered one at a time as they are fetched, and only their
+    # Markdown is kept until they can be written in order. No snapshot is
+    # written, as it holds all the task lists.
+    sections = {}
+
+    def render(task_list):
+        with profiler.phase("render"):
+            sections[task_list.id] = task_list_to_markdown(task_list, fragments)
+
+    with profiler.phase("fetch"):
+        task_lists = service.fetch_task_lists(render, low_memory=True)
+    output.write(header_to_markdown(fragments))
+    for task_list in task_lists:
+        output.write("\n")
+        output.write(sections.pop(task_list.id))
+    output.write("\n")
+
+
+def clear(
+    service: GoogleApiService, task_list_title: str, output: TextIO | None = None
+):
+    try:
+        task_list_id = service.find_task_list(task_list_title)
+    except ValueError as e:
+        print(f"{e}.", file=output)
+        return
+    service.clear_task_list(task_list_id)
+    print(f"Cleared completed Tasks of {task_list_title}.", file=output)
+
+
+def bulk(service: GoogleApiService, args, output: TextIO | None = None):
+    op = BulkOp(args.subcommand)
+    try:
+        changed, failed = bulk_update(
+            service, args.task_list, args.match, op, getattr(args, "to", "")
+        )
+    except re.error as e:
+        print(f"Invalid regular expression {args.match}: {e}.", file=output)
+        return
+    except ValueError as e:
+        # A Task List not found.
+        print(f"{e}.", file=output)
+        return
+    print(f"Changed {changed} Tasks.", file=output)
+    if failed:
+        print(f"Failed to change {failed} Tasks, see the log for details.", file=output)
+
+
+def edit(
+    service: GoogleApiService,
+    editor: Editor,
+    backup: Backup,
+    fragments: FragmentCache | None = None,
+    output: TextIO | None = None,
+):
+    def parse(text):
+        with profiler.phase("parse"):
+            return markdown_to_task_lists(text, cache=fragments)
+
+    with profiler.phase("read_cache"):
+        snapshot = service.read_cached_task_lists()
+    if snapshot is None:
+        with account_lock(service.user):
+            old_task_lists, old_text = fetch_task_lists(service, fragments)
+        new_task_lists = editor.edit_until_valid(old_text, parse, output)
+    else:
+        # Edit the last fetched state while the current one is being fetched.
+        with profiler.phase("connect"):
+            service.connect()
+        with ThreadPoolExecutor(max_workers=1) as executor:
+
+            def fetch_current():
+                with profiler.phase("fetch"), account_lock(service.user):
+                    return service.fetch_task_lists()
+
+            fetch = executor.submit(fetch_current)
+            with profiler.phase("render"):
+                snapshot_text = task_lists_to_markdown(snapshot, fragments)
+            new_task_lists = editor.edit_until_valid(snapshot_text, parse, output)
+            try:
+                old_task_lists = fetch.result()
+            except Exception:
+                # The edited text is gone with the editor's file, so the fetch
+                # is retried, and the edit is saved if that fails too.
+                logging.warning("Failed to fetch Task Lists, retrying", exc_info=True)
+                try:
+                    old_task_lists = fetch_current()
+                except Exception:
+                    path = backup.write_recovery(
+                        task_lists_to_markdown(new_task_lists, fragments)
+                    )
+                    print(
+                        f"Failed to fetch Task Lists, the edit is saved in {path}. "
+                        "Run reconcile with it to apply it.",
+                        file=output,
+                    )
+                    raise
+
+        if old_task_lists == snapshot:
+            old_text = snapshot_text
+        else:
+            print(
+                "Task Lists changed on the server while editing, merging changes.",
+                file=output,
+            )
+            with profiler.phase("merge"):
+                new_task_lists, conflicts = merge_task_lists(
+                    snapshot, new_task_lists, old_task_lists
+                )
+            for conflict in conflicts:
+                print(f"Conflict: {conflict}", file=output)
+            with profiler.phase("render"):
+                old_text = task_lists_to_markdown(old_task_lists, fragments)
+
+    with writing(service.user):
+        backup.write_backup(old_text, old_task_lists)
+        backup.flush()
+        with profiler.phase("reconcile"):
+            asyncio.run(service.reconcile(old_task_lists, new_task_lists))
+
+
+def reconcile(
+    service: GoogleApiService,
+    file_path: str,
+    backup: Backup | None = None,
+    fragments: FragmentCache | None = None,
+    format: str = "markdown",
+):
+    if format == "ndjson":
+        with profiler.phase("fetch"):
+            old_task_lists = service.fetch_task_lists()
+        with open(file_path, "r") as source, profiler.phase("parse"):
+            new_task_lists = read_task_lists(source, file_path)
+        if backup:
+            old_text = io.StringIO()
+            for task_list in old_task_lists:
+                write_task_list(task_list, old_text)
+            backup.write_backup(old_text.getvalue(), old_task_lists)
+        with profiler.phase("reconcile"):
+            asyncio.run(service.reconcile(old_task_lists, new_task_lists))
+        return
+
+    old_task_lists, old_text = fetch_task_lists(service, fragments)
+
+    with open(file_path, "r") as source:
+        new_text = source.read()
+        with profiler.phase("parse"):
+            new_task_lists = markdown_to_task_lists(
+                new_text, cache=fragments, filename=file_path
+            )
+        if backup:
+            backup.write_backup(old_text, old_task_lists)
+        with profiler.phase("reconcile"):
+            asyncio.run(service.reconcile(old_task_lists, new_task_lists))
+
+
+def import_file(
+    service: GoogleApiService, file_path: str, output: TextIO | None = None
+):
+    with profiler.phase("import"):
+        created, skipped = Importer(service, service.user).run(file_path)
+    print(f"Imported {created} Tasks.", file=output)
+    if skipped:
+        print(f"Skipped {skipped} Tasks imported before.", file=output)
+
+
+def history(backup: Backup, output: TextIO | None = None):
+    entries = backup.history()
+    if not entries:
+        print("No backup found", file=output)
+    for i, entry in enumerate(entries, start=1):
+        print(f"{i:>4}  {entry.time}  {entry.size:>9} bytes", file=output)
+
+
+def rollback(
+    service: GoogleApiService,
+    backup: Backup,
+    fragments: FragmentCache | None = None,
+    to: int = 1,
+    output: TextIO | None = None,
+):
+    # Task Lists stored along with the backup are restored by ID, without
+    # rendering or parsing any Markdown.
+    snapshot = backup.read_snapshot(to)
+    if snapshot is not None:
+        backup.truncate_history(to)
+        with profiler.phase("fetch"):
+            current_task_lists = service.fetch_task_lists()
+        with profiler.phase("reconcile"):
+            asyncio.run(service.reconcile(current_task_lists, snapshot))
+        return
+
+    backup_file = backup.discard_backup(to)
+    if backup_file:
+        reconcile(service, backup_file, None, fragments)
+    else:
+        print("No backup found", file=output)
+
+
+def search(index: SearchIndex, query: str, limit: int, output: TextIO | None = None):
+    results = index.search(query, limit)
+    if not results:
+        print("No matching Tasks found", file=output)
+    for result in results:
+        print(result, file=output)
+
+
+def sync(
+    service: GoogleApiService,
+    args,
+    backup: Backup | None = None,
+    fragments: FragmentCache | None = None,
+    output: TextIO | None = None,
+):
+    file_sync = FileSync(
+        service,
+        args.file_path,
+        backup,
+        fragments,
+        DEFAULT_DEBOUNCE if args.debounce is None else args.debounce,
+        DEFAULT_REMOTE_INTERVAL if args.interval is None else args.interval,
+        output=output,
+        lock=functools.partial(writing, service.user),
+    )
+    if not args.watch:
+        file_sync.start()
+        return
+
+    try:
+        file_sync.run()
+    except KeyboardInterrupt:
+        pass
+
+
+def fetch_task_lists(service: GoogleApiService, fragments: FragmentCache | None = None):
+    # Every task list is rendered as soon as it's fetched, so rendering
+    # overlaps with fetching the remaining ones.
+    with ThreadPoolExecutor() as executor, profiler.phase("fetch"):
+        header = executor.submit(header_to_markdown, fragments)
+        id_to_section = {}
+
+        def render_task_list(task_list):
+            with profiler.phase("render"):
+                return task_list_to_markdown(task_list, fragments)
+
+        def render(task_list):
+            id_to_section[task_list.id] = executor.submit(render_task_list, task_list)
+
+        task_lists = service.fetch_task_lists(render)
+        sections = [header.result()]
+        sections += [id_to_section[task_list.id].result() for task_list in task_lists]
+
+    return task_lists, join_markdown(sections)
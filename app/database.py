@@ -0,0 +1,63 @@
+# Copyright 2022 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""SQLite databases that cache what's on the server."""
+
+import contextlib
+import sqlite3
+from collections.abc import Callable
+
+
+@contextlib.contextmanager
+def connect(path: str, schema: str, version: int):
+    """
+    Opens the database and yields its connection within a transaction.
+
+    The version of the schema is stored in the database. Whenever the stored
+    one differs, which happens when the schema changes, the database holds
+    nothing that can be reused, so it's built from scratch.
+    """
+    conn = sqlite3.connect(path)
+    try:
+        (stored_version,) = conn.execute("PRAGMA user_version").fetchone()
+        if stored_version != version:
+            with conn:
+                _drop_tables(conn)
+                conn.executescript(schema)
+                conn.execute(f"PRAGMA user_version = {version}")
+        with conn:
+            yield conn
+    finally:
+        conn.close()
+
+
+def prune_task_lists(
+    conn: sqlite3.Connection,
+    task_list_ids: set[str],
+    delete_task_list: Callable[[sqlite3.Connection, str], None],
+):
+    """Deletes Task Lists of the task_lists table other than the given ones."""
+    for (task_list_id,) in conn.execute("SELECT id FROM task_lists").fetchall():
+        if task_list_id not in task_list_ids:
+            delete_task_list(conn, task_list_id)
+
+
+def _drop_tables(conn: sqlite3.Connection):
+    # Virtual tables go first, as they drop their shadow tables along.
+    for virtual in (True, False):
+        for (table,) in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' "
+            "AND name NOT LIKE 'sqlite_%' AND (sql LIKE 'CREATE VIRTUAL %') = ?",
+            (virtual,),
+        ).fetchall():
+            conn.execute(f'DROP TABLE "{table}"')
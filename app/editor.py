@@ -13,7 +13,18 @@
 # limitations under the License.
 import os
 import subprocess
+import sys
 import tempfile
+from collections.abc import Callable
+from typing import TextIO, TypeVar
+
+from .profiling import profiler
+
+T = TypeVar("T")
+
+# Marks a line the text couldn't be parsed at, removed before parsing again.
+ERROR_MARK = "<!-- gtasks-md error: "
+ERROR_MARK_END = " -->"
 
 
 class Editor:
@@ -55,3 +66,55 @@ class Editor:
 
         os.remove(tmp_file)
         return out
+
+    def edit_until_valid(
+        self, text: str, parse: Callable[[str], T], output: TextIO | None = None
+    ) -> T:
+        """
+        Edit given text until it can be parsed.
+
+        When parse raises SyntaxError, the error is printed to output (stderr
+        by default) and the editor is opened again with the edited text and
+        the error marked above the line it points at, so that nothing needs to
+        be fetched again and no edits are lost. Leaving the marked text
+        unchanged gives up and raises the error.
+        """
+        error = None
+        while True:
+            with profiler.phase("editor"):
+                edited = self.edit(text)
+            if error and edited == text:
+                raise error
+            try:
+                return parse(strip_error_marks(edited))
+            except SyntaxError as e:
+                error = e
+                print(
+                    f"{e.filename}:{e.lineno}:{e.offset}: {e.msg}",
+                    file=output or sys.stderr,
+                )
+                text = mark_error(strip_error_marks(edited), e)
+
+
+def mark_error(text: str, error: SyntaxError) -> str:
+    """Inserts a comment describing the error above the line it points at."""
+    lines = text.splitlines(keepends=True)
+    line = min(max((error.lineno or 1) - 1, 0), len(lines))
+    location = f"line {error.lineno}: " if error.lineno else ""
+    msg = " ".join(error.msg.split()).replace("--", "- -")
+    if line and not lines[line - 1].endswith("\n"):
+        # The mark after the last line must be on a line of its own.
+        lines[line - 1] += "\n"
+    lines.insert(line, f"{ERROR_MARK}{location}{msg}{ERROR_MARK_END}\n")
+    return "".join(lines)
+
+
+def strip_error_marks(text: str) -> str:
+    return "".join(
+        line for line in text.splitlines(keepends=True) if not _is_error_mark(line)
+    )
+
+
+def _is_error_mark(line: str) -> bool:
+    line = line.rstrip("\n")
+    return line.startswith(ERROR_MARK) and line.endswith(ERROR_MARK_END)
@@ -0,0 +1,173 @@
+# Copyright 2022 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+import pandoc
+from xdg import xdg_cache_home
+
+from .profiling import profiler
+
+DEFAULT_MAX_SIZE = 64 * 1024 * 1024
+
+
+class FragmentCache:
+    """
+    Disk-backed cache of Pandoc conversions keyed by a hash of their input.
+
+    Notes, titles and rendered sections rarely change between runs, so most of
+    them can be converted without starting pandoc. New entries and the use of
+    existing ones are kept in memory until flush is called, which stores them
+    in a single transaction and evicts the least recently used entries once the
+    cache grows over max_size bytes.
+    """
+
+    def __init__(self, user, max_size: int = DEFAULT_MAX_SIZE):
+        self.path = f"{xdg_cache_home()}/gtasks-md/{user}/fragments.sqlite"
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._connection = None
+        self._pending = {}
+        self._used = set()
+
+    def read(self, text: str):
+        """Same as pandoc.read(text)."""
+        key = _key("read", text)
+        value = self._get(key)
+        if value is not None:
+            return pandoc.read_json_v2(json.loads(value))
+
+        profiler.count("pandoc reads")
+        doc = pandoc.read(text)
+        self._put(key, json.dumps(pandoc.write_json_v2(doc)))
+        return doc
+
+    def write(self, doc, options: list[str] | None = None) -> str:
+        """Same as pandoc.write(doc, options=options)."""
+        source = json.dumps(pandoc.write_json_v2(doc))
+        key = _key("write", " ".join(options or []), source)
+        value = self._get(key)
+        if value is None:
+            profiler.count("pandoc writes")
+            value = pandoc.write(doc, options=options)
+            self._put(key, value)
+        return value
+
+    def flush(self):
+        with self._lock:
+            if not self._pending and not self._used:
+                return
+
+            now = time.time()
+            try:
+                connection = self._connect()
+                with connection:
+                    connection.executemany(
+                        "INSERT OR REPLACE INTO fragments VALUES (?, ?, ?, ?)",
+                        [
+                            (key, value, len(value.encode("utf-8")), now)
+                            for key, value in self._pending.items()
+                        ],
+                    )
+                    connection.executemany(
+                        "UPDATE fragments SET used = ? WHERE key = ?",
+                        [(now, key) for key in self._used],
+                    )
+                    connection.execute(
+                        "DELETE FROM fragments WHERE key IN ("
+                        "  SELECT key FROM ("
+                        "    SELECT key, SUM(size) OVER (ORDER BY used DESC) AS total"
+                        "    FROM fragments"
+                        "  ) WHERE total > ?"
+                        ")",
+                        (self.max_size,),
+                    )
+            except sqlite3.Error as e:
+                logging.warning("Failed to update fragment cache %s: %s", self.path, e)
+
+            self._pending.clear()
+            self._used.clear()
+
+    def close(self):
+        self.flush()
+        with self._lock:
+            if self._connection:
+                self._connection.close()
+                self._connection = None
+
+    def _get(self, key: str) -> str | None:
+        with self._lock:
+            if key in self._pending:
+                return self._pending[key]
+
+            try:
+                row = (
+                    self._connect()
+                    .execute("SELECT value FROM fragments WHERE key = ?", (key,))
+                    .fetchone()
+                )
+            except sqlite3.Error as e:
+                logging.warning("Failed to read fragment cache %s: %s", self.path, e)
+                return None
+
+            if row is None:
+                profiler.count("fragment cache misses")
+                return None
+            profiler.count("fragment cache hits")
+            self._used.add(key)
+            return row[0]
+
+    def _put(self, key: str, value: str):
+        with self._lock:
+            self._pending[key] = value
+
+    def _connect(self) -> sqlite3.Connection:
+        if not self._connection:
+            self._connection = sqlite3.connect(
+                self.path, timeout=30, check_same_thread=False
+            )
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS fragments ("
+                "  key TEXT PRIMARY KEY,"
+                "  value TEXT NOT NULL,"
+                "  size INTEGER NOT NULL,"
+                "  used REAL NOT NULL"
+                ")"
+            )
+        return self._connection
+
+    # Only the location is sent to worker processes, which open their own
+    # connection.
+    def __getstate__(self):
+        return {"path": self.path, "max_size": self.max_size}
+
+    def __setstate__(self, state):
+        self.path = state["path"]
+        self.max_size = state["max_size"]
+        self._lock = threading.Lock()
+        self._connection = None
+        self._pending = {}
+        self._used = set()
+
+
+def _key(*parts: str) -> str:
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
@@ -14,7 +14,10 @@
 import asyncio
 import logging
 import os
+import time
 from collections import defaultdict
+from collections.abc import AsyncIterator, Callable
+from dataclasses import dataclass, replace
 from datetime import datetime
 from enum import Enum, auto
 
@@ -22,12 +25,57 @@ from google.auth.transport.requests import Request
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
 from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
+from googleapiclient.http import HttpRequest
 from xdg import xdg_cache_home, xdg_data_home
 
+from .accounts import CREDENTIALS_FILE
+from .archive import CompletedArchive
+from .cache import CachedTaskList, FetchQuery, TaskListCache, strip_task
+from .logs import log_op
+from .merge import merge_tasks
+from .profiling import profiler
+from .search import SearchIndex
 from .tasks import Task, TaskList, TaskStatus
+from .transport import SessionHttp
 
-CREDENTIALS_FILE = "credentials.json"
 SCOPES = ["https://www.googleapis.com/auth/tasks"]
+# Maximum number of requests sent in a single batch by bulk operations.
+MAX_BATCH_SIZE = 100
+# Number of tasks requested per page.
+PAGE_SIZE = 100
+
+
+@dataclass
+class StreamedTask:
+    """A Task yielded by `iter_tasks`, along with where it belongs"""
+
+    task_list: TaskList
+    parent_id: str
+    task: Task
+
+
+class ChangeOp(Enum):
+    INSERT = auto()
+    PATCH = auto()
+    DELETE = auto()
+    MOVE = auto()
+
+
+@dataclass
+class Change:
+    """
+    A single change of a Task applied by `apply`.
+
+    Inserts and moves place the Task under `parent_id` after `previous_id`,
+    or first at the top level if these are empty.
+    """
+
+    op: ChangeOp
+    task_list_id: str
+    task: Task
+    parent_id: str = ""
+    previous_id: str = ""
 
 
 # https://googleapis.github.io/google-api-python-client/docs/dyn/tasks_v1.html
@@ -38,11 +86,21 @@ class GoogleApiService:
         completed_after: datetime | None,
         completed_before: datetime | None,
         task_status: TaskStatus,
+        cache: TaskListCache | None = None,
+        transport=SessionHttp,
+        index: SearchIndex | None = None,
+        archive: CompletedArchive | None = None,
     ):
         self.user = user
         self.completed_after = completed_after
         self.completed_before = completed_before
         self.task_status = TaskStatus(task_status) if task_status else None
+        self.cache = cache
+        self.transport = transport
+        self.index = index
+        self.archive = archive
+        # The `updated` timestamps of Task Lists listed by the last fetch.
+        self.fetched_updates: dict[str, str] = {}
         self._service = None
 
     def tasks(self):
@@ -67,16 +125,42 @@ class GoogleApiService:
         it's ID was set to be removed then it's reconciled (updated) instead.
         Otherwise such task list is marked to be added. In the end the order of
         items is restored. Items that have the same old and new state are
-        skipped. All the items are matched based on title.
+        skipped. New items that carry an ID of an old item (like the ones
+        restored from a backup) are matched with it, all the other items are
+        matched based on title.
+
+        Tasks are patched and deleted only if they didn't change on the server
+        since they were fetched (based on their etag). Otherwise the old, new
+        and server state of a patched task are merged, while a deleted task is
+        kept.
         """
 
         def gen_tasklist_ops():
+            id_to_old_task_list = {
+                task_list.id: task_list for task_list in old_task_lists
+            }
+            matched_ids = {
+                task_list.id
+                for task_list in new_task_lists
+                if task_list.id in id_to_old_task_list
+            }
+
+            ops = []
             task_list_to_op = {}
             for task_list in old_task_lists:
-                task_list_to_op[task_list.title] = (ReconcileOp.DELETE, task_list)
+                if task_list.id not in matched_ids:
+                    task_list_to_op[task_list.title] = (ReconcileOp.DELETE, task_list)
 
             for task_list in new_task_lists:
-                if task_list.title in task_list_to_op:
+                if task_list.id in matched_ids:
+                    ops.append(
+                        (
+                            ReconcileOp.UPDATE,
+                            id_to_old_task_list[task_list.id],
+                            task_list,
+                        )
+                    )
+                elif task_list.title in task_list_to_op:
                     task_list_to_op[task_list.title] = (
                         ReconcileOp.UPDATE,
                         task_list_to_op[task_list.title][1],
@@ -85,27 +169,62 @@ class GoogleApiService:
                 else:
                     task_list_to_op[task_list.title] = (ReconcileOp.INSERT, task_list)
 
-            return list(task_list_to_op.values())
+            return ops + list(task_list_to_op.values())
 
         async def apply_task_list_op(op):
             match op:
                 case (ReconcileOp.DELETE, task_list):
+                    started = time.perf_counter()
                     self.task_lists().delete(tasklist=task_list.id).execute()
-                    logging.info(f"Deleted Task List {task_list.title}")
+                    log_op(
+                        logging.INFO,
+                        "task_list.delete",
+                        "Deleted Task List %s",
+                        task_list.title,
+                        task_id=task_list.id,
+                        started=started,
+                    )
 
                 case (ReconcileOp.INSERT, task_list):
+                    started = time.perf_counter()
                     response = (
-                        self.task_lists().insert(body=task_list.to_request()).execute()
+                        self.task_lists()
+                        .insert(body=replace(task_list, id="").to_request())
+                        .execute()
+                    )
+                    log_op(
+                        logging.INFO,
+                        "task_list.insert",
+                        "Inserted Task List %s",
+                        task_list.title,
+                        task_id=response["id"],
+                        started=started,
                     )
                     reconcile_tasks(response["id"], [], task_list.tasks)
-                    logging.info(f"Inserted Task List {task_list.title}")
 
                 case (ReconcileOp.UPDATE, old_task_list, new_task_list):
+                    if old_task_list.title != new_task_list.title:
+                        started = time.perf_counter()
+                        self.task_lists().patch(
+                            tasklist=old_task_list.id,
+                            body=replace(
+                                new_task_list, id=old_task_list.id
+                            ).to_request(),
+                        ).execute()
+                        log_op(
+                            logging.INFO,
+                            "task_list.patch",
+                            "Renamed Task List %s to %s",
+                            old_task_list.title,
+                            new_task_list.title,
+                            task_id=old_task_list.id,
+                            started=started,
+                        )
                     if old_task_list != new_task_list:
                         reconcile_tasks(
                             old_task_list.id, old_task_list.tasks, new_task_list.tasks
                         )
-                        logging.info(f"Updated Task List {old_task_list.title}")
+                        logging.info("Updated Task List %s", old_task_list.title)
 
         def reconcile_tasks(task_list_id, old_tasks, new_tasks, parent_task_id=""):
             updated_tasks = apply_task_ops(
@@ -117,6 +236,8 @@ class GoogleApiService:
             completed_tasks = []
             incompleted_tasks = []
             for task in updated_tasks:
+                if not task.id:
+                    continue  # Its insert failed
                 if task.completed():
                     completed_tasks.append(task)
                 else:
@@ -134,84 +255,190 @@ class GoogleApiService:
             return updated_tasks
 
         def apply_task_ops(ops, new_tasks, task_list_id):
-            def delete_callback(task_title):
+            def delete_callback(task):
                 def callback(request_id, response, exception):
                     del request_id, response
-                    if exception:
-                        logging.error(f"Failed to delete task {task_title}")
+                    if is_conflict(exception):
+                        level = logging.WARNING
+                        msg = "Kept Task %s as it changed on the server"
+                    elif exception:
+                        level, msg = logging.ERROR, "Failed to delete Task %s"
                     else:
-                        logging.info(f"Deleted Task {task_title}")
+                        level, msg = logging.INFO, "Deleted Task %s"
+                    log_op(
+                        level,
+                        "task.delete",
+                        msg,
+                        task.title,
+                        task_id=task.id,
+                        started=started,
+                    )
 
                 return callback
 
             def insert_callback(task, idx):
                 def callback(_, response, exception):
                     if exception:
-                        logging.error(f"Failed to insert task {task.title}")
+                        log_op(
+                            logging.ERROR,
+                            "task.insert",
+                            "Failed to insert Task %s",
+                            task.title,
+                            started=started,
+                        )
+                        return
 
                     task_id = response["id"]
                     new_tasks[idx].id = task_id  # Needed for fix_task_order
+                    log_op(
+                        logging.INFO,
+                        "task.insert",
+                        "Inserted Task %s",
+                        task.title,
+                        task_id=task_id,
+                        started=started,
+                    )
 
                     updated_subtasks = reconcile_tasks(
                         task_list_id, [], task.subtasks, task_id
                     )
                     new_tasks[idx].subtasks = updated_subtasks
-                    logging.info(f"Inserted Task {task.title}")
 
                 return callback
 
             def update_callback(old_task, new_task, idx):
                 def callback(request_id, response, exception):
                     del request_id, response
+                    if is_conflict(exception):
+                        conflicted_ops.append((old_task, new_task, idx))
+                        return
                     if exception:
-                        logging.error(f"Failed to update Task {old_task.title}")
+                        log_op(
+                            logging.ERROR,
+                            "task.patch",
+                            "Failed to update Task %s",
+                            old_task.title,
+                            task_id=old_task.id,
+                            started=started,
+                        )
                         return
 
+                    log_op(
+                        logging.INFO,
+                        "task.patch",
+                        "Updated Task %s",
+                        old_task.title,
+                        task_id=old_task.id,
+                        started=started,
+                    )
                     updated_subtasks = reconcile_tasks(
                         task_list_id, old_task.subtasks, new_task.subtasks, old_task.id
                     )
                     new_tasks[idx].subtasks = updated_subtasks
-                    logging.info(f"Updated Task {old_task.title}")
 
                 return callback
 
+            # The Task changed on the server since it was fetched. Its fields
+            # are merged with the remote state and the patch is retried once.
+            def resolve_conflict(old_task, new_task, idx):
+                try:
+                    item = (
+                        self.tasks()
+                        .get(tasklist=task_list_id, task=old_task.id)
+                        .execute()
+                    )
+                except HttpError as e:
+                    logging.error("Failed to fetch Task %s: %s", old_task.title, e)
+                    return
+
+                conflicts = []
+                remote_task = task_from_item(item)
+                merged_task = merge_tasks(
+                    replace(old_task, subtasks=[]),
+                    replace(new_task, subtasks=[]),
+                    remote_task,
+                    conflicts,
+                )
+                for conflict in conflicts:
+                    logging.warning("Conflict: %s, keeping local version", conflict)
+
+                if merged_task != remote_task:
+                    patch = self.tasks().patch(
+                        tasklist=task_list_id,
+                        task=old_task.id,
+                        body=merged_task.to_request(),
+                    )
+                    patch.headers["If-Match"] = remote_task.etag
+                    try:
+                        patch.execute()
+                    except HttpError as e:
+                        logging.error("Failed to update Task %s: %s", old_task.title, e)
+                        return
+
+                updated_subtasks = reconcile_tasks(
+                    task_list_id, old_task.subtasks, new_task.subtasks, old_task.id
+                )
+                new_tasks[idx].subtasks = updated_subtasks
+                logging.info("Merged Task %s", old_task.title)
+
+            conflicted_ops = []
             batched_request = self.new_batch_http_request()
             for op in ops:
                 match op:
                     case (ReconcileOp.DELETE, task):
-                        batched_request.add(
-                            self.tasks().delete(tasklist=task_list_id, task=task.id),
-                            delete_callback(task.title),
+                        request = self.tasks().delete(
+                            tasklist=task_list_id, task=task.id
                         )
+                        if task.etag:
+                            request.headers["If-Match"] = task.etag
+                        batched_request.add(request, delete_callback(task))
                     case (ReconcileOp.INSERT, task, idx):
                         batched_request.add(
                             self.tasks().insert(
-                                tasklist=task_list_id, body=task.to_request()
+                                tasklist=task_list_id,
+                                body=replace(task, id="").to_request(),
                             ),
                             insert_callback(task, idx),
                         )
                     case (ReconcileOp.UPDATE, old_task, new_task, idx):
                         new_tasks[idx].id = old_task.id  # Needed for fix_task_order
                         if old_task != new_task:
+                            request = self.tasks().patch(
+                                tasklist=task_list_id,
+                                task=old_task.id,
+                                body=new_task.to_request(),
+                            )
+                            if old_task.etag:
+                                request.headers["If-Match"] = old_task.etag
                             batched_request.add(
-                                self.tasks().patch(
-                                    tasklist=task_list_id,
-                                    task=old_task.id,
-                                    body=new_task.to_request(),
-                                ),
-                                update_callback(old_task, new_task, idx),
+                                request, update_callback(old_task, new_task, idx)
                             )
-            batched_request.execute()
+            # Callbacks report latency of their requests since the batch was sent.
+            started = time.perf_counter()
+            with profiler.phase("reconcile.batch"):
+                batched_request.execute()
+
+            for conflicted_op in conflicted_ops:
+                profiler.count("conflicts")
+                with profiler.phase("reconcile.conflict"):
+                    resolve_conflict(*conflicted_op)
 
             return new_tasks
 
         def gen_task_ops(old_tasks: list[Task], new_tasks: list[Task]):
+            id_to_old_task = {task.id: task for task in old_tasks}
+            matched_ids = {task.id for task in new_tasks if task.id in id_to_old_task}
+
+            ops = []
             task_to_op = {}
             for task in old_tasks:
-                task_to_op[task.title] = (ReconcileOp.DELETE, task)
+                if task.id not in matched_ids:
+                    task_to_op[task.title] = (ReconcileOp.DELETE, task)
 
             for i, task in enumerate(new_tasks):
-                if task.title in task_to_op:
+                if task.id in matched_ids:
+                    ops.append((ReconcileOp.UPDATE, id_to_old_task[task.id], task, i))
+                elif task.title in task_to_op:
                     task_to_op[task.title] = (
                         ReconcileOp.UPDATE,
                         task_to_op[task.title][1],
@@ -221,7 +448,7 @@ class GoogleApiService:
                 else:
                     task_to_op[task.title] = (ReconcileOp.INSERT, task, i)
 
-            return list(task_to_op.values())
+            return ops + list(task_to_op.values())
 
         # The move requests can't be sent in parallel as there must not be
         # two values pointing to the same predecessor.
@@ -230,17 +457,25 @@ class GoogleApiService:
                 previous_task = new_tasks[i - 1] if i > 0 else None
                 previous_task_id = previous_task.id if previous_task else ""
 
-                self.tasks().move(
-                    tasklist=task_list_id,
-                    task=task.id,
-                    parent=parent_task_id,
-                    previous=previous_task_id,
-                ).execute()
+                started = time.perf_counter()
+                with profiler.phase("reconcile.move"):
+                    self.tasks().move(
+                        tasklist=task_list_id,
+                        task=task.id,
+                        parent=parent_task_id,
+                        previous=previous_task_id,
+                    ).execute()
 
                 prev_title = previous_task.title if previous_task else "NONE"
-                logging.info(
-                    f"Moved task {task.title} after {prev_title}"
-                    f" (parent: {parent_task_id})"
+                log_op(
+                    logging.INFO,
+                    "task.move",
+                    "Moved Task %s after %s (parent: %s)",
+                    task.title,
+                    prev_title,
+                    parent_task_id,
+                    task_id=task.id,
+                    started=started,
                 )
 
         async_tasks = []
@@ -248,30 +483,88 @@ class GoogleApiService:
             async_tasks.append(asyncio.create_task(apply_task_list_op(op)))
         await asyncio.gather(*async_tasks)
 
-    def fetch_task_lists(self) -> list[TaskList]:
+    def fetch_task_lists(
+        self,
+        on_task_list: Callable[[TaskList], None] | None = None,
+        low_memory: bool = False,
+    ) -> list[TaskList]:
         """
         Fetches all tasks from the server.
 
         At first the function fetches up to 100 task lists. Then it fetches all
         tasks for these task lists that are either completed at most 30 days ago
-        or are still pending completion.
+        or are still pending completion. If a cache is provided, tasks of the
+        task lists whose `updated` timestamp didn't change since the last fetch
+        are read from the cache instead. If an archive is provided, completed
+        tasks are read from it and only the ones updated since the last fetch
+        are requested. If a search index is provided, the fetched tasks are
+        indexed.
+
+        The optional callback is called with every task list as soon as all of
+        its tasks are fetched, while the other task lists may still be fetched.
+
+        With low_memory, tasks are only passed to the callback and dropped
+        right after, along with the fetched items, so that a single task list
+        is held in memory at a time. The returned task lists have no tasks. The
+        cache isn't used then, as it holds the items of all the task lists.
         """
+        query = self._fetch_query()
+        cache = None if low_memory else self.cache
+        cached_task_lists = cache.read() if cache else {}
+        archived_task_lists = self.archive.task_lists() if self.archive else {}
+        archived_ids = set()
+        fetched_task_lists = {}
+        failed_task_list_ids = set()
         id_to_task_list = {}
-        task_id_to_subtasks = defaultdict(list)
+        pending_requests = defaultdict(int)
 
-        def create_request_with_callback(task_list_id, completed):
-            def fetch_tasks_request(task_list_id, completed, next_page_token=""):
-                completed_max = ""
-                completed_min = ""
-                if completed:
-                    if self.completed_before:
-                        completed_max = self.completed_before.isoformat()
-                    if self.completed_after:
-                        completed_min = self.completed_after.isoformat()
+        def complete_task_list(task_list_id):
+            task_list = id_to_task_list[task_list_id]
+            if (
+                task_list_id in archived_ids
+                and task_list_id not in failed_task_list_ids
+            ):
+                fetched_task_lists[task_list_id].completed = self.archive.read(
+                    task_list_id, query
+                )
+            task_list.tasks = build_tasks(fetched_task_lists[task_list_id].items(query))
+            if on_task_list:
+                on_task_list(task_list)
+            if low_memory:
+                fetched_task_list = fetched_task_lists[task_list_id]
+                if self.index and task_list_id not in failed_task_list_ids:
+                    with profiler.phase("fetch.index"):
+                        self.index.update(
+                            {task_list_id: fetched_task_list}, prune=False
+                        )
+                fetched_task_list.pending = fetched_task_list.completed = []
+                task_list.tasks = []
+
+        def create_request_with_callback(
+            task_list_id, completed, archived_task_list=None
+        ):
+            # Completed tasks are archived up to now, updated ones are only
+            # requested for a task list that is archived already.
+            archive_mode = ""
+            if completed and self.archive:
+                archive_mode = "update" if archived_task_list else "replace"
 
+            def fetch_tasks_request(task_list_id, completed, next_page_token=""):
+                if archive_mode == "update":
+                    return self.tasks().list(
+                        maxResults=100,
+                        pageToken=next_page_token,
+                        showCompleted=True,
+                        showDeleted=True,
+                        showHidden=True,
+                        tasklist=task_list_id,
+                        updatedMin=archived_task_list.synced,
+                    )
                 return self.tasks().list(
-                    completedMax=completed_max,
-                    completedMin=completed_min,
+                    completedMax=query.completed_max
+                    if completed and not archive_mode
+                    else "",
+                    completedMin=query.completed_min if completed else "",
                     maxResults=100,
                     pageToken=next_page_token,
                     showCompleted=completed,
@@ -282,11 +575,19 @@ class GoogleApiService:
             def callback(_, response, exception):
                 if exception:
                     logging.error(
-                        f"Error on fetching Tasks from "
-                        f"Task List {task_list_id}: {exception}"
+                        "Error on fetching Tasks from Task List %s: %s",
+                        task_list_id,
+                        exception,
                     )
-                    return
+                    failed_task_list_ids.add(task_list_id)
+                else:
+                    store_tasks(response)
+
+                pending_requests[task_list_id] -= 1
+                if not pending_requests[task_list_id]:
+                    complete_task_list(task_list_id)
 
+            def store_tasks(response):
                 fetched_tasks = response.get("items", [])
                 next_page_token = response.get("nextPageToken", "")
                 while next_page_token:
@@ -296,50 +597,342 @@ class GoogleApiService:
                     fetched_tasks += response.get("items", [])
                     next_page_token = response.get("nextPageToken", "")
 
-                for fetched_task in fetched_tasks:
-                    task = Task(
-                        fetched_task["id"],
-                        fetched_task["title"].strip(),
-                        fetched_task.get("notes", ""),
-                        int(fetched_task["position"]),
-                        TaskStatus(fetched_task.get("status", "unknown")),
-                        [],
+                fetched_task_list = fetched_task_lists[task_list_id]
+                if archive_mode == "update":
+                    self.archive.update(
+                        task_list_id, fetched_tasks, fetched_task_list.updated
                     )
+                    return
+                if archive_mode == "replace":
+                    self.archive.replace(
+                        task_list_id,
+                        fetched_tasks,
+                        query.completed_min,
+                        fetched_task_list.updated,
+                    )
+                    return
 
-                    # If a task has a parent then it's definitely a subtask
-                    # Subtask's parent might be incompleted so appending it
-                    # to it must be deferred.
-                    parent = fetched_task.get("parent", "")
-                    if parent:
-                        task_id_to_subtasks[parent].append(task)
-                    else:
-                        id_to_task_list[task_list_id].tasks.append(task)
+                items = [strip_task(t) for t in fetched_tasks]
+                if completed:
+                    fetched_task_list.completed = items
+                else:
+                    fetched_task_list.pending = items
 
             return fetch_tasks_request(task_list_id, completed), callback
 
-        task_lists = self.task_lists().list(maxResults=100).execute().get("items", [])
-
         batched_request = self.new_batch_http_request()
-        for task_list in task_lists:
+        with profiler.phase("fetch.task_lists"):
+            listed_task_lists = self._list_task_lists()
+        self.fetched_updates = {
+            task_list["id"]: task_list.get("updated", "")
+            for task_list in listed_task_lists
+        }
+        for task_list in listed_task_lists:
             id = task_list["id"]
+            updated = task_list.get("updated", "")
             id_to_task_list[id] = TaskList(id, task_list["title"], [])
 
-            if not self.task_status or self.task_status == TaskStatus.PENDING:
-                batched_request.add(*create_request_with_callback(id, False))
-            if not self.task_status or self.task_status == TaskStatus.COMPLETED:
-                batched_request.add(*create_request_with_callback(id, True))
-        batched_request.execute()
+            cached_task_list = cached_task_lists.get(id)
+            if (
+                cached_task_list
+                and updated
+                and cached_task_list.updated == updated
+                and cached_task_list.query.covers(query)
+            ):
+                fetched_task_lists[id] = cached_task_list
+                logging.info("Task List %s is up to date", task_list["title"])
+                complete_task_list(id)
+                continue
+
+            fetched_task_lists[id] = CachedTaskList(task_list["title"], updated, query)
+            if query.pending:
+                if (
+                    cached_task_list
+                    and cached_task_list.query.pending
+                    and updated
+                    and cached_task_list.updated == updated
+                ):
+                    fetched_task_lists[id].pending = cached_task_list.pending
+                else:
+                    pending_requests[id] += 1
+                    batched_request.add(*create_request_with_callback(id, False))
+            if query.completed:
+                archived_task_list = archived_task_lists.get(id)
+                if archived_task_list and not archived_task_list.covers(query):
+                    archived_task_list = None
+                if self.archive:
+                    archived_ids.add(id)
+                if not (
+                    archived_task_list
+                    and updated
+                    and archived_task_list.synced == updated
+                ):
+                    pending_requests[id] += 1
+                    batched_request.add(
+                        *create_request_with_callback(id, True, archived_task_list)
+                    )
+            if not pending_requests[id]:
+                complete_task_list(id)
+        with profiler.phase("fetch.batch"):
+            batched_request.execute()
 
         task_lists = list(id_to_task_list.values())
         task_lists.sort(key=lambda tl: tl.title)
-        for task_list in task_lists:
-            for task in task_list.tasks:
-                task.subtasks = task_id_to_subtasks.get(task.id, [])
-                task.subtasks.sort(key=lambda t: t.position)
-            task_list.tasks.sort(key=lambda t: t.position)
 
+        fetched_task_lists = {
+            id: fetched_task_list
+            for id, fetched_task_list in fetched_task_lists.items()
+            if id not in failed_task_list_ids
+        }
+        if cache:
+            cache.write(fetched_task_lists)
+        if self.archive:
+            self.archive.prune(set(id_to_task_list))
+        if self.index:
+            with profiler.phase("fetch.index"):
+                if low_memory:
+                    self.index.prune(set(id_to_task_list) - failed_task_list_ids)
+                else:
+                    self.index.update(fetched_task_lists)
+
+        return task_lists
+
+    def read_cached_task_lists(self) -> list[TaskList] | None:
+        """
+        Reads task lists stored in the cache by the last fetch.
+
+        Nothing is fetched from the server. Returns None if there is no cache
+        or it doesn't contain the tasks requested by this service.
+        """
+        if not self.cache:
+            return None
+
+        query = self._fetch_query()
+        cached_task_lists = self.cache.read()
+        if not cached_task_lists or not all(
+            c.query.covers(query) for c in cached_task_lists.values()
+        ):
+            return None
+
+        task_lists = [
+            TaskList(
+                id, cached_task_list.title, build_tasks(cached_task_list.items(query))
+            )
+            for id, cached_task_list in cached_task_lists.items()
+        ]
+        task_lists.sort(key=lambda tl: tl.title)
         return task_lists
 
+    def task_list_updates(self) -> dict[str, str]:
+        """
+        Returns the last modification time of every task list.
+
+        It takes a single request, so it's a cheap way to check whether any
+        task list needs to be fetched again.
+        """
+        return {
+            task_list["id"]: task_list.get("updated", "")
+            for task_list in self._list_task_lists()
+        }
+
+    def find_task_list(self, title: str) -> str:
+        """Returns the ID of the task list with given title."""
+        task_list_ids = self.task_list_ids()
+        if title not in task_list_ids:
+            raise ValueError(f"Task List {title} not found")
+        return task_list_ids[title]
+
+    def task_list_ids(self) -> dict[str, str]:
+        """Returns IDs of all the task lists by their titles, first one wins."""
+        task_list_ids = {}
+        for task_list in self._list_task_lists():
+            task_list_ids.setdefault(task_list["title"], task_list["id"])
+        return task_list_ids
+
+    def fetch_task_items(self, task_list_id: str) -> list[dict]:
+        """
+        Fetches tasks of a single task list, as returned by the API.
+
+        Only the tasks that `fetch_task_lists` would fetch are returned, the
+        other task lists aren't touched.
+        """
+        query = self._fetch_query()
+        items = []
+        for completed in query.statuses():
+            next_page_token = ""
+            while True:
+                response = self._list_tasks_request(
+                    task_list_id, query, completed, next_page_token
+                ).execute()
+                items += [strip_task(t) for t in response.get("items", [])]
+                next_page_token = response.get("nextPageToken", "")
+                if not next_page_token:
+                    break
+        return items
+
+    async def iter_tasks(
+        self,
+        list_filter: Callable[[TaskList], bool] | None = None,
+        status: TaskStatus | str | None = None,
+    ) -> AsyncIterator[StreamedTask]:
+        """
+        Yields tasks of all task lists one page at a time.
+
+        Task lists can be selected with `list_filter`, and tasks with `status`
+        which defaults to the status of this service. The next page is fetched
+        in a thread while the current one is being processed, so at most two
+        pages are held in memory. Tasks are yielded in the order of the server,
+        pending ones first, and without their subtasks.
+        """
+        query = self._fetch_query(TaskStatus(status) if status else None)
+        listed_task_lists = await asyncio.to_thread(self._list_task_lists)
+        pages = [
+            (TaskList(item["id"], item["title"], []), completed)
+            for item in listed_task_lists
+            for completed in query.statuses()
+        ]
+        if list_filter:
+            pages = [page for page in pages if list_filter(page[0])]
+
+        def fetch_page(idx, page_token=""):
+            task_list, completed = pages[idx]
+            request = self._list_tasks_request(
+                task_list.id, query, completed, page_token
+            )
+            return asyncio.ensure_future(asyncio.to_thread(request.execute))
+
+        idx = 0
+        next_page = fetch_page(idx) if pages else None
+        try:
+            while next_page:
+                response = await next_page
+                task_list = pages[idx][0]
+                next_page_token = response.get("nextPageToken", "")
+                if next_page_token:
+                    next_page = fetch_page(idx, next_page_token)
+                elif idx + 1 < len(pages):
+                    idx += 1
+                    next_page = fetch_page(idx)
+                else:
+                    next_page = None
+
+                for item in response.get("items", []):
+                    yield StreamedTask(
+                        task_list, item.get("parent", ""), task_from_item(item)
+                    )
+        finally:
+            if next_page:
+                next_page.cancel()
+
+    async def apply(self, plan: list[Change]) -> list[dict | HttpError]:
+        """
+        Applies changes of tasks, in batches of MAX_BATCH_SIZE.
+
+        Batches are sent one after another, while changes within a batch may
+        be applied in any order. Patches and deletes of tasks with an etag only
+        succeed if the task didn't change on the server since. Returns the
+        response or the error of every change, in order of the plan.
+        """
+        results = [{} for _ in plan]
+
+        def callback(idx):
+            def callback(_, response, exception):
+                results[idx] = exception or response or {}
+
+            return callback
+
+        requests = [
+            (self._change_request(change), callback(idx))
+            for idx, change in enumerate(plan)
+        ]
+        await asyncio.to_thread(self.execute_in_batches, requests)
+        return results
+
+    def clear_task_list(self, task_list_id: str):
+        """
+        Hides all completed tasks of a task list with a single request.
+
+        Hidden tasks are still fetched by `fetch_task_lists`, as tasks
+        completed in Google's apps are hidden as well.
+        """
+        self.tasks().clear(tasklist=task_list_id).execute()
+
+    def execute_in_batches(self, requests: list[tuple[HttpRequest, Callable]]):
+        """Sends requests with their callbacks in batches of MAX_BATCH_SIZE."""
+        for start in range(0, len(requests), MAX_BATCH_SIZE):
+            batched_request = self.new_batch_http_request()
+            for request, callback in requests[start : start + MAX_BATCH_SIZE]:
+                batched_request.add(request, callback)
+            with profiler.phase("bulk.batch"):
+                batched_request.execute()
+
+    def connect(self):
+        """Authorizes the user and prepares the API client."""
+        self._get_service()
+
+    def _fetch_query(self, task_status: TaskStatus | None = None) -> FetchQuery:
+        task_status = task_status or self.task_status
+        completed = not task_status or task_status == TaskStatus.COMPLETED
+        return FetchQuery(
+            pending=not task_status or task_status == TaskStatus.PENDING,
+            completed=completed,
+            completed_min=(
+                self.completed_after.isoformat()
+                if completed and self.completed_after
+                else ""
+            ),
+            completed_max=(
+                self.completed_before.isoformat()
+                if completed and self.completed_before
+                else ""
+            ),
+        )
+
+    def _list_task_lists(self) -> list[dict]:
+        return self.task_lists().list(maxResults=100).execute().get("items", [])
+
+    def _list_tasks_request(
+        self, task_list_id: str, query: FetchQuery, completed: bool, page_token: str
+    ) -> HttpRequest:
+        return self.tasks().list(
+            completedMax=query.completed_max if completed else "",
+            completedMin=query.completed_min if completed else "",
+            maxResults=PAGE_SIZE,
+            pageToken=page_token,
+            showCompleted=completed,
+            showHidden=completed,
+            tasklist=task_list_id,
+        )
+
+    def _change_request(self, change: Change) -> HttpRequest:
+        task = change.task
+        match change.op:
+            case ChangeOp.INSERT:
+                return self.tasks().insert(
+                    tasklist=change.task_list_id,
+                    parent=change.parent_id,
+                    previous=change.previous_id,
+                    body=replace(task, id="").to_request(),
+                )
+            case ChangeOp.PATCH:
+                request = self.tasks().patch(
+                    tasklist=change.task_list_id, task=task.id, body=task.to_request()
+                )
+            case ChangeOp.DELETE:
+                request = self.tasks().delete(
+                    tasklist=change.task_list_id, task=task.id
+                )
+            case ChangeOp.MOVE:
+                return self.tasks().move(
+                    tasklist=change.task_list_id,
+                    task=task.id,
+                    parent=change.parent_id,
+                    previous=change.previous_id,
+                )
+        if task.etag:
+            request.headers["If-Match"] = task.etag
+        return request
+
     # https://developers.google.com/tasks/quickstart/python#step_2_configure_the_sample
     def get_credentials(self) -> Credentials:
         """
@@ -388,13 +981,64 @@ class GoogleApiService:
             self._service = build(
                 "tasks",
                 "v1",
-                credentials=self.get_credentials(),
+                http=self.transport(self.get_credentials()),
                 cache_discovery=False,
                 static_discovery=True,
+                requestBuilder=CountedHttpRequest,
             )
         return self._service
 
 
+class CountedHttpRequest(HttpRequest):
+    """Counts API requests by method, whether sent alone or in a batch."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        profiler.count(f"api {self.methodId}")
+
+
+def build_tasks(items: list[dict]) -> list[Task]:
+    """Builds a sorted Task tree out of Tasks fetched from a single Task List."""
+    tasks = []
+    task_id_to_subtasks = defaultdict(list)
+    for item in items:
+        task = task_from_item(item)
+
+        # If a task has a parent then it's definitely a subtask
+        # Subtask's parent might be incompleted so appending it
+        # to it must be deferred.
+        parent = item.get("parent", "")
+        if parent:
+            task_id_to_subtasks[parent].append(task)
+        else:
+            tasks.append(task)
+
+    for task in tasks:
+        task.subtasks = task_id_to_subtasks.get(task.id, [])
+        task.subtasks.sort(key=lambda t: t.position)
+    tasks.sort(key=lambda t: t.position)
+
+    return tasks
+
+
+def task_from_item(item: dict) -> Task:
+    """Converts a Task fetched from the server, without its subtasks."""
+    return Task(
+        item["id"],
+        item["title"].strip(),
+        item.get("notes", ""),
+        int(item["position"]),
+        TaskStatus(item.get("status", "unknown")),
+        [],
+        item.get("etag", ""),
+    )
+
+
+def is_conflict(exception) -> bool:
+    """Checks whether a conditional request failed because of a newer state."""
+    return isinstance(exception, HttpError) and exception.resp.status == 412
+
+
 class ReconcileOp(Enum):
     INSERT = auto()
     DELETE = auto()
@@ -0,0 +1,405 @@
+# Copyright 2022 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Streaming import of Tasks from CSV and JSONL files.
+
+Every record describes a single Task with these fields:
+
+    list,id,parent,title,notes,status
+
+`list` is the title of the Task List, which is created if it doesn't exist.
+`id` is an identifier from the source, referred to by `parent` of subtasks.
+Siblings are placed in the order of the file. JSONL records use the same
+keys, and files written by `view --format ndjson` can be imported as well.
+"""
+
+import bisect
+import contextlib
+import csv
+import itertools
+import json
+import logging
+import os
+import sqlite3
+import time
+from collections import deque
+from collections.abc import Iterator
+from dataclasses import dataclass
+
+from xdg import xdg_cache_home
+
+from .googleapi import MAX_BATCH_SIZE, GoogleApiService
+from .logs import log_op
+from .ndjson import TASK_LIST_KIND
+from .tasks import Task, TaskStatus
+
+# Records read ahead of the ones being inserted, so that a batch can be filled
+# with Tasks that don't depend on each other.
+WINDOW_SIZE = 10 * MAX_BATCH_SIZE
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS imported (
+    source TEXT NOT NULL,
+    key TEXT NOT NULL,
+    task_list_id TEXT NOT NULL,
+    task_id TEXT NOT NULL,
+    PRIMARY KEY (source, key)
+) WITHOUT ROWID;
+"""
+
+
+@dataclass
+class ImportRecord:
+    """A Task read from the imported file"""
+
+    lineno: int
+    # Identifies the record across runs, to resume an interrupted import.
+    key: str
+    task_list: str
+    parent_key: str
+    task: Task
+    # The key of the previous sibling in the file, empty for the first one.
+    previous_key: str = ""
+
+
+def read_records(path: str) -> Iterator[ImportRecord]:
+    """Reads records one at a time, based on the extension of the file."""
+    with open(path, newline="") as source:
+        if path.endswith(".csv"):
+            # The header is on the first line.
+            rows = enumerate(csv.DictReader(source), start=2)
+        else:
+            rows = (
+                (lineno, json.loads(line))
+                for lineno, line in enumerate(source, start=1)
+                if line.strip()
+            )
+
+        # Titles of Task Lists of files written by `view --format ndjson`.
+        task_list_titles = {}
+        for lineno, row in rows:
+            try:
+                if row.get("kind") == TASK_LIST_KIND:
+                    task_list_titles[row["id"]] = row["title"]
+                    continue
+
+                task = Task(
+                    "",
+                    row["title"],
+                    row.get("notes") or "",
+                    0,
+                    TaskStatus(row.get("status") or TaskStatus.PENDING.value),
+                    [],
+                )
+                task_list = task_list_titles.get(row["list"], row["list"])
+                yield ImportRecord(
+                    lineno,
+                    row.get("id") or f"line:{lineno}",
+                    task_list,
+                    row.get("parent") or "",
+                    task,
+                )
+            except (AttributeError, KeyError, TypeError, ValueError) as e:
+                raise SyntaxError(
+                    f"Invalid record: {e!r}", (path, lineno, 1, str(row))
+                ) from e
+
+
+class Importer:
+    """
+    Inserts Tasks of a file in batches, remembering what was created.
+
+    The Tasks API places an inserted Task only after a sibling that exists
+    already, and doesn't keep the order of requests within a batch. So the
+    siblings of a batch are all inserted after the last sibling created
+    before it. Their positions are then read in one more batch, and the ones
+    out of order are moved after their previous sibling. Moves are sent in
+    batches too, each holding the Tasks whose previous sibling is in place
+    already. So a batch takes two round trips if the server kept the order of
+    the requests, and one more for each Task of the longest row of siblings
+    out of order otherwise.
+
+    Only a window of records is held in memory, so parents must come before
+    their subtasks. IDs of created Tasks are stored in an SQLite file, so an
+    interrupted import resumes where it stopped when run again, instead of
+    creating the Tasks twice.
+    """
+
+    def __init__(self, service: GoogleApiService, user: str):
+        self.service = service
+        self.path = f"{xdg_cache_home()}/gtasks-md/{user}/imports.sqlite"
+
+    def run(self, file_path: str) -> tuple[int, int]:
+        """Imports the file, returns numbers of created and skipped Tasks."""
+        source = os.path.abspath(file_path)
+        task_list_ids = self.service.task_list_ids()
+        # The key of the last record of every list of siblings read so far.
+        last_keys = {}
+        pending = deque()
+        created = skipped = 0
+
+        with self._connect() as conn:
+
+            def task_id(key):
+                imported = _imported(conn, source, key)
+                return imported[1] if imported else None
+
+            records = read_records(file_path)
+            while True:
+                for record in itertools.islice(records, WINDOW_SIZE - len(pending)):
+                    if record.task_list not in task_list_ids:
+                        task_list_ids[record.task_list] = self._insert_task_list(
+                            record.task_list
+                        )
+                    siblings = (record.task_list, record.parent_key)
+                    record.previous_key = last_keys.get(siblings, "")
+                    last_keys[siblings] = record.key
+                    if task_id(record.key):
+                        skipped += 1
+                    else:
+                        pending.append(record)
+                if not pending:
+                    break
+
+                # Records of every list of siblings of the batch, by the Task
+                # List, the parent and the previous sibling they're placed in.
+                groups = {}
+                taken = {}
+                for record in pending:
+                    parent_id = task_id(record.parent_key) if record.parent_key else ""
+                    if parent_id is None:
+                        continue
+                    if record.previous_key in taken:
+                        group = taken[record.previous_key]
+                    elif not record.previous_key:
+                        group = (task_list_ids[record.task_list], parent_id, "")
+                    elif previous_id := task_id(record.previous_key):
+                        group = (
+                            task_list_ids[record.task_list],
+                            parent_id,
+                            previous_id,
+                        )
+                    else:
+                        continue
+                    groups.setdefault(group, []).append(record)
+                    taken[record.key] = group
+                    if len(taken) == MAX_BATCH_SIZE:
+                        break
+                if not taken:
+                    record = pending[0]
+                    raise SyntaxError(
+                        f"Parent {record.parent_key} not found before its subtask",
+                        (file_path, record.lineno, 1, record.task.title),
+                    )
+
+                self._insert_tasks(conn, source, groups)
+                created += len(taken)
+                pending = deque(r for r in pending if r.key not in taken)
+
+        return created, skipped
+
+    def _insert_task_list(self, title: str) -> str:
+        started = time.perf_counter()
+        response = self.service.task_lists().insert(body={"title": title}).execute()
+        log_op(
+            logging.INFO,
+            "task_list.insert",
+            "Inserted Task List %s",
+            title,
+            task_id=response["id"],
+            started=started,
+        )
+        return response["id"]
+
+    def _insert_tasks(self, conn, source, groups):
+        failures = []
+        # IDs of the created Tasks by the keys of their records.
+        task_ids = {}
+
+        def create_callback(record, task_list_id):
+            def callback(_, response, exception):
+                if exception:
+                    failures.append(record)
+                    log_op(
+                        logging.ERROR,
+                        "task.insert",
+                        "Failed to insert Task %s: %s",
+                        record.task.title,
+                        exception,
+                        started=started,
+                    )
+                    return
+
+                conn.execute(
+                    "INSERT INTO imported VALUES (?, ?, ?, ?)",
+                    (source, record.key, task_list_id, response["id"]),
+                )
+                task_ids[record.key] = response["id"]
+                log_op(
+                    logging.INFO,
+                    "task.insert",
+                    "Inserted Task %s",
+                    record.task.title,
+                    task_id=response["id"],
+                    started=started,
+                )
+
+            return callback
+
+        requests = []
+        for (task_list_id, parent_id, previous_id), records in groups.items():
+            # Applied in order, the last inserted Task is the first one after
+            # the previous sibling, so no moves are needed then.
+            for record in reversed(records):
+                request = self.service.tasks().insert(
+                    tasklist=task_list_id,
+                    parent=parent_id,
+                    previous=previous_id,
+                    body=record.task.to_request(),
+                )
+                requests.append((request, create_callback(record, task_list_id)))
+
+        started = time.perf_counter()
+        self.service.execute_in_batches(requests)
+        # Created Tasks are remembered even if others failed.
+        conn.commit()
+        # Siblings of failed Tasks are ordered too, the failed ones are then
+        # inserted after their previous sibling when the import is resumed.
+        self._order_tasks(
+            {
+                group: [task_ids[r.key] for r in records if r.key in task_ids]
+                for group, records in groups.items()
+            }
+        )
+        if failures:
+            raise RuntimeError(
+                f"Failed to import {len(failures)} Tasks, starting with line "
+                f"{failures[0].lineno}. Run the import again to resume it."
+            )
+
+    def _order_tasks(self, groups: dict[tuple[str, str, str], list[str]]):
+        """Moves siblings inserted in one batch to the order of their IDs."""
+        groups = {group: ids for group, ids in groups.items() if len(ids) > 1}
+        if not groups:
+            return
+        positions = {}
+
+        def get_callback(task_id):
+            def callback(_, response, exception):
+                # Tasks without a position are moved.
+                if not exception:
+                    positions[task_id] = response["position"]
+
+            return callback
+
+        self.service.execute_in_batches(
+            [
+                (
+                    self.service.tasks().get(tasklist=task_list_id, task=task_id),
+                    get_callback(task_id),
+                )
+                for (task_list_id, _, _), task_ids in groups.items()
+                for task_id in task_ids
+            ]
+        )
+
+        # Every Task out of order is moved after its previous sibling, once
+        # that one is in place.
+        in_place = set()
+        moves = {}
+        for (task_list_id, parent_id, previous_id), task_ids in groups.items():
+            in_place.add(previous_id)
+            in_place.update(_longest_ordered_run(task_ids, positions))
+            for previous, task_id in zip([previous_id, *task_ids], task_ids):
+                if task_id not in in_place:
+                    moves[task_id] = (task_list_id, parent_id, previous)
+
+        def move_callback(task_id):
+            def callback(_, response, exception):
+                if exception:
+                    log_op(
+                        logging.ERROR,
+                        "task.move",
+                        "Failed to move Task: %s",
+                        exception,
+                        task_id=task_id,
+                        started=started,
+                    )
+
+            return callback
+
+        while moves:
+            ready = [task_id for task_id, move in moves.items() if move[2] in in_place]
+            requests = []
+            for task_id in ready:
+                task_list_id, parent_id, previous = moves.pop(task_id)
+                request = self.service.tasks().move(
+                    tasklist=task_list_id,
+                    task=task_id,
+                    parent=parent_id,
+                    previous=previous,
+                )
+                requests.append((request, move_callback(task_id)))
+            started = time.perf_counter()
+            self.service.execute_in_batches(requests)
+            in_place.update(ready)
+
+    @contextlib.contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path)
+        try:
+            conn.executescript(SCHEMA)
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+
+def _imported(conn: sqlite3.Connection, source: str, key: str) -> tuple | None:
+    return conn.execute(
+        "SELECT task_list_id, task_id FROM imported WHERE source = ? AND key = ?",
+        (source, key),
+    ).fetchone()
+
+
+def _longest_ordered_run(task_ids: list[str], positions: dict[str, str]) -> set[str]:
+    """
+    Returns the most Tasks that are in the order of task_ids on the server.
+
+    It's the longest increasing subsequence of indexes of the Tasks sorted by
+    their positions, found in O(n log n).
+    """
+    indexes = {task_id: i for i, task_id in enumerate(task_ids)}
+    placed = sorted((t for t in task_ids if t in positions), key=positions.get)
+    # Last index of the best subsequence of every length, and the previous
+    # Task of every Task in its subsequence.
+    tails = []
+    tail_ids = []
+    previous = {}
+    for task_id in placed:
+        length = bisect.bisect_left(tails, indexes[task_id])
+        previous[task_id] = tail_ids[length - 1] if length else None
+        if length == len(tails):
+            tails.append(indexes[task_id])
+            tail_ids.append(task_id)
+        else:
+            tails[length] = indexes[task_id]
+            tail_ids[length] = task_id
+
+    run = set()
+    task_id = tail_ids[-1] if tail_ids else None
+    while task_id:
+        run.add(task_id)
+        task_id = previous[task_id]
+    return run
@@ -0,0 +1,113 @@
+# Copyright 2022 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Logging to a size-rotated file of JSON records, one per line.
+
+Records are put on a queue by the logging thread and formatted and written by
+a background thread, so logging from batch callbacks never waits for the disk.
+Besides the usual fields, records may carry the operation they describe, the
+ID of the affected Task and the latency of the request:
+
+    {"time": "...", "level": "INFO", "user": "default", "message": "...",
+     "op": "task.insert", "task_id": "...", "latency_ms": 12.5}
+"""
+
+import json
+import logging
+import queue
+import time
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+LOG_MAX_BYTES = 1024 * 1024
+LOG_BACKUP_COUNT = 3
+
+# Fields passed with `extra` that are added to the JSON record.
+OP_FIELDS = ("op", "task_id", "latency_ms")
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": self.formatTime(record, "%Y-%m-%d %H:%M:%S"),
+            "level": record.levelname,
+            "user": getattr(record, "user", "-"),
+            "message": record.getMessage(),
+        }
+        for field in OP_FIELDS:
+            if hasattr(record, field):
+                entry[field] = getattr(record, field)
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class LazyQueueHandler(QueueHandler):
+    """
+    Puts records on the queue without formatting them.
+
+    The default handler formats the message on the logging thread. Messages
+    here are only formatted by the listener, so their arguments must not be
+    mutated after logging, which holds for the strings and numbers logged by
+    this package.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+def setup_logging(
+    path: str,
+    max_bytes: int = LOG_MAX_BYTES,
+    backup_count: int = LOG_BACKUP_COUNT,
+) -> QueueListener:
+    """
+    Routes all the logs through a queue to a rotating file.
+
+    Filters that need state of the logging thread, like the account, belong on
+    the handlers of the root logger. Returns the started listener, which must
+    be stopped to flush the queue.
+    """
+    file_handler = RotatingFileHandler(
+        path, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8"
+    )
+    file_handler.setFormatter(JsonFormatter())
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = LazyQueueHandler(log_queue)
+
+    root = logging.getLogger()
+    root.setLevel(logging.INFO)
+    root.addHandler(queue_handler)
+
+    listener = QueueListener(log_queue, file_handler)
+    listener.start()
+    return listener
+
+
+def log_op(
+    level: int,
+    op: str,
+    msg: str,
+    *args,
+    task_id: str = "",
+    started: float | None = None,
+):
+    """Logs a change made on the server, with its latency if `started` is set."""
+    if not logging.getLogger().isEnabledFor(level):
+        return
+
+    extra = {"op": op, "task_id": task_id}
+    if started is not None:
+        extra["latency_ms"] = round((time.perf_counter() - started) * 1000, 3)
+    logging.log(level, msg, *args, extra=extra)
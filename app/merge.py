@@ -0,0 +1,133 @@
+# Copyright 2022 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from dataclasses import replace
+
+from .tasks import Task, TaskList
+
+
+def merge_task_lists(
+    base: list[TaskList], local: list[TaskList], remote: list[TaskList]
+) -> tuple[list[TaskList], list[str]]:
+    """
+    Three-way merges locally edited Task Lists with their remote state.
+
+    Base is the state the local changes were made on top of. All the items are
+    matched based on title, the same way reconcile does it. Changes made only
+    on one side are kept. If both sides changed the same item differently, the
+    local change wins and a conflict is reported.
+    """
+    conflicts = []
+
+    def merge_task_list(base: TaskList, local: TaskList, remote: TaskList, path):
+        tasks = _merge_items(
+            base.tasks,
+            local.tasks,
+            remote.tasks,
+            merge_task,
+            conflicts,
+            f"{path}{local.title} / ",
+        )
+        return TaskList(remote.id, local.title, tasks)
+
+    def merge_task(base: Task, local: Task, remote: Task, path):
+        return merge_tasks(base, local, remote, conflicts, path)
+
+    merged = _merge_items(base, local, remote, merge_task_list, conflicts, "")
+    return merged, conflicts
+
+
+def merge_tasks(
+    base: Task, local: Task, remote: Task, conflicts: list[str], path: str = ""
+) -> Task:
+    """Three-way merges a single Task, see merge_task_lists."""
+    path = f"{path}{local.title}"
+
+    def merge_field(name):
+        base_value = getattr(base, name)
+        local_value = getattr(local, name)
+        remote_value = getattr(remote, name)
+        if local_value == base_value:
+            return remote_value
+        if remote_value not in (base_value, local_value):
+            conflicts.append(f"{path}: {name} changed locally and on the server")
+        return local_value
+
+    def merge_task(base: Task, local: Task, remote: Task, path):
+        return merge_tasks(base, local, remote, conflicts, path)
+
+    return replace(
+        remote,
+        title=merge_field("title"),
+        note=merge_field("note"),
+        status=merge_field("status"),
+        subtasks=_merge_items(
+            base.subtasks,
+            local.subtasks,
+            remote.subtasks,
+            merge_task,
+            conflicts,
+            f"{path} / ",
+        ),
+    )
+
+
+def _merge_items(base_items, local_items, remote_items, merge_item, conflicts, path):
+    base_by_title = {item.title: item for item in base_items}
+    remote_by_title = {item.title: item for item in remote_items}
+    local_titles = {item.title for item in local_items}
+
+    merged = []
+    for local in local_items:
+        base = base_by_title.get(local.title)
+        remote = remote_by_title.get(local.title)
+        if remote is None:
+            if base is None:
+                merged.append(local)
+            elif local != base:
+                conflicts.append(
+                    f"{path}{local.title}: deleted on the server but changed locally"
+                )
+                merged.append(local)
+        elif base is None:
+            if local != remote:
+                conflicts.append(
+                    f"{path}{local.title}: added both locally and on the server"
+                )
+            merged.append(merge_item(remote, local, remote, path))
+        else:
+            merged.append(merge_item(base, local, remote, path))
+
+    # Items that are only on the server are placed after their server-side
+    # predecessor, or at the top if it's gone.
+    merged_titles = [item.title for item in merged]
+    previous_title = None
+    for remote in remote_items:
+        if remote.title not in local_titles:
+            base = base_by_title.get(remote.title)
+            if base is not None and remote != base:
+                conflicts.append(
+                    f"{path}{remote.title}: deleted locally but changed on the server"
+                )
+            if base is None or remote != base:
+                idx = (
+                    merged_titles.index(previous_title) + 1
+                    if previous_title in merged_titles
+                    else 0
+                )
+                merged.insert(idx, remote)
+                merged_titles.insert(idx, remote.title)
+        if remote.title in merged_titles:
+            previous_title = remote.title
+
+    return merged
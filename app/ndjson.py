@@ -0,0 +1,137 @@
+# Copyright 2022 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Newline delimited JSON representation of Task Lists.
+
+Every line is a single record, either a Task List:
+
+    {"kind": "tasks#taskList", "id": "...", "title": "..."}
+
+or a Task:
+
+    {"kind": "tasks#task", "id": "...", "list": "...", "parent": "...",
+     "position": 0, "title": "...", "status": "needsAction", "notes": "..."}
+
+Tasks refer to their Task List and parent Task by ID. These must come earlier
+in the stream, a Task without `list` belongs to the preceding Task List. IDs of
+new items may be made up, these are matched by title like the ones parsed from
+Markdown. Siblings are ordered by `position`, and by their order in the stream
+among equal positions. Tasks without `position` come after the ones with it.
+"""
+
+import json
+from collections.abc import Iterable
+from typing import TextIO
+
+from .tasks import Task, TaskList, TaskStatus
+
+TASK_LIST_KIND = "tasks#taskList"
+TASK_KIND = "tasks#task"
+
+
+def write_task_list(task_list: TaskList, output: TextIO):
+    """Writes a Task List followed by all its Tasks."""
+    output.write(
+        _dumps({"kind": TASK_LIST_KIND, "id": task_list.id, "title": task_list.title})
+    )
+
+    def write_tasks(tasks: list[Task], parent_id: str):
+        for position, task in enumerate(tasks):
+            output.write(
+                _dumps(
+                    {
+                        "kind": TASK_KIND,
+                        "id": task.id,
+                        "list": task_list.id,
+                        "parent": parent_id,
+                        "position": position,
+                        "title": task.title,
+                        "status": task.status.value,
+                        "notes": task.note,
+                    }
+                )
+            )
+            write_tasks(task.subtasks, task.id)
+
+    write_tasks(task_list.tasks, "")
+
+
+def read_task_lists(lines: Iterable[str], filename: str = "<ndjson>") -> list[TaskList]:
+    """
+    Reads Task Lists from NDJSON records, one line at a time.
+
+    Raises SyntaxError pointing at the line of an invalid record.
+    """
+    task_lists = []
+    id_to_task_list = {}
+    id_to_task = {}
+    # Tasks are sorted by position once all the siblings are read.
+    siblings = {}
+    # Sort keys of Tasks: the position if given, then the line.
+    order = {}
+
+    for lineno, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+
+        try:
+            record = json.loads(line)
+            match record.get("kind"):
+                case "tasks#taskList":
+                    task_list = TaskList(record.get("id", ""), record["title"], [])
+                    task_lists.append(task_list)
+                    if task_list.id:
+                        id_to_task_list[task_list.id] = task_list
+                case "tasks#task":
+                    task = Task(
+                        record.get("id", ""),
+                        record["title"],
+                        record.get("notes", ""),
+                        0,
+                        TaskStatus(record.get("status", TaskStatus.PENDING.value)),
+                        [],
+                    )
+                    if record.get("parent"):
+                        parent = id_to_task[record["parent"]].subtasks
+                    elif record.get("list"):
+                        parent = id_to_task_list[record["list"]].tasks
+                    else:
+                        parent = task_lists[-1].tasks
+                    parent.append(task)
+                    position = record.get("position")
+                    order[id(task)] = (
+                        (0, int(position), lineno)
+                        if position is not None
+                        else (1, 0, lineno)
+                    )
+                    siblings[id(parent)] = parent
+                    if task.id:
+                        id_to_task[task.id] = task
+                case kind:
+                    raise ValueError(f"unknown kind {kind!r}")
+        except (AttributeError, IndexError, KeyError, TypeError, ValueError) as e:
+            raise SyntaxError(
+                f"Invalid record: {e!r}", (filename, lineno, 1, line.rstrip("\n"))
+            ) from e
+
+    for tasks in siblings.values():
+        tasks.sort(key=lambda task: order[id(task)])
+        for position, task in enumerate(tasks):
+            task.position = position
+
+    return task_lists
+
+
+def _dumps(record: dict) -> str:
+    return json.dumps(record, ensure_ascii=False) + "\n"
@@ -11,9 +11,17 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
+import itertools
+import multiprocessing
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+
 import pandoc
 from pandoc import types
 
+from .fragments import FragmentCache
+from .profiling import profiler
 from .tasks import Task, TaskList, TaskStatus
 
 # https://github.com/jgm/pandoc-types/blob/master/src/Text/Pandoc/Definition.hs
@@ -31,10 +39,52 @@ Str = types.Str  # type: ignore
 
 EMPTY_ATTRS = ("", [], [])
 ORDERED_FIRST_ELEM = (1, Decimal(), Period())
+HEADER = Header(1, EMPTY_ATTRS, [Str("Google"), Space(), Str("Tasks")])
+
+PARALLEL_MIN_SIZE = 1024 * 1024
+PARTS_PER_WORKER = 4
+UNSPLITTABLE_LINE = re.compile(r"(```|~~~|\s*\[[^\]]*\]:|[=-]+\s*$)")
+LIST_ITEM = re.compile(r"( *)([-+*]|\d+[.)]|#\.)( +|$)")
+ORDERED_ITEM = re.compile(r"( *)(\d+[.)]|#\.)( +|$)")
 
 
-def task_lists_to_markdown(task_lists: list[TaskList]) -> str:
+def task_lists_to_markdown(
+    task_lists: list[TaskList], cache: FragmentCache | None = None
+) -> str:
     """Parses Task Lists to a Pandoc markdown"""
+    content = [HEADER]
+    for task_list in task_lists:
+        content += task_list_to_pandoc(task_list, cache)
+
+    return _write(Pandoc(Meta({}), content), None)
+
+
+def header_to_markdown(cache: FragmentCache | None = None) -> str:
+    """Parses the document header to a Pandoc markdown"""
+    return _write(Pandoc(Meta({}), [HEADER]), cache)
+
+
+def task_list_to_markdown(
+    task_list: TaskList, cache: FragmentCache | None = None
+) -> str:
+    """
+    Parses a single Task List to a Pandoc markdown section.
+
+    Joining the header and all the sections with join_markdown gives the same
+    result as task_lists_to_markdown.
+    """
+    return _write(Pandoc(Meta({}), task_list_to_pandoc(task_list, cache)), cache)
+
+
+def join_markdown(sections: list[str]) -> str:
+    """Joins the header and Task List sections into a single document"""
+    return "\n".join(sections)
+
+
+def task_list_to_pandoc(
+    task_list: TaskList, cache: FragmentCache | None = None
+) -> list:
+    """Parses a single Task List to Pandoc blocks"""
 
     def text_to_pandoc(text: str):
         elems = []
@@ -58,7 +108,7 @@ def task_lists_to_markdown(task_lists: list[TaskList]) -> str:
 
         if parent_contains_notes:
             pandoc_task.append(Para(task_title))
-            match pandoc.read(task.note):
+            match _read(task.note, cache):
                 case Pandoc(_, [*note]):
                     pandoc_task += note
                 case Pandoc(_, []):
@@ -78,53 +128,111 @@ def task_lists_to_markdown(task_lists: list[TaskList]) -> str:
 
         return pandoc_task
 
-    content = [
-        Header(1, EMPTY_ATTRS, [Str("Google"), Space(), Str("Tasks")]),
+    return [
+        Header(2, EMPTY_ATTRS, text_to_pandoc(task_list.title)),
+        OrderedList(ORDERED_FIRST_ELEM, tasks_to_pandoc(task_list.tasks)),
     ]
 
-    for task_list in task_lists:
-        content.append(Header(2, EMPTY_ATTRS, text_to_pandoc(task_list.title)))
-        content.append(
-            OrderedList(ORDERED_FIRST_ELEM, tasks_to_pandoc(task_list.tasks))
-        )
 
-    return pandoc.write(Pandoc(Meta({}), content))
+def markdown_to_task_lists(
+    text: str,
+    max_workers: int | None = None,
+    cache: FragmentCache | None = None,
+    filename: str = "<markdown>",
+) -> list[TaskList]:
+    """
+    Parses Pandoc markdown to Task Lists
 
+    Documents larger than PARALLEL_MIN_SIZE are split at Task List headers and
+    the parts are parsed in a pool of max_workers processes (defaults to the
+    number of CPUs). The result is the same as when parsed in one go.
 
-def markdown_to_task_lists(text: str) -> list[TaskList]:
-    """Parses Pandoc markdown to Task Lists"""
+    Raises SyntaxError pointing at the line and column of filename where the
+    document stops following the Task document structure.
+    """
+    if max_workers != 1 and len(text) >= PARALLEL_MIN_SIZE:
+        max_workers = max_workers or os.cpu_count() or 1
+        parts = split_markdown(text, max_workers * PARTS_PER_WORKER)
+        if len(parts) > 1:
+            first_lines = itertools.accumulate(
+                (part.count("\n") for part in parts[:-1]), initial=1
+            )
+            with ProcessPoolExecutor(max_workers, _pool_context()) as executor:
+                parsed_parts = executor.map(
+                    _parse_markdown_part,
+                    parts,
+                    itertools.repeat(cache),
+                    itertools.repeat(filename),
+                    first_lines,
+                )
+                return list(itertools.chain(*parsed_parts))
 
-    def parse_task_lists(items, idx):
-        if idx >= len(items):
-            return []
+    return _parse_markdown(text, cache, filename)
+
+
+def split_markdown(text: str, max_parts: int) -> list[str]:
+    """
+    Splits Pandoc markdown into up to max_parts parts of similar size.
+
+    A document is split only before level 2 headers that follow a blank line,
+    as otherwise the header could be a part of the preceding paragraph. Top
+    level constructs that could span parts (code blocks, link references,
+    footnotes and setext headers) aren't expected in a Task document, so such
+    documents aren't split at all.
+    """
+    boundaries = []
+    offset = 0
+    previous_blank = True
+    for line in text.splitlines(keepends=True):
+        if UNSPLITTABLE_LINE.match(line):
+            return [text]
+        if previous_blank and offset and line.startswith("## "):
+            boundaries.append(offset)
+        previous_blank = not line.strip()
+        offset += len(line)
+
+    parts = []
+    start = 0
+    part_size = len(text) / max_parts
+    for boundary in boundaries:
+        if boundary - start >= part_size:
+            parts.append(text[start:boundary])
+            start = boundary
+    parts.append(text[start:])
+    return parts
+
+
+def _pool_context():
+    # Workers aren't forked, as forking while other threads run (a background
+    # fetch, other accounts) may deadlock on locks they hold.
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("forkserver")
+    return multiprocessing.get_context("spawn")
 
-        match items[idx]:
-            case Header(1, _, _):
-                return parse_task_lists(items, idx + 1)
-            case Header(2, _, hd):
-                task_list = TaskList("", pandoc.write(hd).strip(), [])
-
-                if idx + 1 < len(items):
-                    match items[idx + 1]:
-                        case OrderedList(_, tasks):
-                            task_list.tasks = parse_tasks(tasks)
-                            return [task_list] + parse_task_lists(items, idx + 2)
-                        case _:
-                            return [task_list] + parse_task_lists(items, idx + 1)
-                else:
-                    return [task_list]
-            case _:
-                raise SyntaxError(f"Unexpected item while parsing: {items[idx]}")
 
-    def parse_tasks(tasks):
+def _parse_markdown_part(
+    text: str, cache: FragmentCache | None, filename: str, first_line: int
+) -> list[TaskList]:
+    task_lists = _parse_markdown(text, cache, filename, first_line)
+    if cache:
+        cache.flush()
+    return task_lists
+
+
+def _parse_markdown(
+    text: str, cache: FragmentCache | None, filename: str, first_line: int = 1
+) -> list[TaskList]:
+    source = SourceMap(text, filename, first_line)
+
+    def parse_tasks(tasks, block, path):
         parsed_tasks = []
 
         for i, task in enumerate(tasks):
-            parsed_tasks.append(parse_task(task, i))
+            parsed_tasks.append(parse_task(task, i, block, path + [i]))
 
         return parsed_tasks
 
-    def parse_task(task, task_no):
+    def parse_task(task, task_no, block, path):
         def match_status(str: Str) -> TaskStatus:
             match str:
                 case Str("☐"):
@@ -136,31 +244,201 @@ def markdown_to_task_lists(text: str) -> list[TaskList]:
 
         name = ""
         status = TaskStatus.UNKNOWN
-        match task[0]:
-            case Plain(txt) | Para(txt):
-                status = match_status(txt[0])
+        match task:
+            case [Plain([first, *_] as txt) | Para([first, *_] as txt), *_]:
+                status = match_status(first)
                 if status == TaskStatus.UNKNOWN:
-                    name = pandoc.write(Plain(txt))
+                    name = _write(Plain(txt), cache)
                 else:
-                    name = pandoc.write(Plain(txt[2:]))
+                    name = _write(Plain(txt[2:]), cache)
+            case [first, *_]:
+                raise source.error(
+                    f"Expected Task status and title, got {_describe(first)}",
+                    *source.item(block, path),
+                )
             case _:
-                raise SyntaxError(f"Expected Task status and title, got {task[0]}")
+                raise source.error(
+                    "Expected Task status and title, got an empty item",
+                    *source.item(block, path),
+                )
 
         note = ""
         subtasks = []
         match task[-1]:
             case OrderedList(_, subtasks):
-                note = pandoc.write(
-                    Pandoc(Meta({}), task[1:-1]), options=["--wrap=none"]
-                )
-                subtasks = parse_tasks(subtasks)
+                note = _write(Pandoc(Meta({}), task[1:-1]), cache, ["--wrap=none"])
+                subtasks = parse_tasks(subtasks, block, path)
             case _:
-                note = pandoc.write(Pandoc(Meta({}), task[1:]), options=["--wrap=none"])
+                note = _write(Pandoc(Meta({}), task[1:]), cache, ["--wrap=none"])
 
         return Task("", name.strip(), note.strip(), task_no, status, subtasks)
 
-    match pandoc.read(text):
+    match _read(text, None):
         case Pandoc(_, items):
-            return parse_task_lists(items, 0)
+            pass
         case _:
             raise SyntaxError("Expected Pandoc markdown representation.")
+
+    # A single pass over the top level blocks, Tasks are only expected right
+    # after their Task List header.
+    task_lists = []
+    expect_tasks = False
+    for block, item in enumerate(items):
+        match item:
+            case Header(1, _, _):
+                expect_tasks = False
+            case Header(2, _, hd):
+                task_lists.append(TaskList("", _write(Plain(hd), cache).strip(), []))
+                expect_tasks = True
+            case OrderedList(_, tasks) if expect_tasks:
+                task_lists[-1].tasks = parse_tasks(tasks, block, [])
+                expect_tasks = False
+            case _:
+                raise source.error(
+                    f"Expected a Task List header, got {_describe(item)}",
+                    *source.block(block),
+                )
+
+    return task_lists
+
+
+class SourceMap:
+    """
+    Finds where the blocks parsed by Pandoc start in the source markdown.
+
+    Pandoc doesn't keep source positions in its AST, so the top level blocks
+    and list items are located based on blank lines and indentation, the same
+    way Pandoc delimits them. It's only used to point at parse errors, so an
+    unusual document may get a slightly off position but never fails.
+    """
+
+    def __init__(self, text: str, filename: str, first_line: int = 1):
+        self.lines = text.splitlines()
+        self.filename = filename
+        self.first_line = first_line
+        self.blocks = _block_starts(self.lines)
+
+    def block(self, idx: int) -> tuple[int, int]:
+        """Returns the line and column index of the idx-th top level block"""
+        if not self.blocks:
+            return 0, 0
+        line = self.blocks[min(idx, len(self.blocks) - 1)]
+        return line, _indent(self.lines[line])
+
+    def item(self, block: int, path: list[int]) -> tuple[int, int]:
+        """
+        Returns the line and column index of a list item.
+
+        The item is given by the indices of its ancestors and itself within the
+        ordered list that is the block-th top level block.
+        """
+        start, column = self.block(block)
+        if block + 1 < len(self.blocks):
+            end = self.blocks[block + 1]
+        else:
+            end = len(self.lines)
+
+        min_indent = column
+        for idx in path:
+            items = []
+            for line in range(start, end):
+                match = ORDERED_ITEM.match(self.lines[line])
+                if match and min_indent <= len(match[1]) < min_indent + 4:
+                    items.append((line, len(match[1]), match.end()))
+            if idx >= len(items):
+                break
+
+            start, column, min_indent = items[idx]
+            if idx + 1 < len(items):
+                end = items[idx + 1][0]
+
+        return start, column
+
+    def error(self, msg: str, line: int, column: int) -> SyntaxError:
+        text = self.lines[line] if line < len(self.lines) else ""
+        return SyntaxError(
+            msg, (self.filename, self.first_line + line, column + 1, text)
+        )
+
+
+def _block_starts(lines: list[str]) -> list[int]:
+    starts = []
+    kind = None
+    fence = None
+    separated = True
+    for n, line in enumerate(lines):
+        if fence:
+            if line.lstrip().startswith(fence):
+                fence = None
+                separated = True
+            continue
+        if not line.strip():
+            separated = True
+            continue
+
+        indent = _indent(line)
+        item = LIST_ITEM.match(line)
+        # Lines continuing the previous block don't start a new one.
+        continues = (
+            not separated
+            or (
+                kind in ("ordered", "bullet")
+                and (indent >= 4 or (item and _list_kind(item) == kind))
+            )
+            or (kind == "code" and indent >= 4)
+        )
+        if not continues:
+            starts.append(n)
+            if item and indent < 4:
+                kind = _list_kind(item)
+            elif indent >= 4:
+                kind = "code"
+            elif line.startswith(("```", "~~~")):
+                kind = "fence"
+                fence = line[:3]
+            else:
+                kind = "header" if line.startswith("#") else "other"
+
+        # Headers take a single line, what follows is a new block.
+        separated = kind == "header" and line.startswith("#")
+
+    return starts
+
+
+def _list_kind(item: re.Match) -> str:
+    return "bullet" if item[2] in "-+*" else "ordered"
+
+
+def _indent(line: str) -> int:
+    return len(line) - len(line.lstrip())
+
+
+def _describe(block) -> str:
+    match block:
+        case Header(level, _, _):
+            return f"a level {level} header"
+        case Para(_) | Plain(_):
+            return "a paragraph"
+        case OrderedList(_, _):
+            return "an ordered list"
+        case types.BulletList(_):
+            return "a bullet list"
+        case types.CodeBlock(_, _):
+            return "a code block"
+        case _:
+            return f"a {type(block).__name__} block"
+
+
+def _read(text: str, cache: FragmentCache | None):
+    if cache:
+        # Counted by the cache, if it runs Pandoc.
+        return cache.read(text)
+    profiler.count("pandoc reads")
+    return pandoc.read(text)
+
+
+def _write(doc, cache: FragmentCache | None, options: list[str] | None = None) -> str:
+    if cache:
+        return cache.write(doc, options)
+    profiler.count("pandoc writes")
+    return pandoc.write(doc, options=options)
@@ -0,0 +1,161 @@
+# Copyright 2022 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import contextlib
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from dataclasses import dataclass
+
+try:
+    import resource
+except ImportError:  # Not available on Windows.
+    resource = None
+
+
+@dataclass
+class Span:
+    """A single timed run of a phase"""
+
+    name: str
+    start: float
+    duration: float
+    thread: int
+
+
+class Profiler:
+    """
+    Collects durations of phases and counters of events.
+
+    Phases may run concurrently and be nested. Nothing is collected until the
+    profiler is enabled, so the instrumentation costs next to nothing
+    otherwise.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.spans: list[Span] = []
+        self.counters: Counter[str] = Counter()
+        self._lock = threading.Lock()
+        self._origin = time.perf_counter()
+
+    def enable(self, trace_memory: bool = False):
+        self.enabled = True
+        self._origin = time.perf_counter()
+        if trace_memory:
+            tracemalloc.start()
+
+    @contextlib.contextmanager
+    def phase(self, name: str):
+        if not self.enabled:
+            yield
+            return
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            span = Span(
+                name,
+                start - self._origin,
+                time.perf_counter() - start,
+                threading.get_ident(),
+            )
+            with self._lock:
+                self.spans.append(span)
+
+    def count(self, name: str, n: int = 1):
+        if self.enabled:
+            with self._lock:
+                self.counters[name] += n
+
+    def summary(self) -> str:
+        """Returns total durations of phases, in order of their first run."""
+        with self._lock:
+            spans = list(self.spans)
+            counters = dict(self.counters)
+
+        phases = {}
+        for span in sorted(spans, key=lambda span: span.start):
+            calls, total = phases.get(span.name, (0, 0.0))
+            phases[span.name] = (calls + 1, total + span.duration)
+
+        lines = [f"{'Phase':<32} {'Calls':>7} {'Total (s)':>10}"]
+        for name, (calls, total) in phases.items():
+            lines.append(f"{name:<32} {calls:>7} {total:>10.3f}")
+        lines.append("")
+        lines.append(f"{'Memory':<32} {'Peak (MiB)':>18}")
+        for name, peak in peak_memory().items():
+            lines.append(f"{name:<32} {peak / 2**20:>18.1f}")
+        lines.append("")
+        lines.append(f"{'Counter':<32} {'Value':>18}")
+        for name, value in sorted(counters.items()):
+            lines.append(f"{name:<32} {value:>18}")
+        return "\n".join(lines)
+
+    def write_chrome_trace(self, path: str):
+        """Writes phases in Chrome trace format, see chrome://tracing."""
+        with self._lock:
+            spans = list(self.spans)
+            counters = dict(self.counters)
+
+        pid = os.getpid()
+        events = [
+            {
+                "name": span.name,
+                "ph": "X",
+                "ts": span.start * 1e6,
+                "dur": span.duration * 1e6,
+                "pid": pid,
+                "tid": span.thread,
+            }
+            for span in spans
+        ]
+        end = max((span.start + span.duration for span in spans), default=0.0)
+        events += [
+            {
+                "name": name,
+                "ph": "C",
+                "ts": end * 1e6,
+                "pid": pid,
+                "args": {name: value},
+            }
+            for name, value in counters.items()
+        ]
+        with open(path, "w") as trace_file:
+            json.dump({"traceEvents": events}, trace_file)
+
+
+def peak_memory() -> dict[str, int]:
+    """
+    Returns peaks of memory used by the process so far, in bytes.
+
+    The resident set size is only known on Unix, memory allocated by Python
+    only while tracemalloc is tracing.
+    """
+    peaks = {}
+    if resource:
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux reports kilobytes, macOS bytes.
+        peaks["rss"] = max_rss if sys.platform == "darwin" else max_rss * 1024
+    if tracemalloc.is_tracing():
+        peaks["python"] = tracemalloc.get_traced_memory()[1]
+    return peaks
+
+
+# Shared by all the modules, enabled with --profile.
+profiler = Profiler()
@@ -0,0 +1,206 @@
+# Copyright 2022 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import json
+import sqlite3
+from dataclasses import asdict, dataclass
+
+from xdg import xdg_cache_home
+
+from . import database
+from .cache import CachedTaskList
+from .tasks import TaskStatus
+
+SCHEMA_VERSION = 1
+
+SCHEMA = """
+CREATE TABLE task_lists (
+    id TEXT PRIMARY KEY,
+    title TEXT NOT NULL,
+    version TEXT NOT NULL
+);
+CREATE TABLE tasks (
+    rowid INTEGER PRIMARY KEY,
+    id TEXT NOT NULL,
+    task_list_id TEXT NOT NULL,
+    parent_id TEXT NOT NULL,
+    title TEXT NOT NULL,
+    status TEXT NOT NULL
+);
+CREATE INDEX tasks_by_task_list ON tasks (task_list_id);
+CREATE INDEX tasks_by_id ON tasks (id);
+CREATE VIRTUAL TABLE tasks_fts USING fts5 (
+    title, notes, tokenize = 'unicode61 remove_diacritics 2'
+);
+"""
+
+# Matches in titles weigh more than matches in notes.
+TITLE_WEIGHT = 10.0
+NOTES_WEIGHT = 1.0
+
+
+@dataclass
+class SearchResult:
+    """A Task matching a query, along with the path to it"""
+
+    task_list: str
+    parents: list[str]
+    title: str
+    status: TaskStatus
+
+    def __str__(self):
+        checkbox = "[x]" if self.status == TaskStatus.COMPLETED else "[ ]"
+        return " > ".join([self.task_list, *self.parents, f"{checkbox} {self.title}"])
+
+
+class SearchIndex:
+    """
+    Full-text index of titles and notes of the last fetched Tasks.
+
+    The index lives in an SQLite database with an FTS5 table, so it can be
+    searched without any network access. After every fetch only the Task Lists
+    that changed since the previous one are indexed again.
+    """
+
+    def __init__(self, user: str):
+        self.path = f"{xdg_cache_home()}/gtasks-md/{user}/search.sqlite"
+
+    def update(self, fetched_task_lists: dict[str, CachedTaskList], prune: bool = True):
+        """
+        Replaces indexed Tasks of the Task Lists that changed.
+
+        Unless prune is False, Task Lists that weren't fetched are dropped.
+        """
+        with self._connect() as conn:
+            indexed = dict(conn.execute("SELECT id, version FROM task_lists"))
+
+            if prune:
+                for task_list_id in indexed.keys() - fetched_task_lists.keys():
+                    _delete_task_list(conn, task_list_id)
+
+            for task_list_id, fetched_task_list in fetched_task_lists.items():
+                version = _version(fetched_task_list)
+                if fetched_task_list.updated and indexed.get(task_list_id) == version:
+                    continue
+
+                _delete_task_list(conn, task_list_id)
+                conn.execute(
+                    "INSERT INTO task_lists VALUES (?, ?, ?)",
+                    (task_list_id, fetched_task_list.title, version),
+                )
+                _insert_tasks(
+                    conn,
+                    task_list_id,
+                    fetched_task_list.pending + fetched_task_list.completed,
+                )
+
+    def prune(self, task_list_ids: set[str]):
+        """Drops Task Lists other than the given ones."""
+        with self._connect() as conn:
+            database.prune_task_lists(conn, task_list_ids, _delete_task_list)
+
+    def search(self, query: str, limit: int = 20) -> list[SearchResult]:
+        """Returns Tasks matching all the words of the query, best first."""
+        match = _match_expression(query)
+        if not match:
+            return []
+
+        with self._connect() as conn:
+            rows = conn.execute(
+                """
+                SELECT task_lists.title, tasks.task_list_id, tasks.parent_id,
+                       tasks.title, tasks.status
+                FROM tasks_fts
+                JOIN tasks ON tasks.rowid = tasks_fts.rowid
+                JOIN task_lists ON task_lists.id = tasks.task_list_id
+                WHERE tasks_fts MATCH ?
+                ORDER BY bm25(tasks_fts, ?, ?)
+                LIMIT ?
+                """,
+                (match, TITLE_WEIGHT, NOTES_WEIGHT, limit),
+            ).fetchall()
+
+            return [
+                SearchResult(
+                    task_list_title,
+                    _parent_titles(conn, task_list_id, parent_id),
+                    title,
+                    TaskStatus(status),
+                )
+                for task_list_title, task_list_id, parent_id, title, status in rows
+            ]
+
+    def _connect(self):
+        return database.connect(self.path, SCHEMA, SCHEMA_VERSION)
+
+
+def _delete_task_list(conn: sqlite3.Connection, task_list_id: str):
+    conn.execute(
+        "DELETE FROM tasks_fts WHERE rowid IN "
+        "(SELECT rowid FROM tasks WHERE task_list_id = ?)",
+        (task_list_id,),
+    )
+    conn.execute("DELETE FROM tasks WHERE task_list_id = ?", (task_list_id,))
+    conn.execute("DELETE FROM task_lists WHERE id = ?", (task_list_id,))
+
+
+def _insert_tasks(conn: sqlite3.Connection, task_list_id: str, items: list[dict]):
+    (last_rowid,) = conn.execute("SELECT coalesce(max(rowid), 0) FROM tasks").fetchone()
+    rows = [
+        (
+            rowid,
+            item["id"],
+            task_list_id,
+            item.get("parent", ""),
+            item.get("title", ""),
+            item.get("status", TaskStatus.PENDING.value),
+            item.get("notes", ""),
+        )
+        for rowid, item in enumerate(items, start=last_rowid + 1)
+    ]
+    conn.executemany(
+        "INSERT INTO tasks VALUES (?, ?, ?, ?, ?, ?)", [row[:6] for row in rows]
+    )
+    conn.executemany(
+        "INSERT INTO tasks_fts (rowid, title, notes) VALUES (?, ?, ?)",
+        [(row[0], row[4], row[6]) for row in rows],
+    )
+
+
+def _parent_titles(
+    conn: sqlite3.Connection, task_list_id: str, parent_id: str
+) -> list[str]:
+    titles = []
+    while parent_id:
+        row = conn.execute(
+            "SELECT title, parent_id FROM tasks WHERE id = ? AND task_list_id = ?",
+            (parent_id, task_list_id),
+        ).fetchone()
+        if not row:
+            break
+        title, parent_id = row
+        titles.append(title)
+    return titles[::-1]
+
+
+def _version(fetched_task_list: CachedTaskList) -> str:
+    # Tasks of a Task List are the same as long as it wasn't updated and they
+    # were fetched with the same query.
+    return json.dumps([fetched_task_list.updated, asdict(fetched_task_list.query)])
+
+
+def _match_expression(query: str) -> str:
+    # Every word is matched as a prefix and quoted, so that characters with a
+    # special meaning in FTS5 queries are searched for literally.
+    words = query.split()
+    return " ".join('"' + word.replace('"', '""') + '"*' for word in words)
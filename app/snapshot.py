@@ -0,0 +1,117 @@
+# Copyright 2022 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import contextlib
+import os
+import pickle
+from dataclasses import dataclass
+from datetime import datetime
+
+from xdg import xdg_cache_home
+
+from .tasks import TaskList, TaskStatus
+
+# Snapshots written with another version are ignored, as are the Task Lists
+# pickled in them.
+SNAPSHOT_VERSION = 1
+
+
+@dataclass
+class SnapshotHeader:
+    """Describes the fetch a snapshot was taken of, along with its Markdown"""
+
+    version: int
+    fetched_at: datetime
+    key: str
+    markdown: str
+
+
+class ViewSnapshot:
+    """
+    Stores the last fetched Task Lists along with their rendered Markdown.
+
+    The snapshot is a file with two pickles: a header with the Markdown, and
+    the Task Lists. Viewing the Markdown only loads the header, and neither
+    the API client nor pandoc are needed to read it.
+    """
+
+    def __init__(self, user: str):
+        self.path = f"{xdg_cache_home()}/gtasks-md/{user}/view.snapshot"
+
+    def write(self, key: str, task_lists: list[TaskList], markdown: str):
+        header = SnapshotHeader(
+            SNAPSHOT_VERSION, datetime.now().astimezone(), key, markdown
+        )
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "wb") as snapshot_file:
+            pickle.dump(header, snapshot_file, pickle.HIGHEST_PROTOCOL)
+            pickle.dump(task_lists, snapshot_file, pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, self.path)
+
+    def delete(self):
+        """Drops the snapshot, once the Tasks on the server are changed."""
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(self.path)
+
+    def read(self, key: str) -> SnapshotHeader | None:
+        """Returns the header if the snapshot was taken with the same key."""
+        try:
+            with open(self.path, "rb") as snapshot_file:
+                return _read_header(snapshot_file, key)
+        except FileNotFoundError:
+            return None
+
+    def read_task_lists(self, key: str) -> list[TaskList] | None:
+        try:
+            with open(self.path, "rb") as snapshot_file:
+                if not _read_header(snapshot_file, key):
+                    return None
+                return pickle.load(snapshot_file)
+        except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+            return None
+
+
+def snapshot_key(
+    completed_after, completed_before, task_status, rolling_window=False
+) -> str:
+    """
+    Identifies which Tasks a snapshot contains.
+
+    Only the date of the default rolling window counts, as it starts at a
+    different time on every run.
+    """
+    if rolling_window:
+        after = completed_after.date().isoformat()
+    else:
+        after = completed_after.isoformat() if completed_after else ""
+    return "|".join(
+        [
+            after,
+            completed_before.isoformat() if completed_before else "",
+            TaskStatus(task_status).value if task_status else "",
+        ]
+    )
+
+
+def _read_header(snapshot_file, key: str) -> SnapshotHeader | None:
+    try:
+        header = pickle.load(snapshot_file)
+    except (EOFError, pickle.UnpicklingError, AttributeError, TypeError):
+        return None
+    if (
+        not isinstance(header, SnapshotHeader)
+        or header.version != SNAPSHOT_VERSION
+        or header.key != key
+    ):
+        return None
+    return header
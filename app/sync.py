@@ -0,0 +1,210 @@
+# Copyright 2022 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import asyncio
+import contextlib
+import logging
+import os
+import time
+from collections.abc import Callable
+from contextlib import AbstractContextManager
+from typing import TextIO
+
+import httplib2
+from google.auth.exceptions import TransportError
+from googleapiclient.errors import HttpError
+
+from .backup import Backup
+from .fragments import FragmentCache
+from .googleapi import GoogleApiService
+from .pandoc import markdown_to_task_lists, task_lists_to_markdown
+
+DEFAULT_DEBOUNCE = 1.0
+DEFAULT_REMOTE_INTERVAL = 30.0
+DEFAULT_POLL_INTERVAL = 0.5
+# Errors that may go away on their own, e.g. when the connection is back.
+TRANSIENT_ERRORS = (HttpError, httplib2.HttpLib2Error, TransportError, OSError)
+
+
+class FileSync:
+    """
+    Keeps a Markdown file and Google Tasks in sync in both directions.
+
+    Local edits are detected by polling modification time of the file, as the
+    standard library has no file system notifications. They're applied only
+    once the file stays unchanged for `debounce` seconds, so a burst of saves
+    results in a single reconcile against the last synced state.
+
+    Remote changes are detected every `remote_interval` seconds by comparing
+    `updated` timestamps of Task Lists, which takes a single request. Only if
+    any of them changed the Tasks are fetched and the file is rewritten. The
+    file is never rewritten while it has local edits that weren't applied yet.
+
+    Changes of the server and of local state are made within `lock`, so that
+    other processes can use the account while waiting for changes.
+    """
+
+    def __init__(
+        self,
+        service: GoogleApiService,
+        file_path: str,
+        backup: Backup | None = None,
+        fragments: FragmentCache | None = None,
+        debounce: float = DEFAULT_DEBOUNCE,
+        remote_interval: float = DEFAULT_REMOTE_INTERVAL,
+        clock=time.monotonic,
+        output: TextIO | None = None,
+        lock: Callable[[], AbstractContextManager] = contextlib.nullcontext,
+    ):
+        self.service = service
+        self.file_path = file_path
+        self.backup = backup
+        self.fragments = fragments
+        self.debounce = debounce
+        self.remote_interval = remote_interval
+        self.clock = clock
+        self.output = output
+        self.lock = lock
+
+        self.task_lists = None
+        self.text = None
+        self.updates = {}
+        # Content of the file that is known to be applied to the server.
+        self._file_text = None
+        self._file_stat = None
+        self._file_changed_at = None
+        self._remote_checked_at = None
+
+    def start(self):
+        """
+        Brings the file and the server in sync.
+
+        An existing file that differs from the server state is reconciled with
+        the server first, like with the reconcile command. Then the server
+        state is written to the file.
+        """
+        with self.lock():
+            self._fetch()
+        self._file_stat = self._stat()
+        text = self._read()
+        if text is None or text == self.text:
+            self._file_text = text
+            self._write()
+        else:
+            self.push(text)
+
+    def run(self, poll_interval: float = DEFAULT_POLL_INTERVAL):
+        self.start()
+        while True:
+            time.sleep(poll_interval)
+            self.tick()
+
+    def tick(self):
+        """Runs a step, failures are logged and retried on the next tick."""
+        try:
+            self.step()
+        except TRANSIENT_ERRORS as e:
+            logging.error("Failed to sync %s, retrying: %s", self.file_path, e)
+            # A push may have failed half way, so the server state is fetched
+            # again before the file is checked for edits once more.
+            self.task_lists = None
+            self._file_stat = None
+
+    def step(self):
+        """Checks for local and remote changes and applies them if due."""
+        now = self.clock()
+        stat = self._stat()
+        if stat != self._file_stat:
+            self._file_stat = stat
+            self._file_changed_at = now
+
+        if (
+            self._file_changed_at is not None
+            and now - self._file_changed_at >= self.debounce
+        ):
+            self._file_changed_at = None
+            text = self._read()
+            if text is not None and text != self.text:
+                self.push(text)
+
+        if self._file_changed_at is None and (
+            self._remote_checked_at is None
+            or now - self._remote_checked_at >= self.remote_interval
+        ):
+            self._remote_checked_at = now
+            if self.service.task_list_updates() != self.updates:
+                self.pull()
+
+    def push(self, text: str):
+        """Reconciles the server with the edited file."""
+        try:
+            new_task_lists = markdown_to_task_lists(
+                text, cache=self.fragments, filename=self.file_path
+            )
+        except SyntaxError as e:
+            print(f"{e.filename}:{e.lineno}:{e.offset}: {e.msg}", file=self.output)
+            logging.error("Not syncing %s: %s", self.file_path, e)
+            return
+
+        with self.lock():
+            if self.task_lists is None:
+                self._fetch()
+            if self.backup:
+                self.backup.write_backup(self.text, self.task_lists)
+                self.backup.flush()
+            asyncio.run(self.service.reconcile(self.task_lists, new_task_lists))
+            self._file_text = text
+            logging.info("Pushed changes of %s", self.file_path)
+            print("Pushed local changes.", file=self.output)
+            self.pull()
+
+    def pull(self):
+        """Fetches the server state and writes it to the file."""
+        with self.lock():
+            self._fetch()
+        self._write()
+
+    def _fetch(self):
+        self.task_lists = self.service.fetch_task_lists()
+        self.updates = self.service.fetched_updates
+        self.text = task_lists_to_markdown(self.task_lists, self.fragments)
+
+    def _write(self):
+        text = self._read()
+        if text != self._file_text:
+            # The file has edits that weren't pushed yet, e.g. because they're
+            # invalid or were made in the meantime.
+            return
+        if text != self.text:
+            tmp_path = f"{self.file_path}.tmp"
+            with open(tmp_path, "w") as tmp_file:
+                tmp_file.write(self.text)
+            os.replace(tmp_path, self.file_path)
+            logging.info("Pulled changes to %s", self.file_path)
+            print("Pulled remote changes.", file=self.output)
+        self._file_text = self.text
+        self._file_stat = self._stat()
+
+    def _stat(self):
+        try:
+            stat = os.stat(self.file_path)
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def _read(self) -> str | None:
+        try:
+            with open(self.file_path, "r") as source:
+                return source.read()
+        except FileNotFoundError:
+            return None
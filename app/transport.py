@@ -0,0 +1,111 @@
+# Copyright 2022 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import threading
+
+import google_auth_httplib2
+import httplib2
+from google.auth.transport.requests import AuthorizedSession
+from google.oauth2.credentials import Credentials
+from requests.adapters import HTTPAdapter
+from urllib3.util import Retry
+
+from .profiling import profiler
+
+DEFAULT_POOL_SIZE = 10
+DEFAULT_TIMEOUT = 60
+# Requests that failed to connect never reached the server, so these are safe
+# to be sent again.
+CONNECT_RETRIES = Retry(total=None, connect=2, read=0, status=0, other=0)
+
+
+class SessionHttp:
+    """
+    An httplib2.Http compatible transport backed by pooled requests sessions.
+
+    The Google API client sends every request (including batches and the
+    requests issued from batch callbacks) through the `request` method of its
+    transport. The default httplib2 transport isn't thread-safe and reconnects
+    more often than needed. This one keeps the connections alive in a pool that
+    is shared between per-thread sessions, so it can be used by concurrent
+    workers.
+    """
+
+    def __init__(
+        self,
+        credentials: Credentials,
+        pool_size: int = DEFAULT_POOL_SIZE,
+        timeout: float = DEFAULT_TIMEOUT,
+    ):
+        # Used by the API client to refresh credentials of batched requests.
+        self.credentials = credentials
+        self.timeout = timeout
+        self._adapter = HTTPAdapter(
+            pool_connections=1, pool_maxsize=pool_size, max_retries=CONNECT_RETRIES
+        )
+        self._local = threading.local()
+
+    def request(
+        self,
+        uri,
+        method="GET",
+        body=None,
+        headers=None,
+        redirections=httplib2.DEFAULT_MAX_REDIRECTS,
+        connection_type=None,
+    ):
+        del connection_type
+        response = self._session().request(
+            method,
+            uri,
+            data=body,
+            headers=headers,
+            timeout=self.timeout,
+            allow_redirects=redirections > 0,
+        )
+
+        profiler.count("http requests")
+        profiler.count("http bytes sent", len(body or b""))
+        profiler.count("http bytes received", len(response.content))
+        retries = getattr(response.raw, "retries", None)
+        if retries and retries.history:
+            profiler.count("http retries", len(retries.history))
+
+        info = dict(response.headers)
+        info["status"] = str(response.status_code)
+        resp = httplib2.Response(info)
+        resp.reason = response.reason
+        return resp, response.content
+
+    def close(self):
+        self._adapter.close()
+
+    def _session(self) -> AuthorizedSession:
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = AuthorizedSession(self.credentials)
+            session.mount("https://", self._adapter)
+            session.mount("http://", self._adapter)
+            self._local.session = session
+        return session
+
+
+def httplib2_http(credentials: Credentials):
+    """The transport used by the Google API client by default."""
+    return google_auth_httplib2.AuthorizedHttp(credentials, http=httplib2.Http())
+
+
+TRANSPORTS = {
+    "session": SessionHttp,
+    "httplib2": httplib2_http,
+}
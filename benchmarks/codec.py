@@ -0,0 +1,76 @@
+# Copyright 2022 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Measures throughput of the Markdown codec on synthetic Task Lists.
+
+Every shape of Task Lists (wide, deep, note-heavy and unicode-heavy) is
+rendered and parsed back. The round trip has to give the same Task Lists, and
+the command exits with a non-zero status if it doesn't or if any rate falls
+below its floor:
+
+    python -m benchmarks.codec --seed 0 --min-render-rate 100 --min-parse-rate 60
+
+The default floors are about 80% of the slowest shape where they were measured,
+note-heavy Task Lists rendering at ~120 and parsing at ~75 tasks/s, so a
+regression of a fifth trips them. Raise them on faster machines.
+"""
+
+import argparse
+import random
+import sys
+import time
+
+from app.pandoc import markdown_to_task_lists, task_lists_to_markdown
+from benchmarks import synthetic
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--seed", default=0, type=int)
+    parser.add_argument("--shape", choices=synthetic.SHAPES, action="append")
+    parser.add_argument("--min-render-rate", default=100, type=float)
+    parser.add_argument("--min-parse-rate", default=60, type=float)
+    args = parser.parse_args()
+
+    failures = []
+    for name in args.shape or synthetic.SHAPES:
+        task_lists = synthetic.SHAPES[name](random.Random(args.seed))
+        tasks = synthetic.count_tasks(task_lists)
+
+        start = time.perf_counter()
+        markdown = task_lists_to_markdown(task_lists)
+        render_rate = tasks / (time.perf_counter() - start)
+
+        start = time.perf_counter()
+        parsed_task_lists = markdown_to_task_lists(markdown, max_workers=1)
+        parse_rate = tasks / (time.perf_counter() - start)
+
+        print(
+            f"{name:>14}: {tasks:>5} tasks, render {render_rate:7.1f} tasks/s, "
+            f"parse {parse_rate:7.1f} tasks/s"
+        )
+        if parsed_task_lists != task_lists:
+            failures.append(f"{name}: round trip changed the Task Lists")
+        if render_rate < args.min_render_rate:
+            failures.append(f"{name}: render rate below {args.min_render_rate}")
+        if parse_rate < args.min_parse_rate:
+            failures.append(f"{name}: parse rate below {args.min_parse_rate}")
+
+    for failure in failures:
+        print(f"FAIL {failure}", file=sys.stderr)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+# Copyright 2022 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Measures how parsing a large Markdown document scales with worker processes.
+
+    python -m benchmarks.parsing --task-lists 40 --tasks 25 --max-workers 8
+"""
+
+import argparse
+import os
+import time
+
+from app import pandoc
+
+
+def generate_markdown(task_lists: int, tasks: int) -> str:
+    lines = ["# Google Tasks", ""]
+    for i in range(task_lists):
+        lines += [f"## Task List {i}", ""]
+        for j in range(tasks):
+            status = "x" if j % 3 == 0 else " "
+            lines += [f"1.  [{status}] Task {i}.{j}", ""]
+            if j % 2:
+                lines += [f"    Note of task {i}.{j} with *some* markup.", ""]
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--task-lists", default=40, type=int)
+    parser.add_argument("--tasks", default=25, type=int)
+    parser.add_argument("--max-workers", default=os.cpu_count() or 1, type=int)
+    args = parser.parse_args()
+
+    text = generate_markdown(args.task_lists, args.tasks)
+    # Parallelize regardless of the document size.
+    pandoc.PARALLEL_MIN_SIZE = 0
+
+    print(f"{len(text) / 1024:.0f} KiB, {args.task_lists * args.tasks} tasks")
+    serial_time = None
+    expected = None
+    workers = 1
+    while workers <= args.max_workers:
+        start = time.perf_counter()
+        task_lists = pandoc.markdown_to_task_lists(text, max_workers=workers)
+        elapsed = time.perf_counter() - start
+
+        expected = expected or task_lists
+        assert task_lists == expected, "Parallel parsing changed the result"
+        serial_time = serial_time or elapsed
+        print(
+            f"{workers:>3} workers: {elapsed:7.2f} s, "
+            f"speedup {serial_time / elapsed:5.2f}x"
+        )
+        workers *= 2
+
+
+if __name__ == "__main__":
+    main()
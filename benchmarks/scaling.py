@@ -0,0 +1,56 @@
+# Copyright 2022 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Measures how parsing scales with the number of Task Lists in a document.
+
+Pandoc conversions of titles and notes are replaced with a no-op, so only
+reading the document and the pass over its blocks are measured. The time per
+Task List should stay flat as the document grows:
+
+    python -m benchmarks.scaling --task-lists 1000 --steps 4 --tasks 5
+"""
+
+import argparse
+import time
+from unittest import mock
+
+from app import pandoc
+from benchmarks.parsing import generate_markdown
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--task-lists", default=1000, type=int)
+    parser.add_argument("--steps", default=4, type=int)
+    parser.add_argument("--tasks", default=5, type=int)
+    args = parser.parse_args()
+
+    task_lists = args.task_lists
+    with mock.patch.object(pandoc, "_write", return_value=""):
+        for _ in range(args.steps):
+            text = generate_markdown(task_lists, args.tasks)
+
+            start = time.perf_counter()
+            pandoc.markdown_to_task_lists(text, max_workers=1)
+            elapsed = time.perf_counter() - start
+
+            print(
+                f"{task_lists:>7} task lists: {elapsed:7.2f} s, "
+                f"{elapsed / task_lists * 1e6:7.1f} us per task list"
+            )
+            task_lists *= 2
+
+
+if __name__ == "__main__":
+    main()
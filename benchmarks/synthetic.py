@@ -0,0 +1,151 @@
+# Copyright 2022 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Generators of synthetic Task Lists for round-trip tests and benchmarks.
+
+Everything generated is in the canonical form the codec produces, so it's
+expected to survive task_lists_to_markdown followed by markdown_to_task_lists
+unchanged. Titles don't use characters that Pandoc escapes (like apostrophes),
+as these come back escaped.
+"""
+
+import random
+
+from app.tasks import Task, TaskList, TaskStatus
+
+ASCII_WORDS = [
+    "buy",
+    "milk",
+    "call",
+    "mom",
+    "fix",
+    "bike",
+    "review",
+    "draft",
+    "book",
+    "flights",
+    "v2",
+    "Q3",
+    "re-run",
+    "100%",
+    "e.g.,",
+]
+UNICODE_WORDS = [
+    "żółw",
+    "naïve",
+    "Straße",
+    "café",
+    "東京",
+    "買い物",
+    "привет",
+    "مرحبا",
+    "שלום",
+    "🙂",
+    "🚲",
+    "Ωmega",
+    "→",
+    "•",
+]
+NOTE_MARKUP = ["*{}*", "**{}**", "`{}`"]
+
+
+def words(rng: random.Random, count: int, vocabulary: list[str]) -> str:
+    return " ".join(rng.choice(vocabulary) for _ in range(count))
+
+
+def note(rng: random.Random, paragraphs: int, vocabulary: list[str]) -> str:
+    def word():
+        word = rng.choice(vocabulary)
+        if rng.random() < 0.1:
+            return rng.choice(NOTE_MARKUP).format(word)
+        return word
+
+    return "\n\n".join(
+        " ".join(word() for _ in range(rng.randint(3, 40))) for _ in range(paragraphs)
+    )
+
+
+def task_lists(
+    rng: random.Random,
+    task_lists: int = 3,
+    width: int = 5,
+    depth: int = 1,
+    note_ratio: float = 0.3,
+    subtask_ratio: float = 0.5,
+    vocabulary: list[str] = ASCII_WORDS,
+) -> list[TaskList]:
+    """
+    Generates task_lists Task Lists with up to width Tasks on each of depth
+    levels. note_ratio of Tasks have notes and subtask_ratio have subtasks.
+    """
+
+    def tasks(level: int) -> list[Task]:
+        if level == depth:
+            return []
+
+        generated = []
+        for position in range(rng.randint(1, width)):
+            generated.append(
+                Task(
+                    "",
+                    words(rng, rng.randint(1, 8), vocabulary),
+                    note(rng, rng.randint(1, 3), vocabulary)
+                    if rng.random() < note_ratio
+                    else "",
+                    position,
+                    rng.choice([TaskStatus.PENDING, TaskStatus.COMPLETED]),
+                    tasks(level + 1) if rng.random() < subtask_ratio else [],
+                )
+            )
+        return generated
+
+    return [
+        TaskList("", words(rng, rng.randint(1, 4), vocabulary), tasks(0))
+        for _ in range(task_lists)
+    ]
+
+
+def wide(rng: random.Random) -> list[TaskList]:
+    return task_lists(rng, task_lists=2, width=200, note_ratio=0.05)
+
+
+def deep(rng: random.Random) -> list[TaskList]:
+    return task_lists(
+        rng, task_lists=2, width=2, depth=8, note_ratio=0.2, subtask_ratio=1
+    )
+
+
+def note_heavy(rng: random.Random) -> list[TaskList]:
+    return task_lists(rng, task_lists=3, width=15, depth=2, note_ratio=1)
+
+
+def unicode_heavy(rng: random.Random) -> list[TaskList]:
+    return task_lists(
+        rng, task_lists=3, width=15, depth=2, vocabulary=UNICODE_WORDS + ASCII_WORDS
+    )
+
+
+SHAPES = {
+    "wide": wide,
+    "deep": deep,
+    "note-heavy": note_heavy,
+    "unicode-heavy": unicode_heavy,
+}
+
+
+def count_tasks(task_lists: list[TaskList]) -> int:
+    def count(tasks: list[Task]) -> int:
+        return sum(1 + count(task.subtasks) for task in tasks)
+
+    return sum(count(task_list.tasks) for task_list in task_lists)
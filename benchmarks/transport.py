@@ -0,0 +1,63 @@
+# Copyright 2022 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Compares request latency of the available HTTP transports.
+
+Every transport sends the same sequence of cheap read-only requests (listing
+task lists and tasks of the first one) on behalf of an already authorized user:
+
+    python -m benchmarks.transport --user default --requests 50
+"""
+
+import argparse
+import statistics
+import time
+
+from app.googleapi import GoogleApiService
+from app.transport import TRANSPORTS
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--user", default="default")
+    parser.add_argument("--requests", default=50, type=int)
+    args = parser.parse_args()
+
+    for name, transport in TRANSPORTS.items():
+        service = GoogleApiService(args.user, None, None, "", None, transport)
+        task_lists = service.task_lists().list(maxResults=100).execute()
+        task_list_id = task_lists["items"][0]["id"]
+
+        latencies = []
+        for i in range(args.requests):
+            if i % 2:
+                request = service.task_lists().list(maxResults=100)
+            else:
+                request = service.tasks().list(tasklist=task_list_id, maxResults=100)
+
+            start = time.perf_counter()
+            request.execute()
+            latencies.append((time.perf_counter() - start) * 1000)
+
+        latencies.sort()
+        print(
+            f"{name:>10}: "
+            f"mean {statistics.mean(latencies):7.1f} ms, "
+            f"p50 {latencies[len(latencies) // 2]:7.1f} ms, "
+            f"p95 {latencies[int(len(latencies) * 0.95)]:7.1f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
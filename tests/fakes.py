@@ -0,0 +1,279 @@
+import copy
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import httplib2
+from googleapiclient.errors import HttpError
+
+from app.googleapi import GoogleApiService
+
+
+class CacheTestCase(unittest.TestCase):
+    """Gives every test an empty cache directory of the "test" account"""
+
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        patcher = mock.patch.dict(os.environ, {"XDG_CACHE_HOME": tmp_dir.name})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.tmp_dir = tmp_dir.name
+        self.cache_dir = f"{tmp_dir.name}/gtasks-md/test"
+        os.makedirs(self.cache_dir)
+
+
+def http_error(status: int) -> HttpError:
+    return HttpError(httplib2.Response({"status": status}), b"")
+
+
+class FakeRequest:
+    def __init__(self, fn):
+        self.fn = fn
+        self.headers = {}
+
+    def execute(self):
+        return self.fn(self.headers)
+
+
+class FakeBatch:
+    def __init__(self):
+        self.requests = []
+
+    def add(self, request, callback):
+        self.requests.append((request, callback))
+
+    def execute(self):
+        for i, (request, callback) in enumerate(self.requests):
+            try:
+                response, exception = request.execute(), None
+            except HttpError as e:
+                response, exception = None, e
+            callback(str(i), response, exception)
+
+
+class FakeTasks:
+    def __init__(self, server):
+        self.server = server
+
+    def list(self, tasklist, **kwargs):
+        def fn(_):
+            self.server.calls.append(("tasks.list", tasklist))
+            self.server.list_requests.append((tasklist, kwargs))
+            tasks = self.server.task_lists[tasklist]["tasks"]
+            if kwargs.get("updatedMin"):
+                items = [
+                    t for t in tasks if t.get("updated", "") >= kwargs["updatedMin"]
+                ]
+                return {"items": copy.deepcopy(items)}
+
+            completed = bool(kwargs.get("showCompleted"))
+            items = [t for t in tasks if (t.get("status") == "completed") == completed]
+            start = int(kwargs.get("pageToken") or 0)
+            end = start + kwargs.get("maxResults", 100)
+            # Responses are parsed anew by the client, so nothing is shared.
+            page = copy.deepcopy(items[start:end])
+            if end < len(items):
+                return {"items": page, "nextPageToken": str(end)}
+            return {"items": page}
+
+        return FakeRequest(fn)
+
+    def get(self, tasklist, task):
+        def fn(_):
+            self.server.calls.append(("tasks.get", task))
+            item = self.server.find_task(tasklist, task)
+            siblings = self.server.siblings(tasklist, item.get("parent", ""))
+            return dict(item, position=f"{siblings.index(item):020}")
+
+        return FakeRequest(fn)
+
+    def insert(self, tasklist, body, parent="", previous=""):
+        def fn(_):
+            self.server.calls.append(("tasks.insert", body["title"]))
+            self.server.insert_requests.append((tasklist, parent, previous))
+            id = f"new-{len(self.server.calls)}"
+            fields = {"status": body["status"]}
+            if parent:
+                fields["parent"] = parent
+            item = self.server.add_task(
+                tasklist, id, body["title"], notes=body["notes"], **fields
+            )
+            self.server.place(tasklist, item, previous)
+            return {"id": id}
+
+        return FakeRequest(fn)
+
+    def patch(self, tasklist, task, body):
+        def fn(headers):
+            self.server.calls.append(("tasks.patch", task))
+            item = self.server.find_task(tasklist, task)
+            self.server.check_etag(item, headers)
+            item.update({k: v for k, v in body.items() if k != "id"})
+            self.server.touch(item)
+            return dict(item)
+
+        return FakeRequest(fn)
+
+    def delete(self, tasklist, task):
+        def fn(headers):
+            self.server.calls.append(("tasks.delete", task))
+            item = self.server.find_task(tasklist, task)
+            self.server.check_etag(item, headers)
+            # Subtasks are deleted along with their parent.
+            deleted_ids = {task}
+            for item in list(self.server.task_lists[tasklist]["tasks"]):
+                if item["id"] in deleted_ids or item.get("parent") in deleted_ids:
+                    deleted_ids.add(item["id"])
+                    self.server.task_lists[tasklist]["tasks"].remove(item)
+
+        return FakeRequest(fn)
+
+    def clear(self, tasklist):
+        def fn(_):
+            self.server.calls.append(("tasks.clear", tasklist))
+            for item in self.server.task_lists[tasklist]["tasks"]:
+                if item.get("status") == "completed":
+                    item["hidden"] = True
+
+        return FakeRequest(fn)
+
+    def move(self, tasklist, task, **kwargs):
+        destination = kwargs.get("destinationTasklist", "")
+
+        def fn(_):
+            self.server.calls.append(("tasks.move", task))
+            if destination:
+                # Subtasks are moved along with their parent.
+                moved_ids = {task}
+                for item in list(self.server.task_lists[tasklist]["tasks"]):
+                    if item["id"] in moved_ids or item.get("parent") in moved_ids:
+                        moved_ids.add(item["id"])
+                        self.server.task_lists[tasklist]["tasks"].remove(item)
+                        self.server.task_lists[destination]["tasks"].append(item)
+                return
+            item = self.server.find_task(tasklist, task)
+            if kwargs.get("parent"):
+                item["parent"] = kwargs["parent"]
+            else:
+                item.pop("parent", None)
+            self.server.place(tasklist, item, kwargs.get("previous", ""))
+
+        return FakeRequest(fn)
+
+
+class FakeTaskLists:
+    def __init__(self, server):
+        self.server = server
+
+    def list(self, **_):
+        def fn(_):
+            self.server.calls.append(("tasklists.list", ""))
+            return {
+                "items": [
+                    {"id": id, "title": tl["title"], "updated": tl["updated"]}
+                    for id, tl in self.server.task_lists.items()
+                ]
+            }
+
+        return FakeRequest(fn)
+
+    def insert(self, body):
+        def fn(_):
+            self.server.calls.append(("tasklists.insert", body["title"]))
+            id = f"new-{len(self.server.calls)}"
+            self.server.add_task_list(id, body["title"])
+            return {"id": id}
+
+        return FakeRequest(fn)
+
+    def patch(self, tasklist, body):
+        def fn(_):
+            self.server.calls.append(("tasklists.patch", tasklist))
+            self.server.task_lists[tasklist]["title"] = body["title"]
+            return {"id": tasklist, "title": body["title"]}
+
+        return FakeRequest(fn)
+
+    def delete(self, tasklist):
+        def fn(_):
+            self.server.calls.append(("tasklists.delete", tasklist))
+            del self.server.task_lists[tasklist]
+
+        return FakeRequest(fn)
+
+
+class FakeServer:
+    """In-memory stand-in for the subset of Google Tasks API used by the app"""
+
+    def __init__(self):
+        self.task_lists = {}
+        self.calls = []
+        self.list_requests = []
+        self.insert_requests = []
+
+    def add_task_list(self, id, title, updated="2022-01-01T00:00:00.000Z"):
+        self.task_lists[id] = {"title": title, "updated": updated, "tasks": []}
+
+    def add_task(self, task_list_id, id, title, position=0, **fields):
+        task = {
+            "id": id,
+            "etag": f'"{id}-0"',
+            "title": title,
+            "position": f"{position:020}",
+            "status": "needsAction",
+        }
+        task.update(fields)
+        self.task_lists[task_list_id]["tasks"].append(task)
+        return task
+
+    def siblings(self, task_list_id, parent_id):
+        return [
+            task
+            for task in self.task_lists[task_list_id]["tasks"]
+            if task.get("parent", "") == parent_id
+        ]
+
+    def place(self, task_list_id, task, previous=""):
+        """Puts the Task after the previous one, or first of its siblings."""
+        tasks = self.task_lists[task_list_id]["tasks"]
+        tasks.remove(task)
+        if previous:
+            idx = tasks.index(self.find_task(task_list_id, previous)) + 1
+        else:
+            siblings = self.siblings(task_list_id, task.get("parent", ""))
+            idx = tasks.index(siblings[0]) if siblings else len(tasks)
+        tasks.insert(idx, task)
+
+    def find_task(self, task_list_id, task_id):
+        for task in self.task_lists[task_list_id]["tasks"]:
+            if task["id"] == task_id:
+                return task
+        raise http_error(404)
+
+    def touch(self, task):
+        id, version = task["etag"].strip('"').rsplit("-", 1)
+        task["etag"] = f'"{id}-{int(version) + 1}"'
+
+    def check_etag(self, task, headers):
+        if "If-Match" in headers and headers["If-Match"] != task["etag"]:
+            raise http_error(412)
+
+
+class FakeGoogleApiService(GoogleApiService):
+    def __init__(self, server: FakeServer, *args, **kwargs):
+        super().__init__("test", None, None, "", *args, **kwargs)
+        self.server = server
+
+    def tasks(self):
+        return FakeTasks(self.server)
+
+    def task_lists(self):
+        return FakeTaskLists(self.server)
+
+    def new_batch_http_request(self):
+        return FakeBatch()
+
+    def connect(self):
+        pass
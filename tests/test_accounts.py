@@ -0,0 +1,130 @@
+import argparse
+import fcntl
+import io
+import logging
+import os
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+from app import commands
+from app.accounts import UserLogFilter, account_lock, current_user, list_users
+
+
+class TestAccounts(unittest.TestCase):
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.tmp_dir = tmp_dir.name
+        patcher = mock.patch.dict(
+            os.environ,
+            {
+                "XDG_CACHE_HOME": f"{self.tmp_dir}/cache",
+                "XDG_DATA_HOME": f"{self.tmp_dir}/data",
+            },
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_lists_users_with_credentials(self):
+        for user in ["b", "a", "no-credentials"]:
+            os.makedirs(f"{self.tmp_dir}/data/gtasks-md/{user}")
+        for user in ["b", "a"]:
+            open(f"{self.tmp_dir}/data/gtasks-md/{user}/credentials.json", "w").close()
+
+        self.assertEqual(["a", "b"], list_users())
+
+    def test_locks_account_exclusively(self):
+        os.makedirs(f"{self.tmp_dir}/cache/gtasks-md/a")
+        lock_path = f"{self.tmp_dir}/cache/gtasks-md/a/lock"
+
+        with (
+            account_lock("a"),
+            open(lock_path) as lock_file,
+            self.assertRaises(BlockingIOError),
+        ):
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+        with open(lock_path) as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+    def test_nests_locks_within_a_thread(self):
+        os.makedirs(f"{self.tmp_dir}/cache/gtasks-md/a")
+
+        with account_lock("a"), account_lock("a"):
+            pass
+
+        with account_lock("a"):
+            pass
+
+    def test_reports_waiting_for_lock_on_stderr(self):
+        os.makedirs(f"{self.tmp_dir}/cache/gtasks-md/a")
+        stderr = io.StringIO()
+        waiting = threading.Event()
+
+        def lock():
+            with account_lock("a"):
+                pass
+
+        with open(f"{self.tmp_dir}/cache/gtasks-md/a/lock", "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            with mock.patch("sys.stderr", stderr):
+                thread = threading.Thread(target=lock)
+                with mock.patch(
+                    "app.accounts.logging.info", lambda *args: waiting.set()
+                ):
+                    thread.start()
+                    self.assertTrue(waiting.wait(5))
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+                thread.join()
+
+        self.assertEqual(
+            "Waiting for another process using account a...\n", stderr.getvalue()
+        )
+
+    def test_reads_without_locking(self):
+        os.makedirs(f"{self.tmp_dir}/cache/gtasks-md/a")
+        locked = []
+        args = argparse.Namespace(
+            completed_after=None,
+            completed_before=None,
+            status="",
+            no_cache=False,
+            transport="session",
+            query="Paint",
+            limit=10,
+        )
+
+        with mock.patch("app.commands.account_lock", locked.append):
+            for subcommand in ["history", "search"]:
+                args.subcommand = subcommand
+                commands.run(args, "a", io.StringIO())
+
+        self.assertEqual([], locked)
+
+    def test_skips_locking_without_fcntl(self):
+        with mock.patch("app.accounts.fcntl", None), account_lock("missing"):
+            pass
+
+    def test_tags_log_records_with_user(self):
+        log_filter = UserLogFilter()
+        users = {}
+
+        def log(user):
+            current_user.set(user)
+            record = logging.LogRecord("", logging.INFO, "", 0, "", None, None)
+            log_filter.filter(record)
+            users[user] = record.user
+
+        threads = [threading.Thread(target=log, args=(user,)) for user in "ab"]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual({"a": "a", "b": "b"}, users)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,139 @@
+import unittest
+from datetime import datetime
+
+from app.archive import CompletedArchive
+from app.cache import FetchQuery
+from tests.fakes import CacheTestCase, FakeGoogleApiService, FakeServer
+
+
+def completed(id, title, at):
+    return {"id": id, "title": title, "status": "completed", "completed": at}
+
+
+class TestCompletedArchive(CacheTestCase):
+    def setUp(self):
+        super().setUp()
+        self.archive = CompletedArchive("test")
+
+    def titles(self, query):
+        return sorted(item["title"] for item in self.archive.read("1", query))
+
+    def test_reads_tasks_completed_within_window(self):
+        self.archive.replace(
+            "1",
+            [
+                completed("a", "Old", "2022-01-01T00:00:00.000Z"),
+                completed("b", "New", "2022-03-01T00:00:00.000Z"),
+                {"id": "c", "title": "Pending", "status": "needsAction"},
+            ],
+            "",
+            "1",
+        )
+
+        self.assertEqual(["New", "Old"], self.titles(FetchQuery(False, True)))
+        self.assertEqual(
+            ["New"],
+            self.titles(FetchQuery(False, True, "2022-02-01T01:00:00+01:00")),
+        )
+        self.assertEqual(
+            ["Old"],
+            self.titles(FetchQuery(False, True, "", "2022-02-01T00:00:00+00:00")),
+        )
+
+    def test_applies_updated_tasks(self):
+        self.archive.replace(
+            "1",
+            [
+                completed("a", "Reopened", "2022-01-01T00:00:00.000Z"),
+                completed("b", "Deleted", "2022-01-01T00:00:00.000Z"),
+                completed("c", "Kept", "2022-01-01T00:00:00.000Z"),
+            ],
+            "",
+            "1",
+        )
+        self.archive.update(
+            "1",
+            [
+                {"id": "a", "title": "Reopened", "status": "needsAction"},
+                dict(
+                    completed("b", "Deleted", "2022-01-01T00:00:00.000Z"), deleted=True
+                ),
+                completed("d", "Done", "2022-01-02T00:00:00.000Z"),
+            ],
+            "2",
+        )
+
+        self.assertEqual(["Done", "Kept"], self.titles(FetchQuery(False, True)))
+        self.assertEqual("2", self.archive.task_lists()["1"].synced)
+
+    def test_covers_windows_within_archived_one(self):
+        self.archive.replace("1", [], "2022-01-01T00:00:00+00:00", "1")
+        archived = self.archive.task_lists()["1"]
+
+        self.assertTrue(archived.covers(FetchQuery(True, True, "2022-02-01T00:00:00Z")))
+        self.assertFalse(
+            archived.covers(FetchQuery(True, True, "2021-12-31T00:00:00Z"))
+        )
+        self.assertFalse(archived.covers(FetchQuery(True, True)))
+
+
+class TestFetchWithArchive(CacheTestCase):
+    def setUp(self):
+        super().setUp()
+        self.server = FakeServer()
+        self.server.add_task_list("1", "Task List 1", "2022-01-01T00:00:00.000Z")
+        self.server.add_task("1", "a", "Pending", 0)
+        self.server.add_task(
+            "1",
+            "b",
+            "Done",
+            1,
+            status="completed",
+            completed="2022-01-01T00:00:00.000Z",
+            updated="2022-01-01T00:00:00.000Z",
+        )
+        self.service = FakeGoogleApiService(
+            self.server, archive=CompletedArchive("test")
+        )
+
+    def titles(self):
+        (task_list,) = self.service.fetch_task_lists()
+        return [task.title for task in task_list.tasks]
+
+    def completed_requests(self):
+        requests = [r for _, r in self.server.list_requests if r.get("showCompleted")]
+        self.server.list_requests.clear()
+        return requests
+
+    def test_requests_only_updated_completed_tasks(self):
+        self.assertEqual(["Pending", "Done"], self.titles())
+        self.assertNotIn("updatedMin", self.completed_requests()[0])
+
+        self.assertEqual(["Pending", "Done"], self.titles())
+        self.assertEqual([], self.completed_requests())
+
+        self.server.task_lists["1"]["updated"] = "2022-01-02T00:00:00.000Z"
+        self.server.add_task(
+            "1",
+            "c",
+            "Done too",
+            2,
+            status="completed",
+            updated="2022-01-02T00:00:00.000Z",
+        )
+
+        self.assertEqual(["Pending", "Done", "Done too"], self.titles())
+        (request,) = self.completed_requests()
+        self.assertEqual("2022-01-01T00:00:00.000Z", request["updatedMin"])
+
+    def test_reads_other_windows_from_archive(self):
+        self.titles()
+        self.completed_requests()
+        self.service.completed_after = datetime.fromisoformat("2021-06-01T00:00:00Z")
+
+        self.assertEqual(["Pending", "Done"], self.titles())
+        self.assertEqual([], self.completed_requests())
+
+
+if __name__ == "__main__":
+    unittest.main()
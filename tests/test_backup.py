@@ -0,0 +1,129 @@
+import os
+import random
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from app.backup import Backup
+from app.pandoc import task_lists_to_markdown
+from benchmarks import synthetic
+from tests.fakes import CacheTestCase
+
+
+class TestBackup(CacheTestCase):
+    def setUp(self):
+        super().setUp()
+        self.backup = Backup("test")
+        self.addCleanup(self.backup.close)
+
+    def test_restores_every_snapshot(self):
+        texts = [f"# Google Tasks\n\n## List\n\n{i}\n" * (i % 7 + 1) for i in range(45)]
+        for text in texts:
+            self.backup.write_backup(text)
+
+        self.assertEqual(45, len(self.backup.history()))
+        for n, text in enumerate(reversed(texts), start=1):
+            self.assertEqual(text, self.backup.read_backup(n))
+
+    def test_discards_most_recent_snapshots(self):
+        for text in ["first\n", "second\n", "third\n"]:
+            self.backup.write_backup(text)
+
+        path = self.backup.discard_backup(2)
+
+        self.assertEqual("second\n", Path(path).read_text())
+        self.assertEqual(["first\n"], self.read_all())
+        self.assertIsNone(self.backup.discard_backup(2))
+
+    def test_truncates_history_without_writing_rollback_file(self):
+        for text in ["first\n", "second\n"]:
+            self.backup.write_backup(text)
+
+        self.backup.truncate_history(1)
+
+        self.assertEqual(["first\n"], self.read_all())
+        self.assertFalse(Path(f"{self.cache_dir}/backups/rollback.md").exists())
+
+    def test_restores_task_lists_with_ids(self):
+        task_lists = synthetic.task_lists(
+            random.Random(0), depth=3, vocabulary=synthetic.UNICODE_WORDS
+        )
+        for i, task_list in enumerate(task_lists):
+            task_list.id = f"list-{i}"
+        self.backup.write_backup("legacy\n")
+        self.backup.write_backup("text\n", task_lists)
+
+        snapshot = self.backup.read_snapshot(1)
+
+        self.assertEqual(task_lists, snapshot)
+        self.assertEqual([tl.id for tl in task_lists], [tl.id for tl in snapshot])
+        self.assertIsNone(self.backup.read_snapshot(2))
+
+    def test_stores_deltas(self):
+        rng = random.Random(0)
+        task_lists = synthetic.task_lists(rng, task_lists=3, width=20)
+        text = task_lists_to_markdown(task_lists)
+        lines = text.splitlines(keepends=True)
+        for i in range(50):
+            lines[rng.randrange(len(lines))] = f"Edit {i}\n"
+            self.backup.write_backup("".join(lines))
+        self.backup.flush()
+
+        objects = Path(f"{self.cache_dir}/backups/objects").iterdir()
+        stored_size = sum(path.stat().st_size for path in objects)
+        self.assertLess(stored_size, len(text) * 50 / 10)
+
+    def test_drops_oldest_snapshots(self):
+        def count_objects():
+            self.backup.flush()
+            return len(list(Path(f"{self.cache_dir}/backups/objects").iterdir()))
+
+        with (
+            mock.patch("app.backup.MAX_ENTRIES", 5),
+            mock.patch("app.backup.MAX_DELTA_CHAIN", 3),
+        ):
+            for i in range(19):
+                self.backup.write_backup(f"{i}\n")
+            # Snapshots 14 to 18 are deltas of 13 and 12, stored in full.
+            self.assertEqual(7, count_objects())
+
+            self.backup.write_backup("19\n")
+
+            self.assertEqual([f"{i}\n" for i in range(19, 14, -1)], self.read_all())
+            # Snapshot 15 is stored in full, so 12 to 14 are freed.
+            self.assertEqual(5, count_objects())
+
+    def test_frees_discarded_snapshots(self):
+        for i in range(3):
+            self.backup.write_backup(f"{i}\n")
+
+        self.backup.discard_backup(2)
+
+        self.assertEqual(["0\n"], self.read_all())
+        objects = list(Path(f"{self.cache_dir}/backups/objects").iterdir())
+        self.assertEqual(1, len(objects))
+
+    def test_stores_size_in_bytes(self):
+        self.backup.write_backup("żółw\n")
+
+        self.assertEqual(8, self.backup.history()[0].size)
+
+    def test_migrates_legacy_backups(self):
+        for file_no, text in enumerate(["old\n", "newer\n", "rolled back\n"]):
+            path = Path(f"{self.cache_dir}/{file_no}.bak.md")
+            path.write_text(text)
+            os.utime(path, (file_no, file_no))
+        Path(f"{self.cache_dir}/marker").write_text("1")
+
+        self.assertEqual(["newer\n", "old\n"], self.read_all())
+        self.assertFalse(Path(f"{self.cache_dir}/marker").exists())
+        self.assertFalse(Path(f"{self.cache_dir}/0.bak.md").exists())
+
+    def read_all(self) -> list[str]:
+        return [
+            self.backup.read_backup(n) for n in range(1, len(self.backup.history()) + 1)
+        ]
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,118 @@
+import argparse
+import io
+import unittest
+from unittest import mock
+
+from app import commands
+from app.__main__ import parse_regex
+from app.bulk import BulkOp, bulk_update
+from tests.fakes import FakeGoogleApiService, FakeServer, http_error
+
+
+class TestBulkUpdate(unittest.TestCase):
+    def setUp(self):
+        self.server = FakeServer()
+        self.server.add_task_list("1", "Home")
+        self.server.add_task_list("2", "Work")
+        self.server.add_task("1", "a", "Call mom", 0)
+        self.server.add_task("1", "b", "Call dad", 1)
+        self.server.add_task("1", "c", "Call back", 0, parent="b")
+        self.server.add_task("1", "d", "Paint", 2)
+        self.server.add_task("2", "e", "Call boss", 0)
+        self.service = FakeGoogleApiService(self.server)
+
+    def titles(self, task_list_id):
+        return [task["title"] for task in self.server.task_lists[task_list_id]["tasks"]]
+
+    def test_completes_matching_tasks_of_one_task_list(self):
+        changed, failed = bulk_update(self.service, "Home", "^Call", BulkOp.COMPLETE)
+
+        self.assertEqual((3, 0), (changed, failed))
+        statuses = {t["id"]: t["status"] for t in self.server.task_lists["1"]["tasks"]}
+        self.assertEqual("needsAction", statuses["d"])
+        self.assertEqual("needsAction", self.server.find_task("2", "e")["status"])
+        self.assertNotIn(("tasks.list", "2"), self.server.calls)
+
+    def test_deletes_subtasks_with_their_parent(self):
+        changed, _ = bulk_update(self.service, "Home", "dad|back", BulkOp.DELETE)
+
+        self.assertEqual(1, changed)
+        self.assertEqual(["Call mom", "Paint"], self.titles("1"))
+
+    def test_moves_tasks_to_another_task_list(self):
+        bulk_update(self.service, "Home", "Call", BulkOp.MOVE, "Work")
+
+        self.assertEqual(["Paint"], self.titles("1"))
+        self.assertEqual(
+            ["Call boss", "Call mom", "Call dad", "Call back"], self.titles("2")
+        )
+
+    def test_renames_with_replacement(self):
+        bulk_update(self.service, "Home", r"Call (\w+)", BulkOp.RENAME, r"Visit \1")
+
+        self.assertEqual(
+            ["Visit mom", "Visit dad", "Visit back", "Paint"], self.titles("1")
+        )
+
+    def test_sends_requests_in_chunks(self):
+        batches = []
+        new_batch = self.service.new_batch_http_request
+
+        def new_batch_http_request():
+            batch = new_batch()
+            batches.append(batch)
+            return batch
+
+        with (
+            mock.patch("app.googleapi.MAX_BATCH_SIZE", 2),
+            mock.patch.object(
+                self.service, "new_batch_http_request", new_batch_http_request
+            ),
+        ):
+            bulk_update(self.service, "Home", "", BulkOp.COMPLETE)
+
+        self.assertEqual([2, 2], [len(batch.requests) for batch in batches])
+
+    def test_skips_tasks_changed_on_the_server(self):
+        def check_etag(item, headers):
+            if item["id"] == "a":
+                raise http_error(412)
+
+        self.server.check_etag = check_etag
+
+        changed, failed = bulk_update(self.service, "Home", "Call", BulkOp.DELETE)
+
+        self.assertEqual((1, 1), (changed, failed))
+        self.assertEqual(["Call mom", "Paint"], self.titles("1"))
+
+
+class TestBulkCommands(unittest.TestCase):
+    def setUp(self):
+        self.server = FakeServer()
+        self.server.add_task_list("1", "Home")
+        self.service = FakeGoogleApiService(self.server)
+        self.output = io.StringIO()
+
+    def test_reports_unknown_task_list(self):
+        args = argparse.Namespace(subcommand="complete", task_list="Work", match="")
+
+        commands.bulk(self.service, args, self.output)
+        commands.clear(self.service, "Work", self.output)
+
+        self.assertEqual(
+            "Task List Work not found.\nTask List Work not found.\n",
+            self.output.getvalue(),
+        )
+
+    def test_reports_invalid_pattern(self):
+        args = argparse.Namespace(subcommand="complete", task_list="Home", match="(")
+
+        commands.bulk(self.service, args, self.output)
+
+        self.assertRegex(self.output.getvalue(), r"^Invalid regular expression \(: ")
+        with self.assertRaisesRegex(argparse.ArgumentTypeError, "invalid regular"):
+            parse_regex("(")
+
+
+if __name__ == "__main__":
+    unittest.main()
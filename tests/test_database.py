@@ -0,0 +1,44 @@
+import sqlite3
+import tempfile
+import unittest
+
+from app import database
+
+SCHEMA = """
+CREATE TABLE task_lists (id TEXT PRIMARY KEY);
+CREATE VIRTUAL TABLE tasks_fts USING fts5 (title);
+"""
+
+
+class TestDatabase(unittest.TestCase):
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.path = f"{tmp_dir.name}/test.sqlite"
+
+    def test_rebuilds_database_of_other_version(self):
+        with database.connect(self.path, SCHEMA, 1) as conn:
+            conn.execute("INSERT INTO task_lists VALUES ('1')")
+            conn.execute("INSERT INTO tasks_fts VALUES ('Task 1')")
+        with database.connect(self.path, SCHEMA, 1) as conn:
+            self.assertEqual(
+                [("1",)], conn.execute("SELECT id FROM task_lists").fetchall()
+            )
+
+        with database.connect(self.path, SCHEMA, 2) as conn:
+            self.assertEqual([], conn.execute("SELECT id FROM task_lists").fetchall())
+            self.assertEqual([], conn.execute("SELECT * FROM tasks_fts").fetchall())
+            (version,) = conn.execute("PRAGMA user_version").fetchone()
+            self.assertEqual(2, version)
+
+    def test_prunes_other_task_lists(self):
+        deleted = []
+
+        def delete_task_list(conn: sqlite3.Connection, task_list_id: str):
+            deleted.append(task_list_id)
+
+        with database.connect(self.path, SCHEMA, 1) as conn:
+            conn.executemany("INSERT INTO task_lists VALUES (?)", [("1",), ("2",)])
+            database.prune_task_lists(conn, {"2", "3"}, delete_task_list)
+
+        self.assertEqual(["1"], deleted)
@@ -0,0 +1,131 @@
+import io
+import unittest
+from unittest import mock
+
+from app import commands
+from app.backup import Backup
+from app.cache import TaskListCache
+from app.editor import Editor, mark_error, strip_error_marks
+from app.pandoc import markdown_to_task_lists
+from tests.fakes import CacheTestCase, FakeGoogleApiService, FakeServer, http_error
+
+VALID = "# Tasks\n\n## My Tasks\n\n1.  [ ] Task 1\n"
+INVALID = "# Tasks\n\n## My Tasks\n\nSome paragraph.\n"
+
+
+class TestEditUntilValid(unittest.TestCase):
+    def setUp(self):
+        self.editor = Editor("true")
+        self.opened = []
+
+    def edits(self, *texts):
+        def edit(text):
+            self.opened.append(text)
+            return texts[len(self.opened) - 1]
+
+        return mock.patch.object(self.editor, "edit", side_effect=edit)
+
+    def test_reopens_invalid_text_with_error_marked(self):
+        output = io.StringIO()
+        with self.edits(INVALID, VALID):
+            task_lists = self.editor.edit_until_valid(
+                VALID, markdown_to_task_lists, output
+            )
+
+        self.assertEqual("Task 1", task_lists[0].tasks[0].title)
+        self.assertRegex(output.getvalue(), r"^<markdown>:5:\d+: ")
+        self.assertEqual(2, len(self.opened))
+        self.assertIn("<!-- gtasks-md error: line 5:", self.opened[1])
+        self.assertEqual(INVALID, strip_error_marks(self.opened[1]))
+
+    def test_strips_marks_left_in_the_text(self):
+        marked = mark_error(VALID, SyntaxError("Oops", ("<markdown>", 5, 1, "")))
+        with self.edits(INVALID, marked), mock.patch("sys.stderr", io.StringIO()):
+            task_lists = self.editor.edit_until_valid(VALID, markdown_to_task_lists)
+
+        self.assertEqual("Task 1", task_lists[0].tasks[0].title)
+
+    def test_gives_up_when_marked_text_is_unchanged(self):
+        stderr = io.StringIO()
+        with (
+            mock.patch.object(self.editor, "edit", side_effect=lambda text: text),
+            mock.patch("sys.stderr", stderr),
+        ):
+            with self.assertRaises(SyntaxError):
+                self.editor.edit_until_valid(INVALID, markdown_to_task_lists)
+
+            self.assertEqual(2, self.editor.edit.call_count)
+        self.assertIn("<markdown>:5:", stderr.getvalue())
+
+
+class TestEditCommand(CacheTestCase):
+    def setUp(self):
+        super().setUp()
+        self.server = FakeServer()
+        self.server.add_task_list("1", "Home")
+        self.server.add_task("1", "a", "Paint")
+        self.service = FakeGoogleApiService(self.server, TaskListCache("test"))
+        # The cached Task Lists are edited while the current ones are fetched.
+        self.service.fetch_task_lists()
+        self.backup = Backup("test")
+        self.addCleanup(self.backup.close)
+        self.editor = Editor("true")
+        self.output = io.StringIO()
+
+    def edit(self, *fetch_results):
+        fetch_task_lists = self.service.fetch_task_lists
+
+        def fetch():
+            result = fetch_results[self.service.fetch_task_lists.call_count - 1]
+            if isinstance(result, Exception):
+                raise result
+            return fetch_task_lists()
+
+        with (
+            mock.patch.object(self.service, "fetch_task_lists", side_effect=fetch),
+            mock.patch.object(
+                self.editor,
+                "edit",
+                side_effect=lambda text: text.replace("Paint", "Clean"),
+            ),
+        ):
+            commands.edit(self.service, self.editor, self.backup, None, self.output)
+
+    def titles(self):
+        return [t["title"] for t in self.server.task_lists["1"]["tasks"]]
+
+    def test_retries_failed_fetch(self):
+        self.edit(http_error(503), None)
+
+        self.assertEqual(["Clean"], self.titles())
+
+    def test_saves_edit_when_fetch_fails(self):
+        with self.assertRaises(OSError):
+            self.edit(http_error(503), OSError("Network is unreachable"))
+
+        self.assertEqual(["Paint"], self.titles())
+        path = f"{self.cache_dir}/backups/recovered.md"
+        self.assertIn(path, self.output.getvalue())
+        with open(path) as recovered:
+            self.assertIn("Clean", recovered.read())
+
+
+class TestErrorMarks(unittest.TestCase):
+    def test_marks_line_of_the_error(self):
+        text = mark_error("a\nb\nc\n", SyntaxError("Bad --> b", ("f", 2, 1, "b")))
+
+        self.assertEqual(
+            "a\n<!-- gtasks-md error: line 2: Bad - -> b -->\nb\nc\n", text
+        )
+        self.assertEqual("a\nb\nc\n", strip_error_marks(text))
+
+    def test_marks_end_of_text_without_trailing_newline(self):
+        text = mark_error("a\nb", SyntaxError("Bad", ("f", 5, 1, "")))
+
+        self.assertEqual("a\nb\n<!-- gtasks-md error: line 5: Bad -->\n", text)
+        self.assertEqual("a\nb\n", strip_error_marks(text))
+
+    def test_marks_top_without_line(self):
+        text = mark_error("a\n", SyntaxError("Could not parse\nnote"))
+
+        self.assertEqual("<!-- gtasks-md error: Could not parse note -->\na\n", text)
@@ -0,0 +1,97 @@
+import pickle
+import unittest
+from unittest import mock
+
+import pandoc
+
+from app import fragments
+from app import pandoc as app_pandoc
+from app.fragments import FragmentCache
+from app.profiling import Profiler
+from app.tasks import Task, TaskList, TaskStatus
+from tests.fakes import CacheTestCase
+
+
+class TestFragmentCache(CacheTestCase):
+    def test_matches_pandoc(self):
+        cache = FragmentCache("test")
+        self.addCleanup(cache.close)
+
+        doc = cache.read("Some *note*")
+        self.assertEqual(pandoc.read("Some *note*"), doc)
+        self.assertEqual(pandoc.write(doc), cache.write(doc))
+        self.assertEqual(
+            pandoc.write(doc, options=["--columns=10"]),
+            cache.write(doc, ["--columns=10"]),
+        )
+
+    def test_reuses_flushed_conversions(self):
+        cache = FragmentCache("test")
+        doc = cache.read("Some *note*")
+        text = cache.write(doc)
+        cache.close()
+
+        cache = FragmentCache("test")
+        self.addCleanup(cache.close)
+        with mock.patch("pandoc.read") as read, mock.patch("pandoc.write") as write:
+            self.assertEqual(doc, cache.read("Some *note*"))
+            self.assertEqual(text, cache.write(doc))
+        read.assert_not_called()
+        write.assert_not_called()
+
+    def test_evicts_least_recently_used(self):
+        cache = FragmentCache("test", max_size=150)
+        self.addCleanup(cache.close)
+        cache.read("First")
+        cache.flush()
+        cache.read("Second")
+        cache.flush()
+
+        with mock.patch("pandoc.read", wraps=pandoc.read) as read:
+            cache.read("Second")
+            cache.read("First")
+        self.assertEqual([mock.call("First")], read.call_args_list)
+
+    def test_counts_pandoc_runs_on_misses_only(self):
+        cache = FragmentCache("test")
+        self.addCleanup(cache.close)
+        profiler = Profiler()
+        profiler.enable()
+        task = Task("", "Task", "Note", 0, TaskStatus.PENDING, [])
+        task_lists = [TaskList("", "Task List", [task])]
+
+        def counted(convert, *args, **kwargs):
+            convert(*args, **kwargs)
+            before = dict(profiler.counters)
+            convert(*args, **kwargs)
+            return {
+                name: profiler.counters[name] - before.get(name, 0)
+                for name in ("pandoc reads", "pandoc writes")
+            }
+
+        with (
+            mock.patch.object(fragments, "profiler", profiler),
+            mock.patch.object(app_pandoc, "profiler", profiler),
+        ):
+            text = app_pandoc.task_lists_to_markdown(task_lists, cache)
+            rendered = counted(app_pandoc.task_lists_to_markdown, task_lists, cache)
+            parsed = counted(app_pandoc.markdown_to_task_lists, text, cache=cache)
+
+        # Only the whole document is converted again, fragments are cached.
+        self.assertEqual({"pandoc reads": 0, "pandoc writes": 1}, rendered)
+        self.assertEqual({"pandoc reads": 1, "pandoc writes": 0}, parsed)
+
+    def test_pickles_location_only(self):
+        cache = FragmentCache("test")
+        self.addCleanup(cache.close)
+        cache.read("Some *note*")
+
+        copy = pickle.loads(pickle.dumps(cache))
+        self.addCleanup(copy.close)
+
+        self.assertEqual(cache.path, copy.path)
+        self.assertEqual({}, copy._pending)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,348 @@
+import asyncio
+import copy
+import io
+import tracemalloc
+import unittest
+from datetime import datetime
+from unittest import mock
+
+import pandoc
+
+from app import commands
+from app import pandoc as app_pandoc
+from app.cache import TaskListCache
+from app.googleapi import Change, ChangeOp, is_conflict, task_from_item
+from app.search import SearchIndex
+from app.tasks import Task, TaskStatus
+from tests.fakes import (
+    CacheTestCase,
+    FakeGoogleApiService,
+    FakeRequest,
+    FakeServer,
+    FakeTasks,
+    http_error,
+)
+
+
+class TestFetchTaskLists(CacheTestCase):
+    def setUp(self):
+        super().setUp()
+        self.server = FakeServer()
+        self.server.add_task_list("1", "Task List 1")
+        self.server.add_task("1", "a", "Task 1", 1)
+        self.server.add_task("1", "b", "Subtask 1", 0, parent="a")
+        self.server.add_task("1", "c", "Task 0", 0, status="completed")
+        self.server.add_task_list("2", "Task List 2")
+        self.server.add_task("2", "d", "Task 2")
+
+    def test_builds_task_tree(self):
+        task_lists = FakeGoogleApiService(self.server).fetch_task_lists()
+
+        self.assertEqual(["Task List 1", "Task List 2"], [t.title for t in task_lists])
+        tasks = task_lists[0].tasks
+        self.assertEqual(["Task 0", "Task 1"], [t.title for t in tasks])
+        self.assertEqual(TaskStatus.COMPLETED, tasks[0].status)
+        self.assertEqual(["Subtask 1"], [t.title for t in tasks[1].subtasks])
+
+    def test_reports_fetched_task_lists(self):
+        fetched = []
+        task_lists = FakeGoogleApiService(self.server).fetch_task_lists(
+            lambda task_list: fetched.append(copy.deepcopy(task_list))
+        )
+
+        fetched.sort(key=lambda tl: tl.title)
+        self.assertEqual(task_lists, fetched)
+
+    def test_skips_unchanged_task_lists(self):
+        service = FakeGoogleApiService(self.server, TaskListCache("test"))
+        first = service.fetch_task_lists()
+
+        self.server.calls.clear()
+        self.server.task_lists["2"]["updated"] = "2022-01-02T00:00:00.000Z"
+        self.server.add_task("2", "e", "Task 3", 1)
+        second = service.fetch_task_lists()
+
+        fetched_lists = {id for (call, id) in self.server.calls if call == "tasks.list"}
+        self.assertEqual({"2"}, fetched_lists)
+        self.assertEqual(first[0], second[0])
+        self.assertEqual(["Task 2", "Task 3"], [t.title for t in second[1].tasks])
+
+    def test_reuses_pending_tasks_when_completed_window_changes(self):
+        service = FakeGoogleApiService(self.server, TaskListCache("test"))
+        service.completed_after = datetime(2022, 1, 1).astimezone()
+        first = service.fetch_task_lists()
+
+        self.server.list_requests.clear()
+        service.completed_after = datetime(2021, 1, 1).astimezone()
+        second = service.fetch_task_lists()
+
+        self.assertEqual(
+            [("1", True), ("2", True)],
+            sorted((id, r["showCompleted"]) for id, r in self.server.list_requests),
+        )
+        self.assertEqual(first, second)
+
+    def test_reads_cached_task_lists_without_fetching(self):
+        service = FakeGoogleApiService(self.server, TaskListCache("test"))
+        self.assertIsNone(service.read_cached_task_lists())
+        fetched = service.fetch_task_lists()
+
+        self.server.calls.clear()
+        cached = service.read_cached_task_lists()
+
+        self.assertEqual([], self.server.calls)
+        self.assertEqual(fetched, cached)
+
+    def test_fetches_everything_without_cache(self):
+        service = FakeGoogleApiService(self.server)
+        service.fetch_task_lists()
+
+        self.server.calls.clear()
+        service.fetch_task_lists()
+
+        fetched_lists = {id for (call, id) in self.server.calls if call == "tasks.list"}
+        self.assertEqual({"1", "2"}, fetched_lists)
+
+    def test_passes_tasks_only_to_callback_with_low_memory(self):
+        index = SearchIndex("test")
+        service = FakeGoogleApiService(self.server, TaskListCache("test"), None, index)
+        fetched = []
+
+        task_lists = service.fetch_task_lists(
+            lambda task_list: fetched.append(len(task_list.tasks)), low_memory=True
+        )
+
+        self.assertEqual([2, 1], sorted(fetched, reverse=True))
+        self.assertEqual([[], []], [task_list.tasks for task_list in task_lists])
+        self.assertIsNone(service.read_cached_task_lists())
+        self.assertEqual(["Subtask 1"], [r.title for r in index.search("Subtask")])
+
+
+class TestLowMemoryFetch(CacheTestCase):
+    # Peak of memory allocated while fetching 10k Tasks, not counting the server.
+    MAX_PEAK_PER_10K_TASKS = 2**20
+    # Peak of memory allocated while viewing 10k Tasks, with stubbed pandoc.
+    MAX_VIEW_PEAK_PER_10K_TASKS = 2 * 2**20
+
+    def setUp(self):
+        super().setUp()
+        self.server = FakeServer()
+        for i in range(20):
+            self.server.add_task_list(str(i), f"Task List {i}")
+            for j in range(500):
+                self.server.add_task(
+                    str(i), f"{i}-{j}", f"Task {j} of list {i}", j, notes="Note " * 20
+                )
+
+    def peak(self, low_memory):
+        service = FakeGoogleApiService(self.server, None, None, SearchIndex("test"))
+        titles = []
+        tracemalloc.start()
+        try:
+            service.fetch_task_lists(
+                lambda task_list: titles.append(task_list.title), low_memory
+            )
+            return tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    def test_caps_memory_per_10k_tasks(self):
+        peak = self.peak(low_memory=True)
+
+        self.assertLess(peak, self.MAX_PEAK_PER_10K_TASKS)
+        self.assertLess(peak, self.peak(low_memory=False) / 2)
+
+    def view_peak(self, low_memory):
+        service = FakeGoogleApiService(self.server, None, None, SearchIndex("test"))
+        note = pandoc.read("Note " * 20)
+        # Pandoc is stubbed to keep the test fast, plain functions don't hold
+        # on to their arguments like mocks do.
+        with (
+            mock.patch.object(app_pandoc, "_read", lambda *_: note),
+            mock.patch.object(app_pandoc, "_write", lambda *_: "Task\n"),
+        ):
+            tracemalloc.start()
+            try:
+                commands.view(service, None, io.StringIO(), low_memory=low_memory)
+                return tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+
+    def test_caps_memory_of_view_per_10k_tasks(self):
+        peak = self.view_peak(low_memory=True)
+
+        self.assertLess(peak, self.MAX_VIEW_PEAK_PER_10K_TASKS)
+        self.assertLess(peak, self.view_peak(low_memory=False) / 2)
+
+
+class TestReconcile(unittest.TestCase):
+    def setUp(self):
+        self.server = FakeServer()
+        self.server.add_task_list("1", "Task List 1")
+        self.server.add_task("1", "a", "Task 1", 0)
+        self.server.add_task("1", "b", "Task 2", 1)
+        self.service = FakeGoogleApiService(self.server)
+
+    def test_patches_unchanged_task(self):
+        old_task_lists = self.service.fetch_task_lists()
+        new_task_lists = copy.deepcopy(old_task_lists)
+        new_task_lists[0].tasks[0].note = "local"
+
+        asyncio.run(self.service.reconcile(old_task_lists, new_task_lists))
+
+        self.assertEqual("local", self.server.find_task("1", "a")["notes"])
+
+    def test_merges_task_changed_on_server(self):
+        old_task_lists = self.service.fetch_task_lists()
+        new_task_lists = copy.deepcopy(old_task_lists)
+        new_task_lists[0].tasks[0].note = "local"
+        remote_task = self.server.find_task("1", "a")
+        remote_task["status"] = "completed"
+        self.server.touch(remote_task)
+
+        asyncio.run(self.service.reconcile(old_task_lists, new_task_lists))
+
+        self.assertIn(("tasks.get", "a"), self.server.calls)
+        self.assertEqual("local", remote_task["notes"])
+        self.assertEqual("completed", remote_task["status"])
+
+    def test_restores_tasks_by_id(self):
+        snapshot = self.service.fetch_task_lists()
+        self.server.find_task("1", "a")["title"] = "Renamed"
+        self.server.task_lists["1"]["title"] = "Renamed List"
+        self.server.task_lists["1"]["tasks"].remove(self.server.find_task("1", "b"))
+        current = self.service.fetch_task_lists()
+
+        self.server.calls.clear()
+        asyncio.run(self.service.reconcile(current, snapshot))
+
+        self.assertEqual("Task List 1", self.server.task_lists["1"]["title"])
+        self.assertEqual("Task 1", self.server.find_task("1", "a")["title"])
+        self.assertIn(("tasks.patch", "a"), self.server.calls)
+        self.assertIn(("tasks.insert", "Task 2"), self.server.calls)
+        self.assertNotIn(("tasks.delete", "a"), self.server.calls)
+
+    def test_keeps_deleted_task_changed_on_server(self):
+        old_task_lists = self.service.fetch_task_lists()
+        new_task_lists = copy.deepcopy(old_task_lists)
+        del new_task_lists[0].tasks[1]
+        remote_task = self.server.find_task("1", "b")
+        remote_task["notes"] = "remote"
+        self.server.touch(remote_task)
+
+        asyncio.run(self.service.reconcile(old_task_lists, new_task_lists))
+
+        self.assertEqual(remote_task, self.server.find_task("1", "b"))
+
+    def test_applies_other_changes_after_failed_insert(self):
+        old_task_lists = self.service.fetch_task_lists()
+        new_task_lists = copy.deepcopy(old_task_lists)
+        for title in ["Broken", "Task 3"]:
+            new_task_lists[0].tasks.append(
+                Task("", title, "", 0, TaskStatus.PENDING, [])
+            )
+        new_task_lists[0].tasks[0].note = "local"
+        insert = FakeTasks.insert
+
+        def fail(_):
+            raise http_error(500)
+
+        def failing_insert(tasks, tasklist, body, **kwargs):
+            if body["title"] == "Broken":
+                return FakeRequest(fail)
+            return insert(tasks, tasklist, body, **kwargs)
+
+        with (
+            mock.patch.object(FakeTasks, "insert", failing_insert),
+            self.assertLogs(level="ERROR") as logs,
+        ):
+            asyncio.run(self.service.reconcile(old_task_lists, new_task_lists))
+
+        self.assertIn("Failed to insert Task Broken", logs.output[0])
+        titles = [task["title"] for task in self.server.task_lists["1"]["tasks"]]
+        self.assertEqual(["Task 1", "Task 2", "Task 3"], titles)
+        self.assertEqual("local", self.server.find_task("1", "a")["notes"])
+
+
+class TestClearTaskList(unittest.TestCase):
+    def test_hides_completed_tasks_with_single_request(self):
+        server = FakeServer()
+        server.add_task_list("1", "Task List 1")
+        server.add_task("1", "a", "Task 1", 0)
+        for i in range(1, 100):
+            server.add_task("1", f"c{i}", f"Done {i}", i, status="completed")
+        service = FakeGoogleApiService(server)
+
+        service.clear_task_list(service.find_task_list("Task List 1"))
+
+        self.assertEqual([("tasklists.list", ""), ("tasks.clear", "1")], server.calls)
+        hidden = [t["id"] for t in server.task_lists["1"]["tasks"] if t.get("hidden")]
+        self.assertEqual(99, len(hidden))
+        self.assertNotIn("a", hidden)
+
+
+class TestAsyncApi(unittest.TestCase):
+    def setUp(self):
+        self.server = FakeServer()
+        self.server.add_task_list("1", "Task List 1")
+        self.server.add_task_list("2", "Task List 2")
+        for i in range(5):
+            self.server.add_task("1", f"a{i}", f"Task {i}", i)
+        self.server.add_task("1", "b", "Subtask", 0, parent="a0")
+        self.server.add_task("1", "c", "Done", 6, status="completed")
+        self.server.add_task("2", "d", "Other", 0)
+        self.service = FakeGoogleApiService(self.server)
+
+    def collect(self, **kwargs):
+        async def collect():
+            return [
+                (streamed.task_list.id, streamed.parent_id, streamed.task.title)
+                async for streamed in self.service.iter_tasks(**kwargs)
+            ]
+
+        return asyncio.run(collect())
+
+    def test_iterates_tasks_page_by_page(self):
+        with mock.patch("app.googleapi.PAGE_SIZE", 2):
+            streamed = self.collect()
+
+        self.assertEqual(8, len(streamed))
+        self.assertIn(("1", "a0", "Subtask"), streamed)
+        pages = [kwargs for id, kwargs in self.server.list_requests if id == "1"]
+        self.assertEqual(["", "2", "4", ""], [page["pageToken"] for page in pages])
+
+    def test_filters_task_lists_and_status(self):
+        streamed = self.collect(
+            list_filter=lambda task_list: task_list.title == "Task List 1",
+            status="completed",
+        )
+
+        self.assertEqual([("1", "", "Done")], streamed)
+
+    def test_applies_plan(self):
+        task = task_from_item(self.server.find_task("1", "a1"))
+        task.title = "Renamed"
+        stale = task_from_item(self.server.find_task("1", "a2"))
+        self.server.touch(self.server.find_task("1", "a2"))
+
+        results = asyncio.run(
+            self.service.apply(
+                [
+                    Change(ChangeOp.PATCH, "1", task),
+                    Change(ChangeOp.DELETE, "1", stale),
+                    Change(
+                        ChangeOp.INSERT,
+                        "2",
+                        Task("", "New", "", 0, TaskStatus.PENDING, []),
+                    ),
+                ]
+            )
+        )
+
+        self.assertEqual("Renamed", results[0]["title"])
+        self.assertTrue(is_conflict(results[1]))
+        self.assertEqual("New", self.server.find_task("2", results[2]["id"])["title"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,196 @@
+import json
+import random
+from unittest import mock
+
+from app import importer
+from app.importer import Importer
+from tests.fakes import CacheTestCase, FakeGoogleApiService, FakeServer, http_error
+
+
+class TestImporter(CacheTestCase):
+    def setUp(self):
+        super().setUp()
+        self.server = FakeServer()
+        self.server.add_task_list("1", "Home")
+        self.service = FakeGoogleApiService(self.server)
+
+    def write(self, name, text):
+        path = f"{self.tmp_dir}/{name}"
+        with open(path, "w") as f:
+            f.write(text)
+        return path
+
+    def tasks(self, task_list_id):
+        return {
+            task["title"]: task
+            for task in self.server.task_lists[task_list_id]["tasks"]
+        }
+
+    def test_imports_csv_with_subtasks_in_order(self):
+        path = self.write(
+            "tasks.csv",
+            "list,id,parent,title,notes,status\n"
+            "Home,a,,Paint,,needsAction\n"
+            "Home,b,a,Buy paint,Blue,completed\n"
+            "Home,c,a,Paint walls,,\n"
+            "Home,d,,Clean,,\n",
+        )
+
+        created, skipped = Importer(self.service, "test").run(path)
+
+        self.assertEqual((4, 0), (created, skipped))
+        tasks = self.tasks("1")
+        self.assertEqual(tasks["Paint"]["id"], tasks["Buy paint"]["parent"])
+        self.assertEqual("Blue", tasks["Buy paint"]["notes"])
+        self.assertEqual("completed", tasks["Buy paint"]["status"])
+        self.assertEqual(
+            ["Paint", "Clean"], [t["title"] for t in self.server.siblings("1", "")]
+        )
+        self.assertEqual(
+            ["Buy paint", "Paint walls"],
+            [t["title"] for t in self.server.siblings("1", tasks["Paint"]["id"])],
+        )
+
+    def execute_in_order(self, order):
+        def execute_in_batches(_, requests):
+            for request, callback in order(requests):
+                callback(None, request.execute(), None)
+
+        return mock.patch.object(
+            FakeGoogleApiService,
+            "execute_in_batches",
+            autospec=True,
+            side_effect=execute_in_batches,
+        )
+
+    def test_batches_hold_lists_of_siblings(self):
+        lines = [
+            json.dumps({"list": "Work" if i % 2 else "Home", "title": f"Task {i}"})
+            for i in range(6)
+        ]
+        path = self.write("tasks.jsonl", "\n".join(lines))
+
+        with self.execute_in_order(list) as execute:
+            Importer(self.service, "test").run(path)
+
+        # Siblings are inserted together, and their positions are checked.
+        self.assertEqual([6, 6], [len(c.args[1]) for c in execute.call_args_list])
+        self.assertIn(("tasklists.insert", "Work"), self.server.calls)
+        self.assertEqual(
+            ["Task 0", "Task 2", "Task 4"],
+            [t["title"] for t in self.server.task_lists["1"]["tasks"]],
+        )
+
+    def test_moves_siblings_inserted_out_of_order(self):
+        lines = [json.dumps({"list": "Home", "title": f"Task {i}"}) for i in range(5)]
+        path = self.write("tasks.jsonl", "\n".join(lines))
+        self.server.add_task("1", "x", "Existing")
+
+        with self.execute_in_order(reversed) as execute:
+            Importer(self.service, "test").run(path)
+
+        self.assertEqual(
+            ["Task 0", "Task 1", "Task 2", "Task 3", "Task 4", "Existing"],
+            [t["title"] for t in self.server.task_lists["1"]["tasks"]],
+        )
+        # Inserted in reverse, only the first Task is in order. The others are
+        # moved one after another, each after the previous sibling.
+        self.assertEqual(
+            [5, 5, 1, 1, 1, 1], [len(c.args[1]) for c in execute.call_args_list]
+        )
+
+    def test_orders_siblings_whatever_order_they_are_inserted_in(self):
+        lines = [
+            json.dumps({"list": "Home", "id": str(i), "title": f"Task {i}"})
+            for i in range(20)
+        ] + [
+            json.dumps({"list": "Home", "parent": "3", "title": f"Subtask {i}"})
+            for i in range(20)
+        ]
+
+        for seed in range(5):
+            with self.subTest(seed=seed):
+                self.server.task_lists["1"]["tasks"].clear()
+                path = self.write(f"tasks-{seed}.jsonl", "\n".join(lines))
+                rng = random.Random(seed)
+                with self.execute_in_order(lambda r, rng=rng: rng.sample(r, len(r))):
+                    Importer(self.service, "test").run(path)
+
+                parent = self.tasks("1")["Task 3"]["id"]
+                self.assertEqual(
+                    [f"Task {i}" for i in range(20)],
+                    [t["title"] for t in self.server.siblings("1", "")],
+                )
+                self.assertEqual(
+                    [f"Subtask {i}" for i in range(20)],
+                    [t["title"] for t in self.server.siblings("1", parent)],
+                )
+
+    def test_imports_ndjson_written_by_view(self):
+        path = self.write(
+            "tasks.ndjson",
+            '{"kind":"tasks#taskList","id":"x","title":"Home"}\n'
+            '{"kind":"tasks#task","id":"t1","list":"x","parent":"","title":"Paint"}\n'
+            '{"kind":"tasks#task","id":"t2","list":"x","parent":"t1","title":"Walls"}\n',
+        )
+
+        Importer(self.service, "test").run(path)
+
+        tasks = self.tasks("1")
+        self.assertEqual(tasks["Paint"]["id"], tasks["Walls"]["parent"])
+
+    def test_resumes_interrupted_import(self):
+        path = self.write(
+            "tasks.csv",
+            "list,id,parent,title,notes,status\n"
+            "Home,a,,Paint,,\n"
+            "Home,b,,Clean,,\n"
+            "Home,c,,Cook,,\n",
+        )
+        add_task = self.server.add_task
+
+        def fail_on_clean(task_list_id, id, title, *args, **kwargs):
+            if title == "Clean":
+                raise http_error(503)
+            return add_task(task_list_id, id, title, *args, **kwargs)
+
+        with (
+            mock.patch.object(self.server, "add_task", side_effect=fail_on_clean),
+            self.assertRaisesRegex(RuntimeError, "line 3"),
+        ):
+            Importer(self.service, "test").run(path)
+
+        created, skipped = Importer(self.service, "test").run(path)
+
+        self.assertEqual((1, 2), (created, skipped))
+        self.assertEqual(["Paint", "Clean", "Cook"], list(self.tasks("1")))
+        paint = self.tasks("1")["Paint"]["id"]
+        self.assertEqual(("1", "", paint), self.server.insert_requests[-1])
+
+    def test_keeps_memory_bounded_to_the_window(self):
+        lines = [json.dumps({"list": "Home", "title": f"Task {i}"}) for i in range(30)]
+        path = self.write("tasks.jsonl", "\n".join(lines))
+        read_records = importer.read_records
+        read = []
+
+        def tracked(path):
+            for record in read_records(path):
+                read.append(len(self.server.task_lists["1"]["tasks"]))
+                yield record
+
+        with (
+            mock.patch.object(importer, "WINDOW_SIZE", 5),
+            mock.patch.object(importer, "read_records", tracked),
+        ):
+            Importer(self.service, "test").run(path)
+
+        # No record is read more than a window ahead of the inserted ones.
+        self.assertTrue(all(i - inserted < 5 for i, inserted in enumerate(read)))
+
+    def test_rejects_subtasks_of_unknown_parents(self):
+        path = self.write(
+            "tasks.csv", "list,id,parent,title,notes,status\nHome,a,z,Paint,,\n"
+        )
+
+        with self.assertRaisesRegex(SyntaxError, "Parent z not found"):
+            Importer(self.service, "test").run(path)
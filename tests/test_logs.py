@@ -0,0 +1,62 @@
+import json
+import logging
+import os
+import tempfile
+import unittest
+
+from app.logs import log_op, setup_logging
+
+
+class TestLogs(unittest.TestCase):
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.path = f"{tmp_dir.name}/log.txt"
+
+        root = logging.getLogger()
+        handlers, level = root.handlers, root.level
+        root.handlers = []
+
+        def restore():
+            root.handlers, root.level = handlers, level
+
+        self.addCleanup(restore)
+
+    def read(self, path):
+        with open(path) as log_file:
+            return [json.loads(line) for line in log_file]
+
+    def test_writes_json_records_in_background(self):
+        listener = setup_logging(self.path)
+        log_op(
+            logging.INFO,
+            "task.insert",
+            "Inserted Task %s",
+            "Task 1",
+            task_id="a",
+            started=0.0,
+        )
+        logging.warning("Conflict: %s", "title")
+        listener.stop()
+
+        inserted, conflict = self.read(self.path)
+        self.assertEqual("Inserted Task Task 1", inserted["message"])
+        self.assertEqual("task.insert", inserted["op"])
+        self.assertEqual("a", inserted["task_id"])
+        self.assertGreater(inserted["latency_ms"], 0)
+        self.assertEqual("WARNING", conflict["level"])
+        self.assertNotIn("op", conflict)
+
+    def test_rotates_by_size(self):
+        listener = setup_logging(self.path, max_bytes=500, backup_count=2)
+        for i in range(100):
+            logging.info("Moved Task %d", i)
+        listener.stop()
+
+        self.assertTrue(os.path.exists(f"{self.path}.2"))
+        self.assertFalse(os.path.exists(f"{self.path}.3"))
+        self.assertEqual("Moved Task 99", self.read(self.path)[-1]["message"])
+
+
+if __name__ == "__main__":
+    unittest.main()
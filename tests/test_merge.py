@@ -0,0 +1,85 @@
+import unittest
+
+from app.merge import merge_task_lists
+from app.tasks import Task, TaskList, TaskStatus
+
+
+class TestMergeTaskLists(unittest.TestCase):
+    def test_keeps_changes_from_both_sides(self):
+        base = [task_list("A", task("1"), task("2"))]
+        local = [task_list("A", task("1", note="local"), task("2"))]
+        remote = [task_list("A", task("1"), task("2", status=TaskStatus.COMPLETED))]
+
+        merged, conflicts = merge_task_lists(base, local, remote)
+
+        self.assertEqual(
+            [
+                task_list(
+                    "A",
+                    task("1", note="local"),
+                    task("2", status=TaskStatus.COMPLETED),
+                )
+            ],
+            merged,
+        )
+        self.assertEqual([], conflicts)
+
+    def test_local_change_wins_conflict(self):
+        base = [task_list("A", task("1"))]
+        local = [task_list("A", task("1", note="local"))]
+        remote = [task_list("A", task("1", note="remote"))]
+
+        merged, conflicts = merge_task_lists(base, local, remote)
+
+        self.assertEqual([task_list("A", task("1", note="local"))], merged)
+        self.assertEqual(["A / 1: note changed locally and on the server"], conflicts)
+
+    def test_keeps_tasks_added_on_server_in_place(self):
+        base = [task_list("A", task("1"), task("3"))]
+        local = [task_list("A", task("0"), task("1"), task("3"))]
+        remote = [task_list("A", task("1"), task("2"), task("3"))]
+
+        merged, conflicts = merge_task_lists(base, local, remote)
+
+        titles = [t.title for t in merged[0].tasks]
+        self.assertEqual(["0", "1", "2", "3"], titles)
+        self.assertEqual([], conflicts)
+
+    def test_applies_deletions_from_both_sides(self):
+        base = [task_list("A", task("1"), task("2")), task_list("B")]
+        local = [task_list("A", task("2")), task_list("B")]
+        remote = [task_list("A", task("1"), task("2"))]
+
+        merged, conflicts = merge_task_lists(base, local, remote)
+
+        self.assertEqual([task_list("A", task("2"))], merged)
+        self.assertEqual([], conflicts)
+
+    def test_keeps_task_deleted_locally_but_changed_on_server(self):
+        base = [task_list("A", task("1", subtasks=[task("1.1")]))]
+        local = [task_list("A")]
+        remote = [task_list("A", task("1", subtasks=[task("1.1"), task("1.2")]))]
+
+        merged, conflicts = merge_task_lists(base, local, remote)
+
+        self.assertEqual(remote, merged)
+        self.assertEqual(
+            ["A / 1: deleted locally but changed on the server"], conflicts
+        )
+
+
+def task_list(title: str, *tasks) -> TaskList:
+    return TaskList("", title, list(tasks))
+
+
+def task(
+    title: str,
+    note: str = "",
+    status: TaskStatus = TaskStatus.PENDING,
+    subtasks: list[Task] | None = None,
+) -> Task:
+    return Task("", title, note, 0, status, subtasks or [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,80 @@
+import io
+import random
+import unittest
+from unittest import mock
+
+from app.ndjson import read_task_lists, write_task_list
+from benchmarks import synthetic
+
+
+class TestNdjson(unittest.TestCase):
+    def test_round_trip(self):
+        task_lists = synthetic.task_lists(
+            random.Random(0), depth=3, vocabulary=synthetic.UNICODE_WORDS
+        )
+        for i, task_list in enumerate(task_lists):
+            task_list.id = f"list-{i}"
+
+        def assign_ids(tasks, prefix):
+            for i, task in enumerate(tasks):
+                task.id = f"{prefix}{i}"
+                assign_ids(task.subtasks, f"{task.id}.")
+
+        for task_list in task_lists:
+            assign_ids(task_list.tasks, f"{task_list.id}/")
+
+        output = io.StringIO()
+        with mock.patch("pandoc.read") as read, mock.patch("pandoc.write") as write:
+            for task_list in task_lists:
+                write_task_list(task_list, output)
+            parsed_task_lists = read_task_lists(io.StringIO(output.getvalue()))
+        read.assert_not_called()
+        write.assert_not_called()
+
+        self.assertEqual(task_lists, parsed_task_lists)
+        self.assertEqual(
+            [tl.id for tl in task_lists], [tl.id for tl in parsed_task_lists]
+        )
+
+    def test_orders_tasks_by_position(self):
+        lines = [
+            '{"kind": "tasks#taskList", "title": "List"}',
+            '{"kind": "tasks#task", "id": "b", "title": "B", "position": 1}',
+            '{"kind": "tasks#task", "id": "a", "title": "A", "position": 0}',
+            '{"kind": "tasks#task", "title": "A.1", "parent": "a"}',
+        ]
+
+        [task_list] = read_task_lists(lines)
+
+        self.assertEqual(["A", "B"], [t.title for t in task_list.tasks])
+        self.assertEqual(["A.1"], [t.title for t in task_list.tasks[0].subtasks])
+
+    def test_orders_tasks_without_position_after_the_others(self):
+        lines = [
+            '{"kind": "tasks#taskList", "title": "List"}',
+            '{"kind": "tasks#task", "title": "C"}',
+            '{"kind": "tasks#task", "title": "B", "position": 1}',
+            '{"kind": "tasks#task", "title": "A", "position": 1}',
+            '{"kind": "tasks#task", "title": "D"}',
+        ]
+
+        [task_list] = read_task_lists(lines)
+
+        self.assertEqual(["B", "A", "C", "D"], [t.title for t in task_list.tasks])
+        self.assertEqual([0, 1, 2, 3], [t.position for t in task_list.tasks])
+
+    def test_reports_line_of_invalid_record(self):
+        lines = [
+            '{"kind": "tasks#taskList", "title": "List"}',
+            '{"kind": "tasks#task", "title": "A", "parent": "missing"}',
+        ]
+
+        with self.assertRaises(SyntaxError) as cm:
+            read_task_lists(lines, "tasks.ndjson")
+        self.assertEqual(
+            ("tasks.ndjson", 2), (cm.exception.filename, cm.exception.lineno)
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
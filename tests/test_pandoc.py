@@ -1,8 +1,19 @@
+import random
 import unittest
 from inspect import cleandoc
-
-from app.pandoc import markdown_to_task_lists, task_lists_to_markdown
+from unittest import mock
+
+from app import pandoc
+from app.pandoc import (
+    header_to_markdown,
+    join_markdown,
+    markdown_to_task_lists,
+    split_markdown,
+    task_list_to_markdown,
+    task_lists_to_markdown,
+)
 from app.tasks import Task, TaskList, TaskStatus
+from benchmarks import synthetic
 
 
 class TestPandocConversion(unittest.TestCase):
@@ -100,6 +111,130 @@ class TestPandocConversion(unittest.TestCase):
 
         self.assertRaises(SyntaxError, markdown_to_task_lists, markdown)
 
+    def test_report_position_of_unexpected_block(self):
+        markdown = """
+        # Google Tasks
+
+        ## Task List 1
+
+        1.  [ ] Task 1
+
+        2.  [x] Task 2
+
+        Some paragraph.
+        """
+
+        with self.assertRaises(SyntaxError) as cm:
+            markdown_to_task_lists(cleandoc(markdown), filename="tasks.md")
+        self.assertEqual("tasks.md", cm.exception.filename)
+        self.assertEqual((9, 1), (cm.exception.lineno, cm.exception.offset))
+        self.assertIn("paragraph", cm.exception.msg)
+
+    def test_report_position_of_invalid_subtask(self):
+        markdown = """
+        # Google Tasks
+
+        ## Task List 1
+
+        1.  [ ] Task 1
+
+            Some note
+
+            1.  [ ] Subtask 1
+            2.
+
+        2.  [ ] Task 2
+        """
+
+        with self.assertRaises(SyntaxError) as cm:
+            markdown_to_task_lists(cleandoc(markdown))
+        self.assertEqual((10, 5), (cm.exception.lineno, cm.exception.offset))
+
+    def test_report_position_in_parallel_parts(self):
+        markdown = "# Google Tasks\n\n" + "## Task List\n\n1.  [ ] Task\n\n" * 9
+        markdown += "## Task List\n\n- Bullet\n"
+
+        with (
+            mock.patch("app.pandoc.PARALLEL_MIN_SIZE", 0),
+            self.assertRaises(SyntaxError) as cm,
+        ):
+            markdown_to_task_lists(markdown, max_workers=2)
+        self.assertEqual(41, cm.exception.lineno)
+
+    def test_parse_more_task_lists_than_recursion_limit(self):
+        markdown = "# Google Tasks\n\n" + "## Task List\n\n1.  [ ] Task\n\n" * 1200
+
+        with mock.patch("app.pandoc._write", return_value="Task"):
+            task_lists = markdown_to_task_lists(markdown)
+
+        self.assertEqual(1200, len(task_lists))
+
+    def test_sections_join_to_document(self):
+        task_lists = [
+            create_task_list("Task List 1", create_task("Task 1", "Some note.")),
+            create_task_list("Task List 2"),
+            create_task_list(
+                "Task List 3",
+                create_task("Task 2", subtasks=[create_task("Subtask 1")]),
+            ),
+        ]
+
+        sections = [header_to_markdown()]
+        sections += [task_list_to_markdown(t) for t in task_lists]
+
+        self.assertEqual(task_lists_to_markdown(task_lists), join_markdown(sections))
+
+    def test_parse_in_parallel(self):
+        task_lists = [
+            create_task_list(
+                f"Task List {i}",
+                create_task("Task 1", "Some note."),
+                create_task("Task 2", subtasks=[create_task("Subtask 1")]),
+            )
+            for i in range(6)
+        ]
+        markdown = task_lists_to_markdown(task_lists)
+
+        with mock.patch("app.pandoc.PARALLEL_MIN_SIZE", 0):
+            parsed_task_lists = markdown_to_task_lists(markdown, max_workers=2)
+
+        self.assertEqual(task_lists, parsed_task_lists)
+        self.assertGreater(len(split_markdown(markdown, 8)), 1)
+
+    def test_parse_in_processes_that_are_not_forked(self):
+        # Other threads may be running, e.g. a background fetch while editing.
+        self.assertNotEqual("fork", pandoc._pool_context().get_start_method())
+
+    def test_split_only_at_headers_after_blank_line(self):
+        markdown = """
+        # Google Tasks
+
+        ## Task List 1
+
+        1.  [ ] Task 1
+        ## Task List 2
+        """
+
+        self.assertEqual(
+            ["# Google Tasks\n\n", "## Task List 1\n\n1.  [ ] Task 1\n## Task List 2"],
+            split_markdown(cleandoc(markdown), 10),
+        )
+
+    def test_do_not_split_documents_with_references(self):
+        markdown = """
+        # Google Tasks
+
+        ## Task List 1
+
+        1.  [ ] Task 1
+
+            [link]: https://example.com
+
+        ## Task List 2
+        """
+
+        self.assertEqual(1, len(split_markdown(cleandoc(markdown), 10)))
+
     def assert_equal_after_parsing(self, task_lists: list[TaskList], markdown: str):
         parsed_markdown = task_lists_to_markdown(task_lists)
         self.assert_equal_markdown(markdown, parsed_markdown)
@@ -110,6 +245,38 @@ class TestPandocConversion(unittest.TestCase):
         self.assertEqual(cleandoc(text_1.strip()), cleandoc(text_2.strip()))
 
 
+class TestRoundTrip(unittest.TestCase):
+    """Randomized checks that the codec doesn't change Task Lists"""
+
+    SEEDS = range(8)
+
+    def test_round_trip(self):
+        for seed in self.SEEDS:
+            rng = random.Random(seed)
+            task_lists = synthetic.task_lists(
+                rng,
+                task_lists=rng.randint(1, 3),
+                width=rng.randint(1, 6),
+                depth=rng.randint(1, 4),
+                note_ratio=rng.random(),
+                vocabulary=rng.choice([synthetic.ASCII_WORDS, synthetic.UNICODE_WORDS]),
+            )
+            with self.subTest(seed=seed):
+                markdown = task_lists_to_markdown(task_lists)
+                parsed_task_lists = markdown_to_task_lists(markdown)
+
+                self.assertEqual(task_lists, parsed_task_lists)
+                self.assertEqual(markdown, task_lists_to_markdown(parsed_task_lists))
+
+    def test_round_trip_shapes(self):
+        for name, shape in synthetic.SHAPES.items():
+            task_lists = shape(random.Random(name))
+            task_lists[1:] = []
+            with self.subTest(shape=name):
+                markdown = task_lists_to_markdown(task_lists)
+                self.assertEqual(task_lists, markdown_to_task_lists(markdown))
+
+
 def create_task_list(name: str, *tasks) -> TaskList:
     return TaskList("", name, list(tasks))
 
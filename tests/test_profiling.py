@@ -0,0 +1,70 @@
+import json
+import tempfile
+import threading
+import tracemalloc
+import unittest
+
+from app.profiling import Profiler
+
+
+class TestProfiler(unittest.TestCase):
+    def test_records_nothing_when_disabled(self):
+        profiler = Profiler()
+
+        with profiler.phase("parse"):
+            profiler.count("api tasks.tasks.list")
+
+        self.assertEqual([], profiler.spans)
+        self.assertEqual({}, dict(profiler.counters))
+
+    def test_summarizes_phases_and_counters(self):
+        profiler = Profiler()
+        profiler.enable()
+
+        def fetch():
+            with profiler.phase("fetch"):
+                profiler.count("api tasks.tasks.list", 2)
+
+        threads = [threading.Thread(target=fetch) for _ in range(3)]
+        with profiler.phase("total"):
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        lines = profiler.summary().splitlines()
+        self.assertRegex(lines[1], r"^total +1 +\d+\.\d{3}$")
+        self.assertRegex(lines[2], r"^fetch +3 +\d+\.\d{3}$")
+        self.assertRegex(lines[-1], r"^api tasks\.tasks\.list +6$")
+
+    def test_reports_peak_memory(self):
+        profiler = Profiler()
+        profiler.enable(trace_memory=True)
+        self.addCleanup(tracemalloc.stop)
+        data = bytearray(4 * 2**20)
+
+        lines = profiler.summary().splitlines()
+        del data
+
+        self.assertIn("Memory", lines[2])
+        self.assertRegex(lines[3], r"^rss +\d+\.\d$")
+        python = float(lines[4].split()[1])
+        self.assertGreaterEqual(python, 4.0)
+
+    def test_writes_chrome_trace(self):
+        profiler = Profiler()
+        profiler.enable()
+        with profiler.phase("render"):
+            profiler.count("pandoc writes")
+
+        with tempfile.NamedTemporaryFile(suffix=".json") as trace_file:
+            profiler.write_chrome_trace(trace_file.name)
+            events = json.load(trace_file)["traceEvents"]
+
+        self.assertEqual(["render", "pandoc writes"], [e["name"] for e in events])
+        self.assertEqual(["X", "C"], [e["ph"] for e in events])
+        self.assertEqual({"pandoc writes": 1}, events[1]["args"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,87 @@
+import unittest
+
+from app.cache import CachedTaskList, FetchQuery
+from app.search import SearchIndex
+from tests.fakes import CacheTestCase, FakeGoogleApiService, FakeServer
+
+QUERY = FetchQuery(pending=True, completed=True)
+
+
+def item(id, title, notes="", parent="", status="needsAction"):
+    return {
+        "id": id,
+        "title": title,
+        "notes": notes,
+        "parent": parent,
+        "status": status,
+    }
+
+
+class TestSearchIndex(CacheTestCase):
+    def setUp(self):
+        super().setUp()
+        self.index = SearchIndex("test")
+
+    def search(self, query):
+        return [str(result) for result in self.index.search(query)]
+
+    def test_ranks_title_matches_first(self):
+        self.index.update(
+            {
+                "1": CachedTaskList(
+                    "Home",
+                    "1",
+                    QUERY,
+                    [
+                        item("a", "Groceries", "Buy some milk"),
+                        item("b", "Milk", parent="a"),
+                    ],
+                    [item("c", "Paint the fence", status="completed")],
+                )
+            }
+        )
+
+        self.assertEqual(
+            ["Home > Groceries > [ ] Milk", "Home > [ ] Groceries"],
+            self.search("mil"),
+        )
+        self.assertEqual(["Home > [x] Paint the fence"], self.search("fence"))
+        self.assertEqual([], self.search('fence "OR'))
+
+    def test_reindexes_only_updated_task_lists(self):
+        self.index.update(
+            {
+                "1": CachedTaskList("Home", "1", QUERY, [item("a", "Milk")]),
+                "2": CachedTaskList("Work", "1", QUERY, [item("b", "Report")]),
+            }
+        )
+        self.index.update(
+            {
+                "1": CachedTaskList("Home", "1", QUERY, [item("a", "Not indexed")]),
+                "3": CachedTaskList("Misc", "1", QUERY, [item("c", "Report")]),
+            }
+        )
+
+        self.assertEqual(["Home > [ ] Milk"], self.search("milk"))
+        self.assertEqual(["Misc > [ ] Report"], self.search("report"))
+
+        self.index.update(
+            {"1": CachedTaskList("Home", "2", QUERY, [item("a", "Cheese")])}
+        )
+
+        self.assertEqual([], self.search("milk"))
+        self.assertEqual(["Home > [ ] Cheese"], self.search("cheese"))
+
+    def test_indexes_fetched_tasks(self):
+        server = FakeServer()
+        server.add_task_list("1", "Task List 1")
+        server.add_task("1", "a", "Task 1", notes="Some note")
+        service = FakeGoogleApiService(server, index=self.index)
+
+        service.fetch_task_lists()
+
+        self.assertEqual(["Task List 1 > [ ] Task 1"], self.search("note"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,128 @@
+import argparse
+import io
+import subprocess
+import sys
+import unittest
+from datetime import datetime, timedelta
+from unittest import mock
+
+from app import __main__ as cli
+from app.snapshot import ViewSnapshot, snapshot_key
+from app.tasks import Task, TaskList, TaskStatus
+from tests.fakes import CacheTestCase, FakeGoogleApiService, FakeServer
+
+
+class TestViewSnapshot(CacheTestCase):
+    def setUp(self):
+        super().setUp()
+        self.snapshot = ViewSnapshot("test")
+
+    def test_reads_what_was_written(self):
+        task_lists = [
+            TaskList(
+                "1", "Task List 1", [Task("a", "Task 1", "", 0, TaskStatus.PENDING, [])]
+            )
+        ]
+        self.snapshot.write("key", task_lists, "# Task List 1")
+
+        header = self.snapshot.read("key")
+        self.assertEqual("# Task List 1", header.markdown)
+        self.assertLess((datetime.now().astimezone() - header.fetched_at).seconds, 60)
+        self.assertEqual(task_lists, self.snapshot.read_task_lists("key"))
+
+    def test_ignores_snapshot_of_other_tasks(self):
+        self.assertIsNone(self.snapshot.read("key"))
+
+        self.snapshot.write("key", [], "")
+
+        self.assertIsNone(self.snapshot.read("other"))
+        self.assertIsNone(self.snapshot.read_task_lists("other"))
+
+    def test_keys_rolling_completion_window_by_date(self):
+        midnight = datetime(2022, 1, 1).astimezone()
+        morning = datetime(2022, 1, 1, 8).astimezone()
+        evening = datetime(2022, 1, 1, 20).astimezone()
+
+        self.assertEqual(
+            snapshot_key(morning, None, "", True), snapshot_key(evening, None, "", True)
+        )
+        self.assertNotEqual(
+            snapshot_key(morning, None, "", True),
+            snapshot_key(morning, None, "completed", True),
+        )
+        # A window given by the user doesn't match the rolling one.
+        self.assertNotEqual(
+            snapshot_key(midnight, None, ""), snapshot_key(morning, None, "", True)
+        )
+        self.assertNotEqual(
+            snapshot_key(midnight, morning, ""), snapshot_key(midnight, evening, "")
+        )
+
+    def test_cli_does_not_import_api_client(self):
+        modules = subprocess.run(
+            [
+                sys.executable,
+                "-c",
+                "import sys, app.__main__; print(' '.join(sys.modules))",
+            ],
+            capture_output=True,
+            check=True,
+            text=True,
+        ).stdout.split()
+
+        self.assertNotIn("googleapiclient", modules)
+        self.assertNotIn("pandoc", modules)
+
+
+class TestSnapshotOfCommands(CacheTestCase):
+    def setUp(self):
+        super().setUp()
+        self.server = FakeServer()
+        self.server.add_task_list("1", "Home")
+        self.server.add_task("1", "a", "Paint")
+        patcher = mock.patch(
+            "app.commands.GoogleApiService",
+            lambda user, *args: FakeGoogleApiService(self.server, *args[3:]),
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def run_command(self, subcommand, max_age=None):
+        args = argparse.Namespace(
+            subcommand=subcommand,
+            completed_after=datetime(2022, 1, 1).astimezone(),
+            completed_before=None,
+            status="",
+            rolling_window=False,
+            no_cache=True,
+            transport="session",
+            editor="true",
+            format="markdown",
+            low_memory=False,
+            offline=False,
+            max_age=max_age,
+        )
+        output = io.StringIO()
+        with mock.patch("sys.stderr", io.StringIO()):
+            cli.run(args, "test", output)
+        return output.getvalue()
+
+    def test_edit_drops_snapshot_of_view(self):
+        self.run_command("view")
+        self.server.calls.clear()
+        self.assertIn("Paint", self.run_command("view", timedelta(hours=1)))
+        self.assertEqual([], self.server.calls)
+
+        with mock.patch("app.commands.Editor") as editor:
+            editor.return_value.edit_until_valid.side_effect = (
+                lambda text, parse, output: parse(text.replace("Paint", "Clean"))
+            )
+            self.run_command("edit")
+        text = self.run_command("view", timedelta(hours=1))
+
+        self.assertIn("Clean", text)
+        self.assertNotIn("Paint", text)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,144 @@
+import contextlib
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from app.sync import FileSync
+from tests.fakes import FakeGoogleApiService, FakeServer, http_error
+
+
+class TestFileSync(unittest.TestCase):
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.file_path = f"{tmp_dir.name}/tasks.md"
+
+        self.server = FakeServer()
+        self.server.add_task_list("1", "Task List 1")
+        self.server.add_task("1", "a", "Task 1")
+
+        self.now = 0.0
+        self.sync = FileSync(
+            FakeGoogleApiService(self.server),
+            self.file_path,
+            debounce=1,
+            remote_interval=10,
+            clock=lambda: self.now,
+        )
+        with mock.patch("builtins.print"):
+            self.sync.start()
+
+    def step(self, now):
+        self.now = now
+        with mock.patch("builtins.print"):
+            self.sync.step()
+
+    def tick(self, now):
+        self.now = now
+        with mock.patch("builtins.print"):
+            self.sync.tick()
+
+    def read(self):
+        with open(self.file_path) as source:
+            return source.read()
+
+    def titles(self):
+        return [task["title"] for task in self.server.task_lists["1"]["tasks"]]
+
+    def edit(self, old, new):
+        text = self.read().replace(old, new)
+        with open(self.file_path, "w") as target:
+            target.write(text)
+
+    def test_writes_server_state(self):
+        self.assertIn("[ ] Task 1", self.read())
+
+    def test_pushes_local_edits_after_debounce(self):
+        self.edit("Task 1", "Task 1 edited")
+        self.step(1)
+        self.assertEqual(["Task 1"], self.titles())
+
+        self.edit("Task 1 edited", "Task 1 edited twice")
+        self.step(1.5)
+        self.step(2.5)
+
+        self.assertEqual(["Task 1 edited twice"], self.titles())
+        inserts = [call for call in self.server.calls if call[0] == "tasks.insert"]
+        self.assertEqual(1, len(inserts))
+
+    def test_pulls_remote_changes(self):
+        self.server.calls.clear()
+        self.step(10)
+        self.assertNotIn(("tasks.list", "1"), self.server.calls)
+
+        self.server.add_task("1", "b", "Task 2", 1)
+        self.server.task_lists["1"]["updated"] = "2022-01-02T00:00:00.000Z"
+        self.step(15)
+        self.assertNotIn("Task 2", self.read())
+        self.step(20)
+
+        self.assertIn("[ ] Task 2", self.read())
+
+    def test_keeps_invalid_local_edits(self):
+        self.edit("1.  [ ] Task 1", "Some paragraph.")
+        self.step(1)
+        self.step(2)
+
+        self.server.add_task("1", "b", "Task 2", 1)
+        self.server.task_lists["1"]["updated"] = "2022-01-02T00:00:00.000Z"
+        self.step(20)
+
+        self.assertIn("Some paragraph.", self.read())
+        self.assertTrue(os.path.exists(self.file_path))
+
+    def test_changes_tasks_within_lock(self):
+        locked = []
+        unlocked_calls = []
+        depth = 0
+
+        @contextlib.contextmanager
+        def lock():
+            nonlocal depth
+            if not depth:
+                unlocked_calls.extend(self.server.calls)
+                self.server.calls.clear()
+            depth += 1
+            yield
+            depth -= 1
+            if not depth:
+                locked.extend(self.server.calls)
+                self.server.calls.clear()
+
+        self.sync.lock = lock
+        self.server.calls.clear()
+        self.edit("Task 1", "Task 1 edited")
+        self.step(1)
+        self.step(2)
+
+        self.assertEqual(["Task 1 edited"], self.titles())
+        self.assertIn("tasks.insert", [call[0] for call in locked])
+        self.assertNotIn("tasks.insert", [call[0] for call in unlocked_calls])
+
+    def test_fetches_with_a_single_listing(self):
+        self.server.calls.clear()
+        self.sync.pull()
+
+        self.assertEqual(1, self.server.calls.count(("tasklists.list", "")))
+
+    def test_retries_failed_push_on_next_tick(self):
+        self.edit("Task 1", "Task 1 edited")
+        with mock.patch.object(
+            self.sync.service, "reconcile", side_effect=http_error(503)
+        ):
+            self.tick(1)
+        self.assertEqual(["Task 1"], self.titles())
+
+        self.tick(2)
+        self.tick(3)
+
+        self.assertEqual(["Task 1 edited"], self.titles())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,79 @@
+import json
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from google.auth.credentials import AnonymousCredentials
+from googleapiclient.discovery import build
+
+from app.transport import SessionHttp
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self.server.peers.add(self.client_address)
+        body = json.dumps({"items": [{"id": "1", "title": self.path}]}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *_):
+        pass
+
+
+class TestSessionHttp(unittest.TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.peers = set()
+        thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        thread.start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+        self.http = SessionHttp(AnonymousCredentials())
+        self.addCleanup(self.http.close)
+        self.url = f"http://127.0.0.1:{self.server.server_port}/"
+
+    def test_returns_httplib2_response(self):
+        resp, content = self.http.request(self.url + "path")
+
+        self.assertEqual(200, resp.status)
+        self.assertEqual("application/json", resp["content-type"])
+        self.assertEqual("/path", json.loads(content)["items"][0]["title"])
+
+    def test_reuses_connection(self):
+        for _ in range(5):
+            self.http.request(self.url)
+
+        self.assertEqual(1, len(self.server.peers))
+
+    def test_is_usable_from_many_threads(self):
+        with ThreadPoolExecutor(4) as executor:
+            statuses = list(
+                executor.map(lambda _: self.http.request(self.url)[0].status, range(20))
+            )
+
+        self.assertEqual([200] * 20, statuses)
+        self.assertLessEqual(len(self.server.peers), 4)
+
+    def test_works_with_api_client(self):
+        service = build(
+            "tasks",
+            "v1",
+            http=self.http,
+            static_discovery=True,
+            client_options={"api_endpoint": self.url},
+        )
+
+        response = service.tasklists().list(maxResults=100).execute()
+
+        self.assertEqual("1", response["items"][0]["id"])
+
+
+if __name__ == "__main__":
+    unittest.main()